@@ -0,0 +1,67 @@
+"""
+Measure get latency while a compaction runs in the background.
+
+Fills a store with sstables of overlapping keys, then merges them on a
+background thread while the main thread reads random keys, once without
+a rate limit, once with a fixed rate and once in auto mode with a read
+latency target. Reports the 50th and 99th percentile of get latency
+during the merge and how long the merge took.
+
+usage: python benchmark/background_io.py [entries] [bytes per second]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydynamo.storage.disk.diskstore import DiskStore  # noqa: E402
+from pydynamo.storage.disk.ratelimiter import RateLimiter  # noqa: E402
+
+
+def measure(entries: int, bytes_per_second: int) -> None:
+    print("entries: %d" % entries)
+    print("%-10s %10s %10s %10s %12s" % (
+        "limit", "p50 ms", "p99 ms", "merge s", "final rate"))
+    limiters = [("none", RateLimiter()),
+                ("fixed", RateLimiter(bytes_per_second)),
+                ("auto", RateLimiter(100 * bytes_per_second,
+                                     read_latency_slo=0.0005,
+                                     min_bytes_per_second=bytes_per_second,
+                                     tune_period=0.2))]
+    with tempfile.TemporaryDirectory() as tempdirname:
+        for name, limiter in limiters:
+            disk = DiskStore(name, tempdirname, 10 ** 9,
+                             rate_limiter=limiter)
+            disk.set_auto_compaction(False)
+            for flush in range(4):
+                for i in range(flush, entries, 2):
+                    disk.set("%016d" % i, "v" * 100)
+                disk.flush()
+            merge = threading.Thread(target=disk.merge)
+            keys = random.Random(0)
+            latencies = []
+            start = time.perf_counter()
+            merge.start()
+            while merge.is_alive():
+                key = "%016d" % keys.randrange(entries)
+                get_start = time.perf_counter()
+                disk.get(key)
+                latencies.append(time.perf_counter() - get_start)
+            elapsed = time.perf_counter() - start
+            latencies.sort()
+            print("%-10s %10.3f %10.3f %10.2f %12d" % (
+                name, latencies[len(latencies) // 2] * 1000,
+                latencies[len(latencies) * 99 // 100] * 1000, elapsed,
+                limiter.bytes_per_second))
+            disk.close()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    entries = args[0] if len(args) > 0 else 100000
+    bytes_per_second = args[1] if len(args) > 1 else 2 * 1024 * 1024
+    measure(entries, bytes_per_second)
@@ -0,0 +1,56 @@
+"""
+Compare the write amplification of the compaction strategies.
+
+Writes entries with random keys into one store per compaction strategy,
+flushing whenever the memory table is full and compacting after every
+flush, then reports the bytes written by compactions against the bytes
+written by flushes, the sstables left and the time taken.
+
+usage: python benchmark/compaction_strategies.py [entries] [value size]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydynamo.storage.disk import compaction  # noqa: E402
+from pydynamo.storage.disk.diskstore import DiskStore  # noqa: E402
+
+
+def measure(entries: int, value_size: int) -> None:
+    print("entries: %d  value size: %d" % (entries, value_size))
+    print("%-12s %12s %12s %8s %10s %10s" % (
+        "strategy", "flushed MB", "compacted MB", "amp", "sstables",
+        "seconds"))
+    strategies = [
+        compaction.LeveledCompaction(base_level_size=1024 * 1024),
+        compaction.SizeTieredCompaction()]
+    with tempfile.TemporaryDirectory() as tempdirname:
+        for strategy in strategies:
+            disk = DiskStore(strategy.NAME, tempdirname, 256 * 1024,
+                             compaction_strategy=strategy)
+            disk.set_target_file_size(256 * 1024)
+            order = random.Random(0)
+            start = time.perf_counter()
+            for _ in range(entries):
+                disk.set("%016d" % order.randrange(entries),
+                         "v" * value_size)
+            disk.close()
+            disk.compact()
+            elapsed = time.perf_counter() - start
+            stats = disk.get_stats()
+            print("%-12s %12.1f %12.1f %8.2f %10d %10.2f" % (
+                strategy.NAME, stats["flush_bytes"] / 1e6,
+                stats["compaction_bytes"] / 1e6,
+                stats["compaction_bytes"] / stats["flush_bytes"],
+                stats["sstables"], elapsed))
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    entries = args[0] if len(args) > 0 else 200000
+    value_size = args[1] if len(args) > 1 else 100
+    measure(entries, value_size)
@@ -0,0 +1,55 @@
+"""
+Measure how fast a memory table is flushed into a sstable.
+
+Fills a memory table with entries and times DiskStore.create_sstable on
+it, which serializes the records, writes the sstable file and its bloom
+filter. Reports records and megabytes of sstable written per second,
+without and with fsync of the finished files.
+
+usage: python benchmark/flush_throughput.py [entries] [key size] [value size]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydynamo.storage.disk.diskstore import DiskStore  # noqa: E402
+from pydynamo.storage.memory.inmemorystore import InMemoryStore  # noqa: E402
+
+
+def measure(entries: int, key_size: int, value_size: int) -> None:
+    order = list(range(entries))
+    random.Random(0).shuffle(order)
+    mem_table = InMemoryStore("benchmark")
+    for i in order:
+        mem_table.set(("%0" + str(key_size) + "d") % i,
+                      ("%0" + str(value_size) + "d") % i)
+    print("entries: %d  key size: %d  value size: %d"
+          % (entries, key_size, value_size))
+    print("%-8s %12s %12s %10s" % ("fsync", "records/s", "MB/s", "seconds"))
+    with tempfile.TemporaryDirectory() as tempdirname:
+        for sync in (False, True):
+            disk = DiskStore("bench" + str(sync), tempdirname, entries + 1)
+            disk.set_fsync_sstables(sync)
+            best = None
+            for _ in range(3):
+                start = time.perf_counter()
+                with disk.flush_lock:
+                    ss_table = disk.create_sstable(mem_table, {})
+                elapsed = time.perf_counter() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            print("%-8s %12.0f %12.1f %10.3f" % (
+                sync, entries / best, ss_table.size / best / 1e6, best))
+            disk.close()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    entries = args[0] if len(args) > 0 else 200000
+    key_size = args[1] if len(args) > 1 else 16
+    value_size = args[2] if len(args) > 2 else 100
+    measure(entries, key_size, value_size)
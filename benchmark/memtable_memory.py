@@ -0,0 +1,49 @@
+"""
+Measure how much memory a memory table uses per entry.
+
+The memory table keeps Python objects for every key-value set, so its
+footprint is much larger than the size of the sstable it flushes to.
+This benchmark fills an InMemoryStore and reports, per entry, the bytes
+used by the tree itself (nodes) and by the tree plus the key and value
+strings. Use it to pick a mem_size_threshold for DiskStore:
+threshold / serialized bytes per entry * total bytes per entry is the
+memory one memory table can take before it is flushed.
+
+usage: python benchmark/memtable_memory.py [entries] [key size] [value size]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydynamo.storage.memory.inmemorystore import InMemoryStore  # noqa: E402
+
+
+def measure(entries: int, key_size: int, value_size: int) -> None:
+    keys = [("%0" + str(key_size) + "d") % i for i in range(entries)]
+    values = [("%0" + str(value_size) + "d") % i for i in range(entries)]
+
+    tracemalloc.start()
+    store = InMemoryStore("benchmark")
+    for key, value in zip(keys, values):
+        store.set(key, value)
+    tree_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    string_bytes = sum(sys.getsizeof(key) + sys.getsizeof(value)
+                       for key, value in zip(keys, values))
+    print("entries:                 %d" % entries)
+    print("key size / value size:   %d / %d" % (key_size, value_size))
+    print("tree bytes per entry:    %.1f" % (tree_bytes / entries))
+    print("total bytes per entry:   %.1f"
+          % ((tree_bytes + string_bytes) / entries))
+    print("sstable bytes per entry: %.1f" % (store.get_size() / entries))
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    entries = args[0] if len(args) > 0 else 200000
+    key_size = args[1] if len(args) > 1 else 16
+    value_size = args[2] if len(args) > 2 else 64
+    measure(entries, key_size, value_size)
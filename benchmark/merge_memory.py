@@ -0,0 +1,58 @@
+"""
+Measure the peak memory and time of merging the sstables of a store.
+
+Writes entries into a store in several flushes, overwriting a part of
+the keys in each, then times DiskStore.merge with tracemalloc tracing
+the python allocations it makes. Reports the peak traced memory against
+the bytes of sstables merged, and the number of sstables written. The
+compaction strategy decides whether the merged sstables are split.
+
+usage: python benchmark/merge_memory.py [entries] [flushes] [value size]
+       [compaction strategy]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydynamo.storage.disk.diskstore import DiskStore  # noqa: E402
+
+
+def measure(entries: int, flushes: int, value_size: int,
+            strategy: str) -> None:
+    print("entries: %d  flushes: %d  value size: %d  strategy: %s"
+          % (entries, flushes, value_size, strategy))
+    with tempfile.TemporaryDirectory() as tempdirname:
+        disk = DiskStore("bench", tempdirname, 10 ** 9,
+                         compaction_strategy=strategy)
+        disk.set_auto_compaction(False)
+        per_flush = entries // flushes
+        for flush in range(flushes):
+            for i in range(flush * per_flush // 2,
+                           flush * per_flush // 2 + per_flush):
+                disk.set("%016d" % i, ("%0" + str(value_size) + "d") % i)
+            disk.flush()
+        input_size = sum(ss_table.size for ss_table in disk.ss_tables)
+        tracemalloc.start()
+        start = time.perf_counter()
+        disk.merge()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("sstables merged: %.1f MB  peak memory: %.1f MB  "
+              "sstables written: %d  seconds: %.2f"
+              % (input_size / 1e6, peak / 1e6, len(disk.ss_tables),
+                 elapsed))
+        disk.close()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    entries = args[0] if len(args) > 0 else 200000
+    flushes = args[1] if len(args) > 1 else 4
+    value_size = args[2] if len(args) > 2 else 100
+    strategy = sys.argv[4] if len(sys.argv) > 4 else "leveled"
+    measure(entries, flushes, value_size, strategy)
@@ -0,0 +1,76 @@
+"""
+Measure what key prefix compression saves on hierarchical keys.
+
+Keys like tenant:region:entity:id share long prefixes with their
+neighbours. A data block stores only the bytes of a key that differ from
+the previous key, and every restart_interval-th key in full. This
+benchmark flushes the same key set with restart interval 1, every key in
+full, and with larger intervals, and reports the sstable size, the bytes
+of data blocks a lookup reads and the time of lookups and of a full scan.
+
+usage: python benchmark/sstable_prefix.py [entries] [value size]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydynamo.storage.disk.diskstore import DiskStore  # noqa: E402
+
+
+def hierarchical_keys(entries: int):
+    keys = []
+    for i in range(entries):
+        keys.append("tenant-%03d:region-%s:entity-%s:%08d" % (
+            i % 20, ("us-east", "eu-west", "ap-south")[i % 3],
+            ("order", "invoice", "customer", "shipment")[i % 4], i))
+    return sorted(keys)
+
+
+def measure(entries: int, value_size: int) -> None:
+    keys = hierarchical_keys(entries)
+    value = "v" * value_size
+    probes = random.Random(0).sample(keys, min(entries, 20000))
+    print("entries: %d  key size: ~%d  value size: %d"
+          % (entries, len(keys[0]), value_size))
+    print("%-8s %12s %10s %12s %12s %12s" % (
+        "restart", "file bytes", "bytes/key", "block bytes",
+        "lookup us", "scan us/key"))
+    with tempfile.TemporaryDirectory() as tempdirname:
+        for restart_interval in (1, 4, 16, 64):
+            disk = DiskStore("bench" + str(restart_interval), tempdirname,
+                             entries * 2 * (len(keys[0]) + value_size))
+            disk.set_restart_interval(restart_interval)
+            for key in keys:
+                disk.set(key, value)
+            disk.flush()
+            sstable = disk.ss_tables[0]
+            reader = sstable.reader
+            block_bytes = sum(reader.block_sizes) / len(reader.block_sizes)
+
+            start = time.perf_counter()
+            for key in probes:
+                sstable.lookup(key)
+            lookup = (time.perf_counter() - start) / len(probes)
+
+            start = time.perf_counter()
+            iterator = sstable.iterator()
+            while iterator.valid():
+                iterator.next()
+                iterator.value()
+            scan = (time.perf_counter() - start) / entries
+
+            print("%-8d %12d %10.1f %12.0f %12.1f %12.2f" % (
+                restart_interval, sstable.size, sstable.size / entries,
+                block_bytes, lookup * 1e6, scan * 1e6))
+            disk.close()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    entries = args[0] if len(args) > 0 else 100000
+    value_size = args[1] if len(args) > 1 else 32
+    measure(entries, value_size)
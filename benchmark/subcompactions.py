@@ -0,0 +1,65 @@
+"""
+Measure the time of merging the sstables of a store with subcompactions.
+
+Writes entries into a store in several flushes, overwriting a part of
+the keys in each, then times DiskStore.merge with 1, 2, 4 and 8
+subcompactions, on a copy of the same sstables each time. The time of
+the first merge with worker processes includes starting them. Reports
+the seconds and the speedup against one subcompaction, with the number
+of cores.
+
+usage: python benchmark/subcompactions.py [entries] [flushes] [value size]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydynamo.storage.disk.diskstore import DiskStore  # noqa: E402
+
+
+def measure(entries: int, flushes: int, value_size: int) -> None:
+    print("entries: %d  flushes: %d  value size: %d  cores: %d"
+          % (entries, flushes, value_size, os.cpu_count() or 1))
+    with tempfile.TemporaryDirectory() as tempdirname:
+        source = os.path.join(tempdirname, "source")
+        os.mkdir(source)
+        disk = DiskStore("bench", source, 10 ** 9)
+        disk.set_auto_compaction(False)
+        per_flush = entries // flushes
+        for flush in range(flushes):
+            for i in range(flush * per_flush // 2,
+                           flush * per_flush // 2 + per_flush):
+                disk.set("%016d" % i, ("%0" + str(value_size) + "d") % i)
+            disk.flush()
+        input_size = sum(ss_table.size for ss_table in disk.ss_tables)
+        disk.close()
+        print("sstables merged: %.1f MB" % (input_size / 1e6))
+        print("%-16s %10s %10s %10s" % ("subcompactions", "seconds",
+                                        "speedup", "sstables"))
+        base = 0.0
+        for max_subcompactions in (1, 2, 4, 8):
+            copy = os.path.join(tempdirname, str(max_subcompactions))
+            shutil.copytree(source, copy)
+            disk = DiskStore("bench", copy, 10 ** 9)
+            disk.set_auto_compaction(False)
+            disk.set_max_subcompactions(max_subcompactions)
+            start = time.perf_counter()
+            disk.merge()
+            elapsed = time.perf_counter() - start
+            base = base or elapsed
+            print("%-16d %10.2f %10.2f %10d" % (
+                max_subcompactions, elapsed, base / elapsed,
+                len(disk.ss_tables)))
+            disk.close()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    entries = args[0] if len(args) > 0 else 200000
+    flushes = args[1] if len(args) > 1 else 4
+    value_size = args[2] if len(args) > 2 else 100
+    measure(entries, flushes, value_size)
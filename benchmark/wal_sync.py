@@ -0,0 +1,52 @@
+"""
+Measure write throughput of a store for each write-ahead log sync mode.
+
+Several threads set keys concurrently into one DiskStore whose mem_table
+never fills up, so only the log is written. Reports writes per second and
+the number of fsync calls made on the log: "always" syncs once per write,
+"group" lets the writers that appended while a sync was running share the
+next one.
+
+usage: python benchmark/wal_sync.py [writes per thread] [threads]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydynamo.storage.disk.diskstore import DiskStore  # noqa: E402
+
+
+def measure(writes: int, threads: int) -> None:
+    print("writes per thread: %d  threads: %d" % (writes, threads))
+    print("%-8s %12s %10s %10s" % ("mode", "writes/s", "fsyncs", "seconds"))
+    with tempfile.TemporaryDirectory() as tempdirname:
+        for mode in ("off", "none", "always", "group"):
+            disk = DiskStore("bench" + mode, tempdirname, 10 ** 9,
+                             wal_sync_mode=mode)
+
+            def write(thread: int) -> None:
+                for i in range(writes):
+                    disk.set("%08d%04d" % (i, thread), "%0100d" % i)
+            workers = [threading.Thread(target=write, args=(thread,))
+                       for thread in range(threads)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            fsyncs = disk.wal.sync_count if disk.wal is not None else 0
+            print("%-8s %12.0f %10d %10.3f" % (
+                mode, writes * threads / elapsed, fsyncs, elapsed))
+            disk.close()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    writes = args[0] if len(args) > 0 else 1000
+    threads = args[1] if len(args) > 1 else 8
+    measure(writes, threads)
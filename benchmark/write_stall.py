@@ -0,0 +1,66 @@
+"""
+Measure write latency and sstable count under sustained writes.
+
+Writes random keys into a store with a small memory table, so flushes
+outrun compaction, once with write stall limits and once with limits
+too high to be reached. Reports the 99th percentile and largest write
+latency, the largest number of unmerged sstables seen, the stall
+counters and the 99th percentile latency of gets right after the writes.
+
+usage: python benchmark/write_stall.py [entries] [soft limit] [hard limit]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydynamo.storage.disk.diskstore import DiskStore  # noqa: E402
+
+
+def measure(entries: int, soft: int, hard: int) -> None:
+    print("entries: %d" % entries)
+    print("%-12s %10s %10s %10s %10s %10s %10s %10s" % (
+        "limits", "p99 ms", "max ms", "sstables", "slowdowns", "stops",
+        "seconds", "get p99 ms"))
+    with tempfile.TemporaryDirectory() as tempdirname:
+        for soft_limit, hard_limit in ((soft, hard), (10 ** 6, 10 ** 6 + 1)):
+            disk = DiskStore("bench" + str(soft_limit), tempdirname,
+                             64 * 1024)
+            disk.set_write_stall_limits(soft_limit, hard_limit)
+            keys = random.Random(0)
+            latencies = []
+            most = 0
+            start = time.perf_counter()
+            for i in range(entries):
+                write_start = time.perf_counter()
+                disk.set("%016d" % keys.randrange(entries), "v" * 100)
+                latencies.append(time.perf_counter() - write_start)
+                if i % 100 == 0:
+                    most = max(most, disk.compaction_strategy
+                               .unmerged_sstables(disk.ss_tables))
+            elapsed = time.perf_counter() - start
+            stats = disk.get_stats()["write_stall"]
+            get_latencies = []
+            for _ in range(2000):
+                get_start = time.perf_counter()
+                disk.get("%016d" % keys.randrange(entries))
+                get_latencies.append(time.perf_counter() - get_start)
+            disk.close()
+            latencies.sort()
+            get_latencies.sort()
+            print("%-12s %10.3f %10.1f %10d %10d %10d %10.2f %10.3f" % (
+                "%d/%d" % (soft_limit, hard_limit) if soft_limit < 10 ** 6
+                else "none", latencies[len(latencies) * 99 // 100] * 1000,
+                latencies[-1] * 1000, most, stats["slowdowns"],
+                stats["stops"], elapsed, get_latencies[1980] * 1000))
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    entries = args[0] if len(args) > 0 else 200000
+    soft = args[1] if len(args) > 1 else 8
+    hard = args[2] if len(args) > 2 else 16
+    measure(entries, soft, hard)
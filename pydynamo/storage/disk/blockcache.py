@@ -0,0 +1,100 @@
+from ..error import StorageException
+from ..error import ErrorType
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+import threading
+
+
+class BlockCache(object):
+    """
+    A least recently used cache of decoded sstable blocks, bounded by the
+    bytes the blocks take in memory. One cache can be shared by all
+    sstables of a store or by all stores of an engine: every sstable gets
+    its own cache id from new_id(), so entries are keyed by
+    (cache id, block offset) and ids of different stores do not collide.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        """
+        :param capacity: bytes the cached blocks may use together,
+        0 caches nothing
+        """
+        if capacity < 0:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "The capacity should be at least 0.")
+        self.capacity = capacity
+        self.usage = 0
+        self.hits = 0
+        self.misses = 0
+        # (cache id, offset) -> (block, charge), least recently used first
+        self.entries: "OrderedDict[Tuple[int, int], Tuple[Any, int]]" = \
+            OrderedDict()
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def new_id(self) -> int:
+        """
+        :return: a cache id no other sstable of this cache uses
+        """
+        with self.lock:
+            self.next_id += 1
+            return self.next_id
+
+    def get(self, cache_id: int, offset: int) -> Any:
+        """
+        :param cache_id: cache id of a sstable
+        :param offset: offset of a block in the sstable file
+        :return: the cached block, None if it is not cached
+        """
+        with self.lock:
+            entry = self.entries.get((cache_id, offset))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end((cache_id, offset))
+            return entry[0]
+
+    def put(self, cache_id: int, offset: int, block: Any,
+            charge: int) -> None:
+        """
+        cache block and evict the least recently used blocks until the
+        usage is within capacity. a block larger than the capacity is
+        not cached
+        :param cache_id: cache id of a sstable
+        :param offset: offset of the block in the sstable file
+        :param block: the decoded block
+        :param charge: bytes the decoded block uses
+        :return: None
+        """
+        if charge > self.capacity:
+            return
+        with self.lock:
+            old = self.entries.pop((cache_id, offset), None)
+            if old is not None:
+                self.usage -= old[1]
+            self.entries[(cache_id, offset)] = (block, charge)
+            self.usage += charge
+            while self.usage > self.capacity:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.usage -= evicted
+
+    def erase(self, cache_id: int) -> None:
+        """
+        drop all blocks of a sstable, called when the sstable is deleted
+        :param cache_id: cache id of the sstable
+        :return: None
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == cache_id]:
+                self.usage -= self.entries.pop(key)[1]
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        :return: hits, misses, number of cached blocks, usage and
+        capacity in bytes
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self.entries), "usage": self.usage,
+                    "capacity": self.capacity}
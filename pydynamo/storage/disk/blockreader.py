@@ -0,0 +1,476 @@
+from ..error import StorageException
+from ..error import ErrorType
+from .sstablereader import SSTableReader
+from .blockcache import BlockCache
+from bisect import bisect_left, bisect_right
+from struct import calcsize, unpack_from
+from typing import Any, Callable, Dict, List, Tuple, Union
+import bz2
+import lzma
+import os
+import sys
+import zlib
+
+
+def encode_varint(value: int) -> bytes:
+    """
+    :param value: a non negative integer
+    :return: value in 7 bits per byte, the high bit marks that more
+    bytes follow. values below 128 take one byte
+    """
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(buffer: memoryview, pos: int) -> Tuple[int, int]:
+    """
+    :param buffer: buffer holding a varint
+    :param pos: offset of the varint in buffer
+    :return: tuple (value, offset after the varint)
+    """
+    byte = buffer[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    value = byte & 0x7f
+    shift = 7
+    pos += 1
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class DecodedBlock(object):
+    """
+    The records of a data block, decoded once and kept in the block
+    cache. records are tuples (removed, key, value, timestamp, offset of
+    the next record in the block), keys and offsets can be binary searched
+    """
+    __slots__ = ("keys", "offsets", "records", "charge")
+    # approximate bytes of python objects a record takes besides the bytes
+    # of its key and value: the record tuple, two string headers and the
+    # list slots
+    RECORD_MEMORY = sys.getsizeof((False, "", "", 0, 0)) + \
+        2 * sys.getsizeof("") + 3 * 8
+
+    def __init__(self) -> None:
+        self.keys: List[str] = []
+        self.offsets: List[int] = []
+        self.records: List[Tuple[bool, str, Union[str, None], int, int]] = []
+        self.charge = 0
+
+    def add(self, offset: int,
+            record: Tuple[bool, str, Union[str, None], int, int]) -> None:
+        self.keys.append(record[1])
+        self.offsets.append(offset)
+        self.records.append(record)
+        self.charge += self.RECORD_MEMORY + len(record[1]) + \
+            (0 if record[2] is None else len(record[2]))
+
+
+class BlockSSTableReader(object):
+    """
+    Read-only access to a v2 sstable file through a memory map.
+    Records are grouped in data blocks and the block index at the end of
+    the file keeps the last key of every block, so a lookup binary
+    searches the block index, which is loaded once, and reads exactly one
+    data block. see doc/table_format.md.
+    Records are addressed by logical offsets: the offset of a record in
+    the concatenation of the records of all data blocks. the iterator
+    moves over them as it moves over the offsets of a v1 sstable file.
+    With a block cache a data block is decoded as a whole the first time
+    it is read and lookups binary search the cached keys, without one
+    every read decodes the records it needs from the block.
+    """
+    INT_SIZE = 4
+    MAGIC = b"pydynSST"
+    VERSION = 2
+    # index offset, index size, block format, version, magic
+    FOOTER_FORMAT = "qiii8s"
+    FOOTER_SIZE = calcsize(FOOTER_FORMAT)
+    # block offset, block size, size of records in the block
+    INDEX_ENTRY_FORMAT = "qii"
+    INDEX_ENTRY_SIZE = calcsize(INDEX_ENTRY_FORMAT)
+    # every block is followed by one byte of block type,
+    # the codec the block is compressed with
+    BLOCK_TRAILER_SIZE = 1
+    RAW_BLOCK = 0
+    ZLIB_BLOCK = 1
+    LZMA_BLOCK = 2
+    BZ2_BLOCK = 3
+    # codec names a store can be created with
+    COMPRESSION_TYPES = {"none": RAW_BLOCK, "zlib": ZLIB_BLOCK,
+                         "lzma": LZMA_BLOCK, "bz2": BZ2_BLOCK}
+    COMPRESS: Dict[int, Callable[[Any], bytes]] = {
+        ZLIB_BLOCK: zlib.compress, LZMA_BLOCK: lzma.compress,
+        BZ2_BLOCK: bz2.compress}
+    DECOMPRESS: Dict[int, Callable[[Any], bytes]] = {
+        ZLIB_BLOCK: zlib.decompress, LZMA_BLOCK: lzma.decompress,
+        BZ2_BLOCK: bz2.decompress}
+    # records are stored one after another, keys in full
+    PLAIN_RECORDS = 0
+    # keys share their prefix with the previous key, restart points
+    # store a key in full and are listed at the end of the block
+    PREFIX_RECORDS = 1
+    TIMESTAMP_SIZE = 8
+
+    def __init__(self, store_name: str, id: int, path: str,
+                 block_cache: Union[BlockCache, None] = None) -> None:
+        """
+        :param store_name: the name of store the sstable belongs to
+        :param id: the id of the sstable
+        :param path: the path the sstable file stores in
+        :param block_cache: cache of decoded data blocks, shared with
+        other sstables
+        """
+        self.sstable_map = SSTableReader._map(self.file_path(
+            store_name, id, path))
+        self.sstable_view = memoryview(self.sstable_map)
+        index_offset, index_size, self.block_format, version, _ = \
+            unpack_from(self.FOOTER_FORMAT, self.sstable_map,
+                        len(self.sstable_map) - self.FOOTER_SIZE)
+        if version != self.VERSION or self.block_format not in (
+                self.PLAIN_RECORDS, self.PREFIX_RECORDS):
+            raise StorageException(ErrorType.IO_ERROR,
+                                   "Unsupported sstable format.")
+        self.last_keys: List[str] = []
+        self.block_offsets: List[int] = []
+        self.block_sizes: List[int] = []
+        self.block_starts: List[int] = []
+        self.data_size = 0
+        # the last decompressed data block as (block number, content), so
+        # the records of a compressed block are decoded from one
+        # decompression while an iterator walks through them
+        self.last_block: Tuple[int, memoryview] = (-1, memoryview(b""))
+        if block_cache is not None and block_cache.capacity == 0:
+            block_cache = None
+        self.block_cache = block_cache
+        self.cache_id = 0 if block_cache is None else block_cache.new_id()
+        # the last decoded block that was too large for the block cache
+        self.last_decoded: Tuple[int, Union[DecodedBlock, None]] = (-1, None)
+        self._load_block_index(index_offset, index_size)
+
+    @staticmethod
+    def file_path(store_name: str, id: int, path: str) -> str:
+        return os.path.join(path, "sstable", store_name + str(id) + ".ss")
+
+    @classmethod
+    def is_block_file(cls, file_path: str) -> bool:
+        """
+        :param file_path: path of a sstable file
+        :return: True if the file ends with the footer of a v2 sstable.
+        a v1 file ends with an 8 byte timestamp, which is never the magic
+        """
+        with open(file_path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < cls.FOOTER_SIZE:
+                return False
+            file.seek(size - len(cls.MAGIC))
+            return file.read(len(cls.MAGIC)) == cls.MAGIC
+
+    def _load_block_index(self, index_offset: int, index_size: int) -> None:
+        """
+        parse the block index into lists that can be binary searched
+        index entry: key_size(4 byte) + last key of the block +
+        block offset(8 byte) + block size(4 byte) + record size(4 byte)
+        """
+        index = self._read_block(index_offset, index_size)
+        pos = 0
+        while pos < index_size:
+            key_size = unpack_from("i", index, pos)[0]
+            pos += self.INT_SIZE
+            self.last_keys.append(str(index[pos:pos + key_size], "utf-8"))
+            pos += key_size
+            offset, size, data_size = unpack_from(self.INDEX_ENTRY_FORMAT,
+                                                  index, pos)
+            pos += self.INDEX_ENTRY_SIZE
+            self.block_offsets.append(offset)
+            self.block_sizes.append(size)
+            self.block_starts.append(self.data_size)
+            self.data_size += data_size
+
+    def _read_block(self, offset: int, size: int) -> memoryview:
+        """
+        :param offset: offset of a block in sstable file
+        :param size: size of the block without its trailer
+        :return: the content of the block, decompressed with the codec
+        named by its block type
+        """
+        block_type = self.sstable_map[offset + size]
+        if block_type == self.RAW_BLOCK:
+            return self.sstable_view[offset:offset + size]
+        if block_type not in self.DECOMPRESS:
+            raise StorageException(ErrorType.IO_ERROR,
+                                   "Unsupported block type.")
+        return memoryview(self.DECOMPRESS[block_type](
+            self.sstable_view[offset:offset + size]))
+
+    def _block(self, block_no: int) -> memoryview:
+        """
+        :param block_no: number of a data block
+        :return: the content of the data block. a raw block is a slice of
+        the memory map, a compressed block is decompressed once for all
+        reads of it in a row
+        """
+        offset = self.block_offsets[block_no]
+        size = self.block_sizes[block_no]
+        if self.sstable_map[offset + size] == self.RAW_BLOCK:
+            return self.sstable_view[offset:offset + size]
+        last_block = self.last_block
+        if last_block[0] == block_no:
+            return last_block[1]
+        block = self._read_block(offset, size)
+        self.last_block = (block_no, block)
+        return block
+
+    def _data_size(self, block_no: int) -> int:
+        """
+        :return: size of the records in data block block_no
+        """
+        if block_no + 1 < len(self.block_starts):
+            return self.block_starts[block_no + 1] - \
+                self.block_starts[block_no]
+        return self.data_size - self.block_starts[block_no]
+
+    def _decoded_block(self, block_no: int,
+                       block_cache: BlockCache) -> DecodedBlock:
+        """
+        :param block_no: number of a data block
+        :param block_cache: the block cache of this sstable
+        :return: the decoded records of the block from the block cache,
+        decoded and cached on a miss
+        """
+        offset = self.block_offsets[block_no]
+        decoded = block_cache.get(self.cache_id, offset)
+        if decoded is None:
+            last_decoded = self.last_decoded
+            if last_decoded[0] == block_no and last_decoded[1] is not None:
+                return last_decoded[1]
+            decoded = DecodedBlock()
+            block = self._block(block_no)
+            data_size = self._data_size(block_no)
+            pos = 0
+            prev_key = b""
+            while pos < data_size:
+                if self.block_format == self.PLAIN_RECORDS:
+                    record = SSTableReader.decode_record(block, pos)
+                else:
+                    indicator, prev_key, value_pos, val_size, end = \
+                        self._parse_record(block, pos, prev_key)
+                    record = self._record(block, indicator, prev_key,
+                                          value_pos, val_size, end, 0)
+                decoded.add(pos, record)
+                pos = record[4]
+            if decoded.charge > block_cache.capacity:
+                self.last_decoded = (block_no, decoded)
+            else:
+                block_cache.put(self.cache_id, offset, decoded,
+                                decoded.charge)
+        return decoded
+
+    def evict(self) -> None:
+        """
+        drop the blocks of this sstable from the block cache and stop
+        caching them, iterators still reading the sstable decode its
+        blocks without the cache
+        :return: None
+        """
+        block_cache = self.block_cache
+        self.block_cache = None
+        if block_cache is not None:
+            block_cache.erase(self.cache_id)
+
+    def read_record(self, offset: int, prev_key: str = "",
+                    fill_cache: bool = True) \
+            -> Tuple[bool, str, Union[str, None], int, int]:
+        """
+        :param offset: logical offset of a record
+        :param prev_key: the key of the record before offset, a key that
+        is not at a restart point shares its prefix with it
+        :param fill_cache: False decodes the record without the block
+        cache, for scans that would only push out the blocks of reads
+        :return: tuple (removed, key, value, timestamp, logical offset of
+        the next record), value is None for a removed key
+        """
+        block_no = bisect_right(self.block_starts, offset) - 1
+        start = self.block_starts[block_no]
+        block_cache = self.block_cache
+        if block_cache is not None and fill_cache:
+            decoded = self._decoded_block(block_no, block_cache)
+            removed, key, value, time_stamp, end = decoded.records[
+                bisect_left(decoded.offsets, offset - start)]
+            return removed, key, value, time_stamp, start + end
+        block = self._block(block_no)
+        if self.block_format == self.PLAIN_RECORDS:
+            removed, key, value, time_stamp, end = \
+                SSTableReader.decode_record(block, offset - start)
+            return removed, key, value, time_stamp, start + end
+        indicator, bin_key, value_pos, val_size, end = self._parse_record(
+            block, offset - start, prev_key.encode())
+        return self._record(block, indicator, bin_key, value_pos, val_size,
+                            end, start)
+
+    def _parse_record(self, block: memoryview, pos: int,
+                      prev_key: bytes) -> Tuple[int, bytes, int, int, int]:
+        """
+        record of a prefix block:
+        indicator(1 byte) + shared key size(varint) +
+        unshared key size(varint) + value size(varint, live keys only) +
+        unshared key bytes + value + timestamp(8 byte)
+        :return: tuple (indicator, key, offset of value, value size,
+        offset of the next record) of the record at pos of block
+        """
+        indicator = block[pos]
+        shared, pos = decode_varint(block, pos + 1)
+        unshared, pos = decode_varint(block, pos)
+        val_size = 0
+        if indicator == 1:
+            val_size, pos = decode_varint(block, pos)
+        bin_key = prev_key[:shared] + bytes(block[pos:pos + unshared])
+        pos += unshared
+        return indicator, bin_key, pos, val_size, \
+            pos + val_size + self.TIMESTAMP_SIZE
+
+    def _record(self, block: memoryview, indicator: int, bin_key: bytes,
+                value_pos: int, val_size: int, end: int, start: int) \
+            -> Tuple[bool, str, Union[str, None], int, int]:
+        """
+        :return: the record parsed by _parse_record as tuple (removed, key,
+        value, timestamp, logical offset of the next record)
+        """
+        value = None
+        if indicator == 1:
+            value = str(block[value_pos:value_pos + val_size], "utf-8")
+        time_stamp = unpack_from("q", block, end - self.TIMESTAMP_SIZE)[0]
+        return indicator == 0, str(bin_key, "utf-8"), value, time_stamp, \
+            start + end
+
+    def seek(self, key: str) -> Union[
+            Tuple[int, Tuple[bool, str, Union[str, None], int, int]], None]:
+        """
+        :param key: the key user intends to find in sstable
+        :return: logical offset and decoded record of key,
+        None if key is not in sstable
+        """
+        return self._search(key, True)
+
+    def lower_bound(self, key: str) -> Union[
+            Tuple[int, Tuple[bool, str, Union[str, None], int, int]], None]:
+        """
+        :param key: a key, not necessarily in sstable
+        :return: logical offset and decoded record of the first key that
+        is not less than key, None if every key is less than key
+        """
+        return self._search(key, False)
+
+    def _search(self, key: str, exact: bool) -> Union[
+            Tuple[int, Tuple[bool, str, Union[str, None], int, int]], None]:
+        """
+        find the block that may hold key from the block index, then the
+        first record of the block whose key is not less than key
+        :param exact: only return a record of key itself
+        """
+        block_no = bisect_left(self.last_keys, key)
+        if block_no == len(self.last_keys):
+            return None
+        start = self.block_starts[block_no]
+        block_cache = self.block_cache
+        if block_cache is not None:
+            decoded = self._decoded_block(block_no, block_cache)
+            i = bisect_left(decoded.keys, key)
+            if i == len(decoded.keys) or \
+                    (exact and decoded.keys[i] != key):
+                return None
+            removed, key, value, time_stamp, end = decoded.records[i]
+            return start + decoded.offsets[i], (removed, key, value,
+                                                time_stamp, start + end)
+        block = self._block(block_no)
+        if self.block_format == self.PLAIN_RECORDS:
+            return self._seek_plain(block, key, start,
+                                    self._data_size(block_no), exact)
+        return self._seek_prefix(block, key, start,
+                                 self._data_size(block_no), exact)
+
+    def _seek_plain(self, block: memoryview, key: str, start: int,
+                    data_size: int, exact: bool) -> Union[
+            Tuple[int, Tuple[bool, str, Union[str, None], int, int]], None]:
+        """
+        scan the records of a plain block for key, or for the first key
+        not less than key if not exact
+        """
+        bin_key = key.encode()
+        pos = 0
+        while pos < data_size:
+            indicator, key_size = unpack_from("ii", block, pos)
+            key_start = pos + 2 * self.INT_SIZE
+            if block[key_start:key_start + key_size] == bin_key or \
+                    (not exact and
+                     bytes(block[key_start:key_start + key_size]) > bin_key):
+                removed, key, value, time_stamp, next_pos = \
+                    SSTableReader.decode_record(block, pos)
+                return start + pos, (removed, key, value, time_stamp,
+                                     start + next_pos)
+            pos = key_start + key_size
+            if indicator == 1:
+                pos += self.INT_SIZE + unpack_from("i", block, pos)[0]
+            pos += self.TIMESTAMP_SIZE
+        return None
+
+    def _seek_prefix(self, block: memoryview, key: str, start: int,
+                     data_size: int, exact: bool) -> Union[
+            Tuple[int, Tuple[bool, str, Union[str, None], int, int]], None]:
+        """
+        binary search the restart points of a prefix block for the last
+        one whose key is not greater than key, then scan from there for
+        key, or for the first key not less than key if not exact
+        """
+        bin_key = key.encode()
+        num_restarts = unpack_from("i", block, len(block) - self.INT_SIZE)[0]
+        restarts = unpack_from(str(num_restarts) + "i", block,
+                               len(block) - self.INT_SIZE * (num_restarts + 1))
+        left = 0
+        right = num_restarts - 1
+        while left < right:
+            mid = (left + right + 1) // 2
+            if self._parse_record(block, restarts[mid], b"")[1] <= bin_key:
+                left = mid
+            else:
+                right = mid - 1
+        pos = restarts[left]
+        prev_key = b""
+        while pos < data_size:
+            indicator, prev_key, value_pos, val_size, next_pos = \
+                self._parse_record(block, pos, prev_key)
+            if prev_key == bin_key or (not exact and prev_key > bin_key):
+                return start + pos, self._record(
+                    block, indicator, prev_key, value_pos, val_size,
+                    next_pos, start)
+            if prev_key > bin_key:
+                return None
+            pos = next_pos
+        return None
+
+    def find(self, key: str) -> Union[int, None]:
+        """
+        :param key: the key user intends to find in sstable
+        :return: logical offset of the record of key,
+        None if key is not in sstable
+        """
+        found = self.seek(key)
+        return None if found is None else found[0]
+
+    def key_range(self) -> Union[Tuple[str, str], None]:
+        """
+        :return: tuple (smallest key, largest key) of the sstable, None
+        if it has no records
+        """
+        if self.data_size == 0:
+            return None
+        return self.read_record(0)[1], self.last_keys[-1]
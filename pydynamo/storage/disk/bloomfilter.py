@@ -0,0 +1,75 @@
+from struct import pack, unpack_from
+from hashlib import blake2b
+from typing import Tuple
+
+
+class BloomFilter(object):
+    """
+    A bloom filter over the keys of one sstable. might_contain() never
+    answers False for a key that was added, and answers True for a key
+    that was not added with a probability that falls with bits_per_key
+    (about 1% at 10 bits per key).
+    Serialized format:
+    [probes] (4 bytes): number of bits set per key
+    [bits  ] (4 bytes): number of bits in the filter
+    [array ] (bits / 8 bytes, rounded up): the bit array
+    """
+    HEADER_SIZE = 8
+
+    def __init__(self, num_probes: int, num_bits: int,
+                 bit_array: bytearray) -> None:
+        self.num_probes = num_probes
+        self.num_bits = num_bits
+        self.bit_array = bit_array
+
+    @classmethod
+    def create(cls, bits_per_key: int, num_keys: int) -> "BloomFilter":
+        """
+        :param bits_per_key: bits of the filter for every key
+        :param num_keys: the number of keys that will be added
+        :return: an empty bloom filter sized for num_keys keys
+        """
+        # ln(2) * bits_per_key probes give the lowest false positive rate
+        num_probes = min(max(int(bits_per_key * 0.69), 1), 30)
+        num_bits = max(num_keys * bits_per_key, 64)
+        return cls(num_probes, num_bits, bytearray((num_bits + 7) // 8))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        num_probes, num_bits = unpack_from("ii", data, 0)
+        return cls(num_probes, num_bits,
+                   bytearray(data[cls.HEADER_SIZE:]))
+
+    def to_bytes(self) -> bytes:
+        return pack("ii", self.num_probes, self.num_bits) + \
+            bytes(self.bit_array)
+
+    def add(self, key: str) -> None:
+        h, delta = self._hash(key)
+        for _ in range(self.num_probes):
+            bit = h % self.num_bits
+            self.bit_array[bit >> 3] |= 1 << (bit & 7)
+            h += delta
+
+    def might_contain(self, key: str) -> bool:
+        """
+        :param key: the key to check
+        :return: False if key was never added, otherwise True
+        """
+        h, delta = self._hash(key)
+        for _ in range(self.num_probes):
+            bit = h % self.num_bits
+            if not self.bit_array[bit >> 3] & (1 << (bit & 7)):
+                return False
+            h += delta
+        return True
+
+    @staticmethod
+    def _hash(key: str) -> Tuple[int, int]:
+        """
+        double hashing: probe i is h1 + i * h2, so one digest
+        gives all probes of a key
+        """
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = unpack_from("QQ", digest, 0)
+        return h1, h2 | 1
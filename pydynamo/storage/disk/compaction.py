@@ -0,0 +1,298 @@
+from ..error import StorageException
+from ..error import ErrorType
+from .sstable import SSTable
+from abc import ABC
+from abc import abstractmethod
+from typing import Any, Dict, List, Union
+
+
+class Compaction(object):
+    """
+    A compaction picked by a strategy: the sstables to merge and the
+    level the merged sstables go to.
+    """
+
+    def __init__(self, inputs: List[SSTable], output_level: int) -> None:
+        """
+        :param inputs: the sstables to merge
+        :param output_level: the level of the merged sstables
+        """
+        self.inputs = inputs
+        self.output_level = output_level
+
+    def is_trivial_move(self) -> bool:
+        """
+        :return: True if the compaction only moves one sstable to the
+        output level. no sstable of the output level overlaps it, so it
+        is not rewritten
+        """
+        return len(self.inputs) == 1 and \
+            self.inputs[0].level < self.output_level
+
+
+class CompactionStrategy(ABC):
+    """
+    Decides which sstables of a store are merged next. The store calls
+    pick after every flush and compacts until it returns None.
+    SPLIT_OUTPUTS: the store splits the merged sstables at its
+    target_file_size, otherwise a compaction writes one sstable.
+    """
+    NAME = ""
+    SPLIT_OUTPUTS = True
+
+    @abstractmethod
+    def pick(self, ss_tables: List[SSTable]) -> Union[Compaction, None]:
+        """
+        :param ss_tables: the sstables of a store, in the order the store
+        searches them from the back, oldest first
+        :return: the next compaction, None if none is needed
+        """
+        pass
+
+    def get_stats(self, ss_tables: List[SSTable]) -> Dict[str, Any]:
+        """
+        :param ss_tables: the sstables of a store
+        :return: what the strategy sees in ss_tables, reported in the
+        stats of the store
+        """
+        return {}
+
+    def unmerged_sstables(self, ss_tables: List[SSTable]) -> int:
+        """
+        :param ss_tables: the sstables of a store
+        :return: the number of sstables whose keys may overlap, which a
+        get may have to search. writes stall when it grows too large
+        """
+        return len(ss_tables)
+
+
+class LeveledCompaction(CompactionStrategy):
+    """
+    Leveled compaction as in LevelDB. Flushed sstables go to level 0,
+    where their keys overlap. Every other level holds sstables with
+    disjoint key ranges and may grow to base_level_size bytes for level 1
+    and size_ratio times the size of the level above for deeper levels.
+    A level gets a score: the number of level 0 sstables against
+    level0_trigger, the bytes of a deeper level against its size limit.
+    The level with the highest score of at least 1 is compacted into the
+    next level: all of level 0, or one sstable of a deeper level picked
+    round robin by key, merged with the sstables of the next level its
+    keys overlap. A get reads at most the level 0 sstables and one
+    sstable per deeper level.
+    """
+    NAME = "leveled"
+
+    def __init__(self, level0_trigger: int = 4,
+                 base_level_size: int = 10 * 1024 * 1024,
+                 size_ratio: int = 10, max_levels: int = 7) -> None:
+        """
+        :param level0_trigger: number of level 0 sstables that starts a
+        compaction into level 1
+        :param base_level_size: bytes of sstables level 1 may hold
+        :param size_ratio: how many times a level may be larger than the
+        level above it
+        :param max_levels: number of levels, the last level is not
+        compacted further
+        """
+        if level0_trigger < 1 or base_level_size < 1 or size_ratio < 2 \
+                or max_levels < 2:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid.")
+        self.level0_trigger = level0_trigger
+        self.base_level_size = base_level_size
+        self.size_ratio = size_ratio
+        self.max_levels = max_levels
+        # level -> largest key of the last sstable compacted out of it
+        self.compact_pointers: Dict[int, str] = {}
+
+    def max_level_size(self, level: int) -> int:
+        """
+        :param level: a level from 1
+        :return: bytes of sstables the level may hold
+        """
+        return self.base_level_size * self.size_ratio ** (level - 1)
+
+    def levels(self, ss_tables: List[SSTable]) -> List[List[SSTable]]:
+        """
+        :param ss_tables: the sstables of a store
+        :return: the sstables of every level, level 0 oldest first
+        """
+        levels: List[List[SSTable]] = [[] for _ in range(self.max_levels)]
+        for ss_table in ss_tables:
+            levels[min(ss_table.level, self.max_levels - 1)].append(
+                ss_table)
+        return levels
+
+    def scores(self, ss_tables: List[SSTable]) -> List[float]:
+        """
+        :param ss_tables: the sstables of a store
+        :return: the score of every level but the last, a level with a
+        score of at least 1 needs a compaction
+        """
+        levels = self.levels(ss_tables)
+        scores = [len(levels[0]) / self.level0_trigger]
+        for level in range(1, self.max_levels - 1):
+            scores.append(sum(ss_table.size for ss_table in levels[level]) /
+                          self.max_level_size(level))
+        return scores
+
+    def pick(self, ss_tables: List[SSTable]) -> Union[Compaction, None]:
+        """
+        :param ss_tables: the sstables of a store, in the order the store
+        searches them from the back: deeper levels first, level 0 oldest
+        first
+        :return: the next compaction, None if no level needs one
+        """
+        scores = self.scores(ss_tables)
+        level = max(range(len(scores)), key=lambda i: scores[i])
+        if scores[level] < 1:
+            return None
+        levels = self.levels(ss_tables)
+        if level == 0:
+            inputs = list(levels[0])
+        else:
+            candidates = sorted(
+                levels[level],
+                key=lambda ss_table: self._smallest_key(ss_table))
+            pointer = self.compact_pointers.get(level)
+            picked = candidates[0]
+            for ss_table in candidates:
+                key_range = ss_table.key_range()
+                if pointer is None or \
+                        (key_range is not None and key_range[1] > pointer):
+                    picked = ss_table
+                    break
+            inputs = [picked]
+            key_range = picked.key_range()
+            if key_range is not None:
+                self.compact_pointers[level] = key_range[1]
+        key_ranges = [ss_table.key_range() for ss_table in inputs]
+        bounds = [key_range for key_range in key_ranges
+                  if key_range is not None]
+        if bounds:
+            smallest = min(key_range[0] for key_range in bounds)
+            largest = max(key_range[1] for key_range in bounds)
+            inputs += [ss_table for ss_table in levels[level + 1]
+                       if ss_table.overlaps(smallest, largest)]
+        return Compaction(inputs, level + 1)
+
+    def unmerged_sstables(self, ss_tables: List[SSTable]) -> int:
+        """
+        :return: the number of level 0 sstables, deeper levels add one
+        sstable each to a get
+        """
+        return sum(1 for ss_table in ss_tables if ss_table.level == 0)
+
+    def get_stats(self, ss_tables: List[SSTable]) -> Dict[str, Any]:
+        """
+        :return: the number of sstables and bytes of every level and the
+        score of every level but the last
+        """
+        levels = self.levels(ss_tables)
+        return {"level_sstables": [len(level) for level in levels],
+                "level_bytes": [sum(ss_table.size for ss_table in level)
+                                for level in levels],
+                "scores": self.scores(ss_tables)}
+
+    @staticmethod
+    def _smallest_key(ss_table: SSTable) -> str:
+        key_range = ss_table.key_range()
+        return "" if key_range is None else key_range[0]
+
+
+class SizeTieredCompaction(CompactionStrategy):
+    """
+    Size-tiered compaction as in Cassandra. sstables of similar size are
+    grouped into buckets: an sstable joins the bucket before it when its
+    size is between bucket_low and bucket_high times the average size of
+    the bucket, or when both are below min_sstable_size. A bucket of at
+    least min_threshold sstables is merged into one sstable, which moves
+    on to a bucket of larger sstables. Every record is rewritten about
+    once per tier, so writes cost less than with leveled compaction, but
+    a key may be in one sstable per tier.
+    A get stops at the newest sstable that has the key, so a bucket is a
+    run of sstables next to each other in age order and the merged
+    sstable takes the place of the run. At most max_threshold sstables
+    of a bucket, the oldest, are merged at once. The merged sstable is
+    not split, or its parts would fall into the bucket they came from.
+    """
+    NAME = "size_tiered"
+    SPLIT_OUTPUTS = False
+
+    def __init__(self, min_threshold: int = 4, max_threshold: int = 32,
+                 bucket_low: float = 0.5, bucket_high: float = 1.5,
+                 min_sstable_size: int = 50 * 1024) -> None:
+        """
+        :param min_threshold: number of sstables in a bucket that starts
+        a compaction of the bucket
+        :param max_threshold: most sstables merged by one compaction
+        :param bucket_low: smallest size of an sstable in a bucket,
+        relative to the average size of the bucket
+        :param bucket_high: largest size of an sstable in a bucket,
+        relative to the average size of the bucket
+        :param min_sstable_size: sstables below this many bytes share one
+        bucket whatever their sizes
+        """
+        if min_threshold < 2 or max_threshold < min_threshold or \
+                not 0 < bucket_low <= 1 <= bucket_high or \
+                min_sstable_size < 0:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid.")
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.bucket_low = bucket_low
+        self.bucket_high = bucket_high
+        self.min_sstable_size = min_sstable_size
+
+    def buckets(self, ss_tables: List[SSTable]) -> List[List[SSTable]]:
+        """
+        :param ss_tables: the sstables of a store, oldest first
+        :return: the sstables grouped into buckets of runs of similar
+        size, oldest first
+        """
+        buckets: List[List[SSTable]] = []
+        total = 0
+        for ss_table in ss_tables:
+            if buckets:
+                average = total / len(buckets[-1])
+                if (average < self.min_sstable_size and
+                        ss_table.size < self.min_sstable_size) or \
+                        self.bucket_low * average <= ss_table.size <= \
+                        self.bucket_high * average:
+                    buckets[-1].append(ss_table)
+                    total += ss_table.size
+                    continue
+            buckets.append([ss_table])
+            total = ss_table.size
+        return buckets
+
+    def pick(self, ss_tables: List[SSTable]) -> Union[Compaction, None]:
+        """
+        :param ss_tables: the sstables of a store, oldest first
+        :return: a compaction of the bucket with the most sstables, the
+        one of the smaller sstables on a tie, None if no bucket has
+        min_threshold sstables
+        """
+        buckets = [bucket for bucket in self.buckets(ss_tables)
+                   if len(bucket) >= self.min_threshold]
+        if not buckets:
+            return None
+        bucket = min(buckets, key=lambda bucket: (
+            -len(bucket), sum(ss_table.size for ss_table in bucket)))
+        inputs = bucket[:self.max_threshold]
+        return Compaction(inputs, min(ss_table.level for ss_table in inputs))
+
+    def get_stats(self, ss_tables: List[SSTable]) -> Dict[str, Any]:
+        """
+        :return: the number of sstables and the average size of every
+        bucket, oldest first
+        """
+        return {"buckets": [
+            [len(bucket), sum(ss_table.size for ss_table in bucket) //
+             len(bucket)] for bucket in self.buckets(ss_tables)]}
+
+
+COMPACTION_STRATEGIES = {
+    LeveledCompaction.NAME: LeveledCompaction,
+    SizeTieredCompaction.NAME: SizeTieredCompaction
+}
@@ -0,0 +1,92 @@
+from ..engine import StorageEngine
+from .diskstore import DiskStore
+from .memorybudget import MemoryBudget
+from .blockcache import BlockCache
+from .ratelimiter import RateLimiter
+from ..error import StorageException
+from ..error import ErrorType
+import os
+
+
+class DiskStorageEngine(StorageEngine):
+    def __init__(self, path: str, mem_size_threshold: int,
+                 memory_budget: int,
+                 block_cache_size: int = DiskStore.BLOCK_CACHE_SIZE,
+                 background_bytes_per_second: int = 0) -> None:
+        """
+        :param path: the directory every store of this engine is created in
+        :param mem_size_threshold: the threshold to flush the mem_table
+        of a single store to disk
+        :param memory_budget: bytes the mem_tables of all stores may use
+        together. when it is exceeded the largest mem_table is flushed first
+        :param block_cache_size: bytes of decoded sstable blocks cached for
+        all stores together
+        :param background_bytes_per_second: bytes flushes and compactions
+        of all stores may write per second together, 0 does not limit.
+        rate_limiter changes it at runtime and turns on auto mode
+        """
+        if memory_budget <= 0:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "The memory budget should be positive.")
+        self.path = path
+        self.mem_size_threshold = mem_size_threshold
+        self.memory_budget = MemoryBudget(memory_budget)
+        self.block_cache = BlockCache(block_cache_size)
+        self.rate_limiter = RateLimiter(background_bytes_per_second)
+        self.stores: dict = {}
+        if not os.path.exists(self.path):
+            os.mkdir(self.path)
+
+    def create_store(self, store_name: str, compression: str = "none",
+                     wal_sync_mode: str = "none",
+                     compaction_strategy: str = "leveled") -> DiskStore:
+        """
+        :param store_name: name of the new store
+        :param compression: codec the data blocks of the sstables of the
+        store are compressed with: "none", "zlib", "lzma" or "bz2"
+        :param wal_sync_mode: when the write-ahead log of the store is
+        synced: "none", "always", "group", or "off" for no log
+        :param compaction_strategy: how the sstables of the store are
+        compacted: "leveled" or "size_tiered"
+        :return: the new store
+        """
+        if store_name in self.stores:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This store name has been used.")
+        else:
+            self.stores[store_name] = DiskStore(store_name, self.path,
+                                                self.mem_size_threshold,
+                                                self.memory_budget,
+                                                compression,
+                                                self.block_cache,
+                                                wal_sync_mode,
+                                                compaction_strategy,
+                                                self.rate_limiter)
+            return self.stores[store_name]
+
+    def get_store(self, store_name: str) -> DiskStore:
+        if store_name in self.stores:
+            return self.stores[store_name]
+        else:
+            raise StorageException(ErrorType.NOT_FOUND,
+                                   "This store cannot be found.")
+
+    def get_memory_usage(self) -> int:
+        """
+        :return: bytes used by the mem_tables of all stores
+        """
+        return self.memory_budget.get_usage()
+
+    def get_block_cache_stats(self) -> dict:
+        """
+        :return: hits, misses, entries, usage and capacity of the block
+        cache shared by all stores
+        """
+        return self.block_cache.get_stats()
+
+    def get_rate_limiter_stats(self) -> dict:
+        """
+        :return: rate, auto mode, get latency and waits of the rate
+        limiter shared by the background writers of all stores
+        """
+        return self.rate_limiter.get_stats()
@@ -1,34 +1,92 @@
 from ..memory.inmemorystore import InMemoryStore
 from ..error import StorageException
 from ..error import ErrorType
-from time import time
+from time import perf_counter, sleep, time
 from .sstable import SSTable
-from struct import pack
 from typing import Any
 from ..store import Store
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Tuple
 from .rwlock import RWLock
+from .memorybudget import MemoryBudget
+from .blockreader import BlockSSTableReader
+from .sstablebuilder import SSTableBuilder
+from .blockcache import BlockCache
+from .rowcache import RowCache
+from .writeaheadlog import WriteAheadLog
+from .manifest import Manifest
+from .ratelimiter import RateLimiter
+from .compaction import COMPACTION_STRATEGIES, Compaction
+from .compaction import CompactionStrategy, LeveledCompaction
+from .mergingiterator import MergingIterator, merge_records
+from .subcompaction import Subcompaction, run_subcompaction, split_keys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from struct import unpack_from
+from typing import Union
+import multiprocessing
 import os
+import threading
 
 
 class DiskStore(Store):
     INT_SIZE = 4
     TIMESTAMP_SIZE = 8
     INDICATOR_SIZE = 4
+    BLOCK_CACHE_SIZE = 8 * 1024 * 1024
+    TARGET_FILE_SIZE = 2 * 1024 * 1024
+    WAL_OFF = "off"
 
     def __init__(self, store_name: str, path: str,
-                 mem_size_threshold: int) -> None:
+                 mem_size_threshold: int,
+                 memory_budget: Union[MemoryBudget, None] = None,
+                 compression: str = "none",
+                 block_cache: Union[BlockCache, None] = None,
+                 wal_sync_mode: str = WriteAheadLog.NONE,
+                 compaction_strategy: Union[
+                     str, CompactionStrategy] = LeveledCompaction.NAME,
+                 rate_limiter: Union[RateLimiter, None] = None) -> None:
         """
         :param store_name: name of store
         :param mem_size_threshold: the threshold to flush mem_table to disk
         :param path: the path where user intend to store file
+        :param memory_budget: memory limit shared with other stores,
+        the mem_table is also flushed when the budget picks this store
+        :param compression: codec the data blocks of new sstables are
+        compressed with: "none", "zlib", "lzma" or "bz2". a block that
+        does not shrink by an eighth is stored raw
+        :param block_cache: cache of decoded data blocks shared with other
+        stores, a store without one gets its own cache of
+        BLOCK_CACHE_SIZE bytes
+        :param wal_sync_mode: writes are logged to a write-ahead log that
+        is replayed into mem_table when the store is opened again: "none"
+        leaves syncing the log to the operating system, "always" syncs it
+        on every write, "group" lets concurrent writers share one sync,
+        "off" writes no log. with a sync mode other than "none" flushed
+        sstables are synced before their log is deleted
+        :param compaction_strategy: the compaction strategy of the store,
+        see set_compaction_strategy
+        :param rate_limiter: limits the bytes flushes and compactions
+        write, shared with other stores. a store without one gets its
+        own, which does not limit until set_bytes_per_second is called
         """
+        if compression not in BlockSSTableReader.COMPRESSION_TYPES:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "Unknown compression " + compression)
+        if wal_sync_mode != self.WAL_OFF and \
+                wal_sync_mode not in WriteAheadLog.SYNC_MODES:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "Unknown wal sync mode " + wal_sync_mode)
+        self.compression = BlockSSTableReader.COMPRESSION_TYPES[compression]
         self.store_name = store_name
         self.mem_table = InMemoryStore(store_name)
         self.id = 0
         self.index_ratio = 0.1
-        self.index_table: List = []
-        self.last_index = 0
+        self.block_size = 4096
+        self.restart_interval = 16
+        self.fsync_sstables = False
+        self.bloom_bits_per_key = 10
+        self.target_file_size = self.TARGET_FILE_SIZE
         self.path = path
         self.path = os.path.join(self.path, store_name)
         self.rwlock = RWLock()
@@ -36,12 +94,81 @@ class DiskStore(Store):
             os.mkdir(self.path)
         self.ss_table_dir = os.path.join(self.path, "sstable")
         self.index_dir = os.path.join(self.path, "index")
-        if not os.path.exists(self.ss_table_dir):
-            os.mkdir(self.ss_table_dir)
-        if not os.path.exists(self.index_dir):
-            os.mkdir(self.index_dir)
+        self.wal_dir = os.path.join(self.path, "wal")
+        for directory in (self.ss_table_dir, self.index_dir, self.wal_dir):
+            if not os.path.exists(directory):
+                os.mkdir(directory)
         self.ss_tables: List = []
+        self.manifest = Manifest(self.path)
         self.mem_size_threshold = mem_size_threshold
+        if block_cache is None:
+            block_cache = BlockCache(self.BLOCK_CACHE_SIZE)
+        self.block_cache = block_cache
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
+        self.rate_limiter = rate_limiter
+        self.row_cache: Union[RowCache, None] = None
+        self.memory_budget = memory_budget
+        if memory_budget is not None:
+            memory_budget.register(self)
+        # full mem_tables waiting for the flush thread, oldest first.
+        # flush_condition guards the list and wakes up the flush thread,
+        # flushing writers and closing
+        self.immutable_mem_tables: List[InMemoryStore] = []
+        self.max_pending_flushes = 2
+        self.flush_condition = threading.Condition()
+        # serializes changes of ss_tables and the manifest between the
+        # flush thread and compactions
+        self.flush_lock = threading.Lock()
+        self.flush_thread: Union[threading.Thread, None] = None
+        self.flush_error: Union[Exception, None] = None
+        self.closing = False
+        # the log mem_table writes go to, opened by the first write, and
+        # the log files holding the writes of mem_table and of each
+        # immutable mem_table, deleted once the mem_table is flushed
+        self.wal_sync_mode = wal_sync_mode
+        self.wal: Union[WriteAheadLog, None] = None
+        self.wal_files: List[str] = []
+        self.immutable_wal_files: List[List[str]] = []
+        self.wal_number = 0
+        self.id_lock = threading.Lock()
+        # compactions run one at a time on the compaction thread, or in
+        # compact() and merge(). compaction_condition wakes up the thread
+        self.compaction_strategy = self._compaction_strategy(
+            compaction_strategy)
+        self.auto_compaction = True
+        self.compaction_lock = threading.Lock()
+        self.compaction_condition = threading.Condition()
+        self.compaction_thread: Union[threading.Thread, None] = None
+        self.compaction_pending = False
+        self.compaction_closing = False
+        self.compaction_error: Union[Exception, None] = None
+        self.compaction_count = 0
+        # bytes of sstables written by compactions, against the bytes
+        # written by flushes this gives the write amplification
+        self.compaction_bytes = 0
+        self.flush_bytes = 0
+        # a large compaction is split into key ranges merged by worker
+        # processes, started when the first one runs
+        self.max_subcompactions = 1
+        self.subcompaction_executor: Union[ProcessPoolExecutor, None] = None
+        self.subcompaction_count = 0
+        # writes slow down past the soft limits and stop at the hard
+        # limits on unmerged sstables and on bytes of immutable mem_tables.
+        # stall_condition wakes up stopped writers when a flush or a
+        # compaction is installed
+        self.soft_sstables = 20
+        self.hard_sstables = 36
+        self.soft_pending_bytes = 0
+        self.hard_pending_bytes = 0
+        self.stall_delay = 0.001
+        self.stall_condition = threading.Condition()
+        self.slowdown_count = 0
+        self.slowdown_seconds = 0.0
+        self.stop_count = 0
+        self.stop_seconds = 0.0
+        self._load_sstables()
+        self._recover()
 
     def set_index_ratio(self, new_index_ratio: float) -> None:
         """
@@ -49,7 +176,9 @@ class DiskStore(Store):
         we set the index_ration to control the size of index table
         in memory.
         Default new_index_ration = 0.1
-        it means 1 in 10 data will be stored in index table
+        it means 1 in 10 data will be stored in index table.
+        only v1 sstables have an index table, v2 sstables written now
+        index every data block instead, see set_block_size
         :param new_index_ratio: one in 1/new_index_ratio data
         will be stored in memory table
         """
@@ -59,20 +188,657 @@ class DiskStore(Store):
                                    "It should be between (0, 1]")
         self.index_ratio = new_index_ratio
 
+    def set_block_size(self, block_size: int) -> None:
+        """
+        records of new sstables are grouped into data blocks of about
+        block_size bytes, the block index keeps the last key of every
+        block. a lookup reads one data block, so smaller blocks read less
+        per lookup and need a larger block index.
+        Default block_size = 4096
+        :param block_size: bytes of records in a data block, a block ends
+        with the first record that reaches block_size
+        """
+        if block_size < 1:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid. "
+                                   "It should be at least 1")
+        self.block_size = block_size
+
+    def set_restart_interval(self, restart_interval: int) -> None:
+        """
+        keys in a data block only store the bytes that differ from the
+        previous key. every restart_interval keys a restart point stores
+        the key in full, a lookup binary searches the restart points and
+        decodes at most restart_interval keys. 1 stores every key in full.
+        Default restart_interval = 16
+        :param restart_interval: number of keys from one restart point
+        to the next
+        """
+        if restart_interval < 1:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid. "
+                                   "It should be at least 1")
+        self.restart_interval = restart_interval
+
+    def set_fsync_sstables(self, fsync_sstables: bool) -> None:
+        """
+        fsync every new sstable file and bloom file before the sstable
+        is installed, so a flushed sstable survives a crash of the machine.
+        Default fsync_sstables = False
+        :param fsync_sstables: True to fsync new sstables
+        """
+        self.fsync_sstables = fsync_sstables
+
+    def set_bloom_bits_per_key(self, bits_per_key: int) -> None:
+        """
+        every new sstable gets a bloom filter over its keys, so get can
+        skip sstables that cannot contain the key without reading them.
+        more bits per key give fewer false positives and a larger filter.
+        Default bits_per_key = 10, about 1% false positives.
+        0 disables bloom filters for new sstables
+        :param bits_per_key: bits of the bloom filter for each key
+        """
+        if bits_per_key < 0:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid. "
+                                   "It should be at least 0")
+        self.bloom_bits_per_key = bits_per_key
+
+    def set_target_file_size(self, target_file_size: int) -> None:
+        """
+        a compaction writes its output into sstables of about
+        target_file_size bytes, so a deeper level is made of several
+        sstables and its compactions rewrite a part of it.
+        Default target_file_size = 2 MiB
+        :param target_file_size: bytes of a compaction output sstable,
+        an sstable ends with the first data block that reaches it
+        """
+        if target_file_size < 1:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid. "
+                                   "It should be at least 1")
+        self.target_file_size = target_file_size
+
+    def set_max_subcompactions(self, max_subcompactions: int) -> None:
+        """
+        a compaction of at least twice target_file_size bytes is split
+        into up to max_subcompactions key ranges, merged at the same time
+        by as many worker processes, so a large merge is not bound to one
+        core. compactions of a strategy that does not split its outputs
+        are not split.
+        Default max_subcompactions = 1, every compaction runs in the
+        calling thread
+        :param max_subcompactions: the number of key ranges and of worker
+        processes
+        """
+        if max_subcompactions < 1:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid. "
+                                   "It should be at least 1")
+        with self.compaction_lock:
+            self.max_subcompactions = max_subcompactions
+            self._shutdown_subcompaction_executor()
+
+    def _shutdown_subcompaction_executor(self) -> None:
+        """
+        the caller must hold compaction_lock
+        :return: None
+        """
+        if self.subcompaction_executor is not None:
+            self.subcompaction_executor.shutdown()
+            self.subcompaction_executor = None
+
+    def set_row_cache_size(self, row_cache_size: int) -> None:
+        """
+        get keeps the results of searching the sstables for the last
+        row_cache_size keys, so reads of hot keys skip the sstables.
+        set and remove invalidate the key, compactions do not change
+        the value of any key.
+        Default row_cache_size = 0, no row cache
+        :param row_cache_size: number of keys in the row cache, 0 turns
+        the row cache off
+        """
+        if row_cache_size < 0:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid. "
+                                   "It should be at least 0")
+        self.rwlock.wlock_acquire()
+        try:
+            self.row_cache = RowCache(row_cache_size) \
+                if row_cache_size > 0 else None
+        finally:
+            self.rwlock.wlock_release()
+
+    def set_compaction_strategy(
+            self, compaction_strategy: Union[str, CompactionStrategy]) \
+            -> None:
+        """
+        the compaction strategy picks the sstables background compaction
+        and compact() merge. "leveled" keeps few sstables for reads to
+        search, "size_tiered" rewrites data less often for stores that
+        are mostly written.
+        Default compaction_strategy = "leveled"
+        :param compaction_strategy: a name in COMPACTION_STRATEGIES for
+        the strategy with its default settings, or a strategy
+        """
+        strategy = self._compaction_strategy(compaction_strategy)
+        with self.compaction_lock:
+            self.compaction_strategy = strategy
+        if self.auto_compaction:
+            self._schedule_compaction()
+
+    @staticmethod
+    def _compaction_strategy(
+            compaction_strategy: Union[str, CompactionStrategy]) \
+            -> CompactionStrategy:
+        """
+        :return: the strategy named compaction_strategy, or
+        compaction_strategy itself if it is a strategy
+        """
+        if not isinstance(compaction_strategy, str):
+            return compaction_strategy
+        if compaction_strategy not in COMPACTION_STRATEGIES:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "Unknown compaction strategy " +
+                                   compaction_strategy)
+        return COMPACTION_STRATEGIES[compaction_strategy]()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        :return: the name of the compaction strategy, what it sees in the
+        sstables, the number of compactions run, the bytes of sstables
+        written by flushes and by compactions, the number of key ranges
+        merged by worker processes, the number and bytes of sstables, the
+        stats of the rate limiter and the write stalls
+        """
+        ss_tables = self._snapshot_sstables()
+        strategy = self.compaction_strategy
+        return {"compaction_strategy": strategy.NAME,
+                "compaction": strategy.get_stats(ss_tables),
+                "compaction_count": self.compaction_count,
+                "flush_bytes": self.flush_bytes,
+                "compaction_bytes": self.compaction_bytes,
+                "subcompaction_count": self.subcompaction_count,
+                "sstables": len(ss_tables),
+                "sstable_bytes": sum(ss_table.size
+                                     for ss_table in ss_tables),
+                "rate_limiter": self.rate_limiter.get_stats(),
+                "write_stall": self._get_write_stall_stats(ss_tables)}
+
+    def set_write_stall_limits(self, soft_sstables: int, hard_sstables: int,
+                               soft_pending_bytes: int = 0,
+                               hard_pending_bytes: int = 0,
+                               stall_delay: float = 0.001) -> None:
+        """
+        bound the sstables a get may search and the memory waiting for the
+        flush thread. a write past a soft limit sleeps, from stall_delay
+        at the soft limit up to 10 times stall_delay near the hard limit,
+        so background work catches up while write latency stays bounded.
+        at a hard limit writes block until a flush or compaction brings
+        the store under it. the sstable limits apply while background
+        compaction is on.
+        Default soft_sstables = 20, hard_sstables = 36, no limits on
+        pending bytes, stall_delay = 1 ms
+        :param soft_sstables: unmerged sstables, as counted by the
+        compaction strategy, that slow writes down
+        :param hard_sstables: unmerged sstables that stop writes
+        :param soft_pending_bytes: memory of the immutable mem_tables that
+        slows writes down, 0 for no limit
+        :param hard_pending_bytes: memory of the immutable mem_tables that
+        stops writes, 0 for no limit
+        :param stall_delay: seconds a write sleeps at a soft limit
+        """
+        if not 1 <= soft_sstables < hard_sstables or \
+                (soft_pending_bytes, hard_pending_bytes) != (0, 0) and \
+                not 1 <= soft_pending_bytes < hard_pending_bytes or \
+                stall_delay < 0:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid.")
+        with self.stall_condition:
+            self.soft_sstables = soft_sstables
+            self.hard_sstables = hard_sstables
+            self.soft_pending_bytes = soft_pending_bytes
+            self.hard_pending_bytes = hard_pending_bytes
+            self.stall_delay = stall_delay
+            self.stall_condition.notify_all()
+
+    def set_auto_compaction(self, auto_compaction: bool) -> None:
+        """
+        a background thread compacts the sstables whenever the compaction
+        strategy finds a level that needs it, after every flush. turning
+        it off leaves compaction to compact() and merge().
+        Default auto_compaction = True
+        :param auto_compaction: True to compact in the background
+        """
+        self.auto_compaction = auto_compaction
+        if auto_compaction:
+            self._schedule_compaction()
+        else:
+            self._notify_stalled_writers()
+
+    def set_max_pending_flushes(self, max_pending_flushes: int) -> None:
+        """
+        a full mem_table is flushed by a background thread while a new
+        mem_table takes writes. writers block when max_pending_flushes
+        mem_tables are already waiting to be flushed.
+        Default max_pending_flushes = 2
+        :param max_pending_flushes: the number of immutable mem_tables
+        allowed to wait for the flush thread
+        """
+        if max_pending_flushes < 1:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid. "
+                                   "It should be at least 1")
+        with self.flush_condition:
+            self.max_pending_flushes = max_pending_flushes
+            self.flush_condition.notify_all()
+
     def flush(self) -> None:
         """
         :return: None
-        if it is not flushing and size of expected sstable
-        file reaches threshold, set start_flush to True to
-        block read and write flush mem_table into disk,
-        add sstable in ss_tables update id, clean mem_table
-        and index_table.
-        after it, set start_flush back to False
-        """
-        self.ss_tables.append(self.create_sstable(self.mem_table, {}))
-        self.id += 1
-        self.mem_table.clean()
-        self.index_table = []
+        turn mem_table into an immutable mem_table and wait until the
+        flush thread has written it into a sstable. if mem_table is empty
+        but older mem_tables are still pending, only wait for those
+        """
+        self.rwlock.wlock_acquire()
+        try:
+            if self.mem_table.get_size() > 0 or \
+                    not self.immutable_mem_tables:
+                self._rotate_mem_table()
+            else:
+                self._start_flush_thread()
+        finally:
+            self.rwlock.wlock_release()
+        with self.flush_condition:
+            while self.immutable_mem_tables and self.flush_error is None:
+                self.flush_condition.wait()
+        self._check_flush_error()
+
+    def close(self) -> None:
+        """
+        flush mem_table, if it is not empty, and all pending immutable
+        mem_tables, then stop the flush thread. the flush thread is a
+        daemon thread: writes that are not flushed when the interpreter
+        exits without close() are lost
+        :return: None
+        """
+        self.rwlock.wlock_acquire()
+        try:
+            if self.mem_table.get_size() > 0:
+                self._rotate_mem_table()
+            elif self.immutable_mem_tables:
+                self._start_flush_thread()
+        finally:
+            self.rwlock.wlock_release()
+        with self.flush_condition:
+            self.closing = True
+            self.flush_condition.notify_all()
+            flush_thread = self.flush_thread
+        if flush_thread is not None:
+            flush_thread.join()
+        with self.compaction_condition:
+            self.compaction_closing = True
+            self.compaction_condition.notify_all()
+            compaction_thread = self.compaction_thread
+        if compaction_thread is not None:
+            compaction_thread.join()
+        with self.compaction_lock:
+            self._shutdown_subcompaction_executor()
+        self.rwlock.wlock_acquire()
+        try:
+            if self.wal is not None:
+                self.wal.close()
+                self.wal = None
+        finally:
+            self.rwlock.wlock_release()
+        self._check_flush_error()
+        self._check_compaction_error()
+
+    def _load_sstables(self) -> None:
+        """
+        open the sstables listed in the manifest, without reading them,
+        and delete sstable files the manifest does not list: files of a
+        flush or merge that did not finish. a store written before the
+        manifest existed has its sstable files scanned once and gets a
+        manifest
+        :return: None
+        """
+        file_ids = {}
+        for name in os.listdir(self.ss_table_dir):
+            number = name[len(self.store_name):-len(".ss")]
+            if name.startswith(self.store_name) and name.endswith(".ss") \
+                    and number.isdigit():
+                file_ids[int(number)] = name
+        if self.manifest.exists():
+            self.id, entries = self.manifest.load()
+            for entry in entries:
+                ss_table = SSTable(
+                    self.store_name, entry["id"], entry["size"],
+                    entry["index_table"], self.path, entry["last_index"],
+                    self.block_cache)
+                ss_table.level = entry.get("level", 0)
+                ss_table.sequence = entry.get("sequence", entry["id"])
+                if "key_range" in entry:
+                    ss_table.set_key_range(entry["key_range"])
+                ss_table.num_keys = entry.get("num_keys")
+                self.ss_tables.append(ss_table)
+            live = set(entry["id"] for entry in entries)
+            for id in file_ids:
+                if id not in live:
+                    SSTable(self.store_name, id, 0, [], self.path, 0).clean()
+        elif file_ids:
+            for id in sorted(file_ids):
+                self.ss_tables.append(self._open_unlisted_sstable(id))
+            self.id = max(file_ids) + 1
+            self._save_sstables(self.ss_tables)
+
+    def _open_unlisted_sstable(self, id: int) -> SSTable:
+        """
+        :param id: id of a sstable file that is not in a manifest
+        :return: the sstable. a v1 sstable gets an empty index table and
+        the offset of the last entry of its index file
+        """
+        ss_table_path = BlockSSTableReader.file_path(self.store_name, id,
+                                                     self.path)
+        size = os.path.getsize(ss_table_path)
+        last_index = 0
+        if not BlockSSTableReader.is_block_file(ss_table_path):
+            index_path = os.path.join(self.index_dir,
+                                      self.store_name + str(id) + ".index")
+            with open(index_path, "rb") as index_file:
+                index = index_file.read()
+            pos = 0
+            while pos < len(index):
+                last_index = pos
+                pos += self.INT_SIZE + unpack_from("i", index, pos)[0] + \
+                    self.INT_SIZE
+        return SSTable(self.store_name, id, size, [], self.path, last_index,
+                       self.block_cache)
+
+    def _sync_files(self) -> bool:
+        """
+        :return: True if new sstables and the manifest are fsynced, when
+        set_fsync_sstables is on or the log is synced
+        """
+        return self.fsync_sstables or self.wal_sync_mode not in (
+            self.WAL_OFF, WriteAheadLog.NONE)
+
+    def _recover(self) -> None:
+        """
+        replay the logs left by a store that was not closed, oldest
+        first, into mem_table. the logs are kept until mem_table is
+        flushed
+        :return: None
+        """
+        numbers = sorted(int(name[len(self.store_name):-len(".log")])
+                         for name in os.listdir(self.wal_dir)
+                         if name.startswith(self.store_name) and
+                         name.endswith(".log") and
+                         name[len(self.store_name):-len(".log")].isdigit())
+        for number in numbers:
+            file_path = self._wal_path(number)
+            for key, value in WriteAheadLog.replay(file_path):
+                if value is None:
+                    self.mem_table.remove(key)
+                else:
+                    self.mem_table.set(key, value)
+            self.wal_files.append(file_path)
+            self.wal_number = number + 1
+        self._charge_memory(self.mem_table.get_memory_usage())
+
+    def _wal_path(self, number: int) -> str:
+        return os.path.join(self.wal_dir,
+                            self.store_name + str(number) + ".log")
+
+    def _log(self, key: str, value: Union[str, None]) \
+            -> Tuple[Union[WriteAheadLog, None], int]:
+        """
+        the caller must hold the write lock.
+        append a write of mem_table to its log, opening a new log file if
+        mem_table has none open
+        :param value: the value, None for a remove
+        :return: tuple (log, sequence number of the write) to wait for
+        the sync of the write, the log is None if the store writes no log
+        """
+        if self.wal_sync_mode == self.WAL_OFF:
+            return None, 0
+        if self.wal is None:
+            file_path = self._wal_path(self.wal_number)
+            self.wal_number += 1
+            self.wal = WriteAheadLog(file_path, self.wal_sync_mode)
+            self.wal_files.append(file_path)
+        return self.wal, self.wal.append(key, value)
+
+    def _rotate_mem_table(self) -> None:
+        """
+        the caller must hold the write lock.
+        move mem_table to the immutable mem_tables, where reads can still
+        find it, start a new mem_table for writes and wake up the flush
+        thread
+        :return: None
+        """
+        if self.wal is not None:
+            self.wal.close()
+            self.wal = None
+        with self.flush_condition:
+            self.immutable_mem_tables.append(self.mem_table)
+            self.immutable_wal_files.append(self.wal_files)
+            self.mem_table = InMemoryStore(self.store_name)
+            self.wal_files = []
+            self.flush_condition.notify_all()
+        self._start_flush_thread()
+
+    def _start_flush_thread(self) -> None:
+        """
+        start the flush thread if it is not running, either because
+        nothing was flushed yet or because the last flush failed and the
+        thread stopped. the mem_tables it failed on are flushed again
+        :return: None
+        """
+        with self.flush_condition:
+            if self.flush_thread is not None:
+                return
+            self.closing = False
+            self.flush_thread = threading.Thread(
+                target=self._flush_worker,
+                name="flush-" + self.store_name, daemon=True)
+            self.flush_thread.start()
+
+    def _flush_worker(self) -> None:
+        """
+        body of the flush thread. flush the oldest immutable mem_table
+        into a sstable without holding the write lock, then take the
+        write lock only to install the sstable and drop the mem_table.
+        if a flush fails, the mem_table stays readable, the error is kept
+        in flush_error and raised once to the next writer, and the thread
+        stops. the next rotation or flush starts it again. the new
+        sstable is added to the manifest before the logs of the flushed
+        mem_table are deleted
+        :return: None
+        """
+        while True:
+            with self.flush_condition:
+                while not self.immutable_mem_tables and not self.closing:
+                    self.flush_condition.wait()
+                if not self.immutable_mem_tables:
+                    self.flush_thread = None
+                    return
+                mem_table = self.immutable_mem_tables[0]
+            try:
+                with self.flush_lock:
+                    ss_table = self.create_sstable(mem_table, {})
+                    try:
+                        self._save_sstables(self.ss_tables + [ss_table])
+                    except Exception:
+                        ss_table.clean()
+                        raise
+                    for file_path in self.immutable_wal_files[0]:
+                        try:
+                            os.remove(file_path)
+                        except FileNotFoundError:
+                            # removed before an earlier try of this
+                            # flush failed
+                            pass
+                    self.rwlock.wlock_acquire()
+                    try:
+                        self.ss_tables.append(ss_table)
+                        self.flush_bytes += ss_table.size
+                        self._charge_memory(-mem_table.get_memory_usage())
+                        with self.flush_condition:
+                            self.immutable_mem_tables.pop(0)
+                            self.immutable_wal_files.pop(0)
+                            self.flush_condition.notify_all()
+                    finally:
+                        self.rwlock.wlock_release()
+                self._notify_stalled_writers()
+                if self.auto_compaction:
+                    self._schedule_compaction()
+            except Exception as e:
+                with self.flush_condition:
+                    self.flush_error = e
+                    self.flush_thread = None
+                    self.flush_condition.notify_all()
+                self._notify_stalled_writers()
+                return
+
+    def _wait_for_flush_slot(self) -> None:
+        """
+        block a writer while mem_table is full and max_pending_flushes
+        immutable mem_tables are already waiting for the flush thread
+        :return: None
+        """
+        if self.immutable_mem_tables:
+            self._start_flush_thread()
+        with self.flush_condition:
+            while self.flush_error is None and \
+                    self.mem_table.get_size() >= self.mem_size_threshold \
+                    and len(self.immutable_mem_tables) >= \
+                    self.max_pending_flushes:
+                self.flush_condition.wait()
+        self._check_flush_error()
+
+    def _stall_writes(self) -> None:
+        """
+        slow a writer down past a soft limit, block it at a hard limit
+        until a flush or compaction is installed, see
+        set_write_stall_limits. a failed flush or compaction releases
+        blocked writers and its error is raised once to a blocked writer,
+        whose write is not made. the next writer at the hard limit starts
+        the compaction thread again and blocks
+        :return: None
+        """
+        ratio = self._write_stall_ratio()
+        if ratio < 0:
+            return
+        if ratio < 1:
+            delay = self.stall_delay * (1 + 9 * ratio)
+            sleep(delay)
+            with self.stall_condition:
+                self.slowdown_count += 1
+                self.slowdown_seconds += delay
+            return
+        if self.auto_compaction:
+            self._schedule_compaction()
+        start = perf_counter()
+        with self.stall_condition:
+            self.stop_count += 1
+            while self._write_stall_ratio() >= 1 and \
+                    self.flush_error is None and \
+                    self.compaction_error is None:
+                # the timeout covers a flush thread that needs a restart
+                self.stall_condition.wait(0.1)
+                if self.immutable_mem_tables:
+                    self._start_flush_thread()
+            self.stop_seconds += perf_counter() - start
+        # a flush error is raised by _wait_for_flush_slot
+        self._check_compaction_error()
+
+    def _write_stall_ratio(self) -> float:
+        """
+        :return: -1 under every soft limit, otherwise how far the store is
+        from the soft limit it is past to the hard limit: below 1 between
+        the limits, at least 1 at a hard limit
+        """
+        ratio = -1.0
+        if self.auto_compaction:
+            unmerged = self.compaction_strategy.unmerged_sstables(
+                self.ss_tables)
+            if unmerged >= self.soft_sstables:
+                ratio = (unmerged - self.soft_sstables) / \
+                    (self.hard_sstables - self.soft_sstables)
+        if self.soft_pending_bytes > 0:
+            pending = self._pending_flush_bytes()
+            if pending >= self.soft_pending_bytes:
+                ratio = max(ratio, (pending - self.soft_pending_bytes) /
+                            (self.hard_pending_bytes -
+                             self.soft_pending_bytes))
+        return ratio
+
+    def _pending_flush_bytes(self) -> int:
+        return sum(mem_table.get_memory_usage()
+                   for mem_table in list(self.immutable_mem_tables))
+
+    def _notify_stalled_writers(self) -> None:
+        with self.stall_condition:
+            self.stall_condition.notify_all()
+
+    def _get_write_stall_stats(self, ss_tables: List[SSTable]) \
+            -> Dict[str, Any]:
+        """
+        :return: the number and seconds of slowed down and stopped
+        writes, the unmerged sstables and the pending flush bytes
+        """
+        with self.stall_condition:
+            return {"slowdowns": self.slowdown_count,
+                    "slowdown_seconds": self.slowdown_seconds,
+                    "stops": self.stop_count,
+                    "stop_seconds": self.stop_seconds,
+                    "unmerged_sstables":
+                        self.compaction_strategy.unmerged_sstables(
+                            ss_tables),
+                    "pending_flush_bytes": self._pending_flush_bytes()}
+
+    def _check_flush_error(self) -> None:
+        """
+        raise the error of the last failed flush once and clear it,
+        so the store can recover when the flush thread is restarted
+        :return: None
+        """
+        with self.flush_condition:
+            error = self.flush_error
+            self.flush_error = None
+        if error is not None:
+            raise StorageException(ErrorType.IO_ERROR,
+                                   "Flushing mem_table failed: " +
+                                   str(error))
+
+    def get_memory_usage(self) -> int:
+        """
+        :return: bytes of python objects held by mem_table and the
+        immutable mem_tables that are not flushed yet
+        """
+        memory_usage = self.mem_table.get_memory_usage()
+        for mem_table in list(self.immutable_mem_tables):
+            memory_usage += mem_table.get_memory_usage()
+        return memory_usage
+
+    def _charge_memory(self, delta: int) -> None:
+        """
+        :param delta: change of mem_table memory, reported to memory_budget
+        :return: None
+        """
+        if self.memory_budget is not None and delta != 0:
+            self.memory_budget.charge(delta)
+
+    def _enforce_memory_budget(self) -> None:
+        """
+        let the shared budget flush the largest stores. it must be called
+        after the write lock is released, because flushing another store
+        takes that store's lock and this store may be picked as well
+        :return: None
+        """
+        if self.memory_budget is not None:
+            self.memory_budget.enforce()
 
     def create_sstable(self, mem_table: InMemoryStore,
                        time_stamp: dict) -> SSTable:
@@ -81,180 +847,599 @@ class DiskStore(Store):
         :param time_stamp: time stamp corresponding to mem_table
         :return: create a sstable
         """
-        size = self._flush_mem_to_disk(mem_table, time_stamp)
-        new_ss_table = SSTable(self.store_name, self.id, size,
-                               self.index_table, self.path, self.last_index)
+        id = self._new_id()
+        size, key_range = self._write_sstable(
+            self._mem_table_records(mem_table, time_stamp),
+            mem_table.length(), id)
+        new_ss_table = SSTable(self.store_name, id, size, [], self.path, 0,
+                               self.block_cache)
+        new_ss_table.set_key_range(key_range)
+        new_ss_table.num_keys = mem_table.length()
+        new_ss_table.open()
         return new_ss_table
 
+    def _new_id(self) -> int:
+        """
+        :return: the id of a new sstable, ids are never reused
+        """
+        with self.id_lock:
+            id = self.id
+            self.id += 1
+            return id
+
     def set(self, key: str, value: str) -> Any:
         """
         :param key: key to add
         :param value: value corresponding to key
         :return: add the set of data
         """
+        self._stall_writes()
+        self._wait_for_flush_slot()
         self.rwlock.wlock_acquire()
-        self.mem_table.set(key, value)
-        if self.mem_table.get_size() >= self.mem_size_threshold:
-            self.flush()
-        self.rwlock.wlock_release()
+        try:
+            wal, sequence = self._log(key, value)
+            memory_usage = self.mem_table.get_memory_usage()
+            self.mem_table.set(key, value)
+            if self.row_cache is not None:
+                self.row_cache.invalidate(key)
+            self._charge_memory(self.mem_table.get_memory_usage() -
+                                memory_usage)
+            if self.mem_table.get_size() >= self.mem_size_threshold and \
+                    len(self.immutable_mem_tables) < \
+                    self.max_pending_flushes:
+                self._rotate_mem_table()
+        finally:
+            self.rwlock.wlock_release()
+        if wal is not None:
+            wal.sync(sequence)
+        self._enforce_memory_budget()
 
     def get(self, key: str) -> Any:
         """
         :param key: the key to be found
         :return: the value corresponding to the key. if not found, return None
-        check whether it starts flushing. if flushing, raise an exception.
-        otherwise, read mem_table, return value if found.
-        if not found in mem_table, read sstables and find
-        the value with latest timestamp
+        read mem_table, then the immutable mem_tables and then the
+        sstables, newest first. ss_tables is kept in age order, so the
+        first table that has the key, value or removed, holds its latest
+        operation and the search stops there. every sstable is probed
+        once, bloom filters skip most sstables without the key. the row
+        cache, if set, keeps the result of the sstable search. in auto
+        mode the rate limiter gets the latency of the get
         """
+        rate_limiter = self.rate_limiter
+        if not rate_limiter.is_auto():
+            return self._get(key)
+        start = perf_counter()
+        try:
+            return self._get(key)
+        finally:
+            rate_limiter.record_read_latency(perf_counter() - start)
+
+    def _get(self, key: str) -> Any:
         self.rwlock.rlock_acquire()
-        value = None
-        if self.mem_table.contain_key(key):
-            if self.mem_table.is_removed(key):
-                self.rwlock.rlock_release()
-                return None
-            else:
-                value = self.mem_table.get(key)
-        else:
-            timestamp = 0
-            for ss_table in self.ss_tables:
-                if ss_table.contain(key):
-                    cur_timestamp = ss_table.get_timestamp(key)
-                    if cur_timestamp > timestamp:
-                        timestamp = cur_timestamp
-                        value = ss_table.get(key)
-        self.rwlock.rlock_release()
-        return value
+        try:
+            for mem_table in [self.mem_table] + \
+                    self.immutable_mem_tables[::-1]:
+                found, removed, value = mem_table.lookup(key)
+                if found:
+                    return None if removed else value
+            row_cache = self.row_cache
+            if row_cache is not None:
+                found, value = row_cache.get(key)
+                if found:
+                    return value
+            value = None
+            for ss_table in reversed(self.ss_tables):
+                found, removed, value, _ = ss_table.lookup(key)
+                if found:
+                    if removed:
+                        value = None
+                    break
+            if row_cache is not None:
+                row_cache.put(key, value)
+            return value
+        finally:
+            self.rwlock.rlock_release()
 
     def iterator(self) -> Any:
+        """
+        :return: a MergingIterator over the live keys of the store in key
+        order, from a snapshot taken when it is called. nothing is copied:
+        mem_table, if it is not empty, is moved to the immutable mem_tables
+        under the write lock, like a full mem_table, and the immutable
+        mem_tables and sstables are merged as the iterator moves. writes
+        wait only for that move, the flush thread writes the moved
+        mem_table into a sstable as usual
+        """
         self.rwlock.wlock_acquire()
-        self.flush()
-        new_sstable = self.merge()
-        iterator = new_sstable.diskiterator()
-        self.rwlock.wlock_release()
-        return iterator
+        try:
+            if self.mem_table.get_size() > 0:
+                self._rotate_mem_table()
+            immutable_mem_tables = list(self.immutable_mem_tables)
+            ss_tables = list(self.ss_tables)
+            for ss_table in ss_tables:
+                # open the reader before a compaction can delete the file
+                ss_table.reader
+        finally:
+            self.rwlock.wlock_release()
+        sources = [mem_table.records
+                   for mem_table in reversed(immutable_mem_tables)]
+        sources += [ss_table.records for ss_table in reversed(ss_tables)]
+        return MergingIterator(sources)
 
     def remove(self, key: str) -> Any:
+        self._stall_writes()
+        self._wait_for_flush_slot()
         self.rwlock.wlock_acquire()
-        self.mem_table.remove(key)
-        self.rwlock.wlock_release()
-
-    def merge(self) -> SSTable:
-        time_stamp: dict = {}
-        temp_mem_store = InMemoryStore("temp")
-        for sstable in self.ss_tables:
-            iterator = sstable.disk_iterator
-            while iterator.valid():
-                iterator.next()
-                cur_key = iterator.key()
-                cur_time_stamp = iterator.timestamp()
-                if not iterator.is_removed:
-                    cur_val = iterator.value()
-                    if temp_mem_store.contain_key(cur_key):
-                        if cur_time_stamp > time_stamp[cur_key]:
-                            temp_mem_store.set(cur_key, cur_val)
-                            time_stamp[cur_key] = cur_time_stamp
-                    else:
-                        temp_mem_store.set(cur_key, cur_val)
-                        time_stamp[cur_key] = cur_time_stamp
-                else:
-                    if temp_mem_store.contain_key(cur_key):
-                        if cur_time_stamp > time_stamp[cur_key]:
-                            temp_mem_store.remove(cur_key)
-                            time_stamp[cur_key] = cur_time_stamp
-        new_sstable = self.create_sstable(temp_mem_store, time_stamp)
-        for i in self.ss_tables:
-            i.clean()
-        self.ss_tables = []
-        self.ss_tables.append(new_sstable)
-        self.id += 1
-        return new_sstable
+        try:
+            wal, sequence = self._log(key, None)
+            memory_usage = self.mem_table.get_memory_usage()
+            self.mem_table.remove(key)
+            if self.row_cache is not None:
+                self.row_cache.invalidate(key)
+            self._charge_memory(self.mem_table.get_memory_usage() -
+                                memory_usage)
+        finally:
+            self.rwlock.wlock_release()
+        if wal is not None:
+            wal.sync(sequence)
+        self._enforce_memory_budget()
+
+    def merge(self) -> Union[SSTable, None]:
+        """
+        merge every sstable into the deepest level in use, dropping
+        removed keys. the merged sstables are split at target_file_size if
+        the compaction strategy splits its outputs. mem_table is not
+        flushed
+        :return: the first merged sstable, None if no live key is left
+        """
+        with self.compaction_lock:
+            ss_tables = self._snapshot_sstables()
+            if not ss_tables:
+                return None
+            level = max([1] + [ss_table.level for ss_table in ss_tables])
+            outputs = self._run_compaction(Compaction(ss_tables, level))
+        return outputs[0] if outputs else None
+
+    def compact(self) -> None:
+        """
+        run compactions in the calling thread until the compaction
+        strategy finds no level that needs one
+        :return: None
+        """
+        while self._compact_once():
+            pass
+
+    def _snapshot_sstables(self) -> List[SSTable]:
+        self.rwlock.rlock_acquire()
+        try:
+            return list(self.ss_tables)
+        finally:
+            self.rwlock.rlock_release()
+
+    def _schedule_compaction(self) -> None:
+        """
+        wake up the compaction thread, starting it if it is not running,
+        to compact until no level needs it
+        :return: None
+        """
+        with self.compaction_condition:
+            self.compaction_pending = True
+            if self.compaction_thread is None:
+                self.compaction_closing = False
+                self.compaction_thread = threading.Thread(
+                    target=self._compaction_worker,
+                    name="compaction-" + self.store_name, daemon=True)
+                self.compaction_thread.start()
+            self.compaction_condition.notify_all()
+
+    def _compaction_worker(self) -> None:
+        """
+        body of the compaction thread. it runs one compaction at a time
+        while the strategy picks one, then waits for the next flush. a
+        failed compaction leaves the sstables as they were, the error is
+        kept in compaction_error and raised by close(), and the thread
+        stops until the next flush starts it again
+        :return: None
+        """
+        while True:
+            with self.compaction_condition:
+                while not self.compaction_pending and \
+                        not self.compaction_closing:
+                    self.compaction_condition.wait()
+                if self.compaction_closing:
+                    self.compaction_thread = None
+                    return
+                self.compaction_pending = False
+            try:
+                while self.auto_compaction and \
+                        not self.compaction_closing and \
+                        self._compact_once():
+                    pass
+            except Exception as e:
+                with self.compaction_condition:
+                    self.compaction_error = e
+                    self.compaction_thread = None
+                self._notify_stalled_writers()
+                return
+
+    def _check_compaction_error(self) -> None:
+        with self.compaction_condition:
+            error = self.compaction_error
+            self.compaction_error = None
+        if error is not None:
+            raise StorageException(ErrorType.IO_ERROR,
+                                   "Compaction failed: " + str(error))
+
+    def _compact_once(self) -> bool:
+        """
+        :return: True if the compaction strategy picked a compaction and
+        it ran, False if no level needs one
+        """
+        with self.compaction_lock:
+            compaction = self.compaction_strategy.pick(
+                self._snapshot_sstables())
+            if compaction is None:
+                return False
+            self._run_compaction(compaction)
+            return True
+
+    def _run_compaction(self, compaction: Compaction) -> List[SSTable]:
+        """
+        the caller must hold compaction_lock.
+        merge the input sstables into sstables of the output level and
+        install them in place of the inputs. the inputs are streamed
+        through merge_records into the new sstables, which hold one
+        record per input and the block being written in memory. the
+        newest version of every key is kept, removed keys are dropped
+        when no other sstable can hold an older version. the merged
+        sstables take the place of the newest input in the age order of
+        the output level. a trivial move only changes the level. a large
+        compaction is merged in key ranges by worker processes, see
+        set_max_subcompactions
+        :param compaction: the inputs and the output level
+        :return: the sstables that replaced the inputs
+        """
+        inputs = compaction.inputs
+        output_level = compaction.output_level
+        if compaction.is_trivial_move():
+            ss_table = inputs[0]
+            with self.flush_lock:
+                level = ss_table.level
+                ss_table.level = output_level
+                try:
+                    self._save_sstables(self.ss_tables)
+                except Exception:
+                    ss_table.level = level
+                    raise
+                self.rwlock.wlock_acquire()
+                try:
+                    self.ss_tables = self._sorted_sstables(self.ss_tables)
+                finally:
+                    self.rwlock.wlock_release()
+            self.compaction_count += 1
+            return [ss_table]
+        newest = self._sorted_sstables(inputs)[-1]
+        drop_removed = not self._has_older_versions(inputs, newest)
+        input_size = sum(ss_table.size for ss_table in inputs)
+        count = min(self.max_subcompactions,
+                    input_size // self.target_file_size)
+        if count > 1 and self.compaction_strategy.SPLIT_OUTPUTS:
+            outputs = self._run_subcompactions(inputs, output_level,
+                                               drop_removed, count)
+        else:
+            # newest first, so merge_records keeps the newest version.
+            # the inputs are read past the block cache, which keeps
+            # serving gets
+            sources = [partial(ss_table.records, fill_cache=False)
+                       for ss_table in
+                       reversed(self._sorted_sstables(inputs))]
+            records = merge_records(sources)
+            if drop_removed:
+                records = (record for record in records
+                           if record[1] is not None)
+            target_file_size = self.target_file_size \
+                if self.compaction_strategy.SPLIT_OUTPUTS else None
+            outputs = self._write_sstables(
+                records, output_level, target_file_size,
+                self._output_num_keys(inputs, target_file_size))
+        for output in outputs:
+            output.sequence = newest.sequence
+            self.compaction_bytes += output.size
+        self._install_sstables(inputs, outputs)
+        self.compaction_count += 1
+        return outputs
+
+    def _run_subcompactions(self, inputs: List[SSTable], level: int,
+                            drop_removed: bool, count: int) \
+            -> List[SSTable]:
+        """
+        the caller must hold compaction_lock.
+        split the keys of the inputs at block boundaries into count ranges
+        and merge every range in a worker process. each range gets enough
+        ids for the outputs of the whole compaction, so it never runs out.
+        the workers write at an equal share of the current rate of the
+        rate limiter. if a range fails the sstables of every range are
+        deleted
+        :param inputs: the sstables to merge
+        :param level: the level of the merged sstables
+        :param drop_removed: True to leave removed keys out
+        :param count: the number of key ranges wanted
+        :return: the merged sstables in key order, not installed
+        """
+        ordered = list(reversed(self._sorted_sstables(inputs)))
+        keys: List[Union[str, None]] = [None]
+        keys.extend(split_keys(ordered, count))
+        keys.append(None)
+        input_size = sum(ss_table.size for ss_table in inputs)
+        num_ids = input_size // self.target_file_size + 1
+        bytes_per_second = self.rate_limiter.get_stats()["bytes_per_second"]
+        if bytes_per_second > 0:
+            bytes_per_second = max(bytes_per_second // (len(keys) - 1), 1)
+        subcompactions = [Subcompaction(
+            self.store_name, self.path,
+            [(ss_table.id, ss_table.size, ss_table.index_table,
+              ss_table.last_index) for ss_table in ordered],
+            keys[i], keys[i + 1], drop_removed,
+            [self._new_id() for _ in range(num_ids)],
+            self.target_file_size,
+            self._output_num_keys(inputs, self.target_file_size),
+            self.block_size, self.restart_interval, self.compression,
+            self.bloom_bits_per_key, self._sync_files(), bytes_per_second)
+            for i in range(len(keys) - 1)]
+        if self.subcompaction_executor is None:
+            # spawned workers start from a fresh interpreter and inherit
+            # no lock held by the threads of the store
+            self.subcompaction_executor = ProcessPoolExecutor(
+                self.max_subcompactions, multiprocessing.get_context("spawn"))
+        futures = []
+        outputs: List[SSTable] = []
+        error: Union[Exception, None] = None
+        try:
+            for subcompaction in subcompactions:
+                futures.append(self.subcompaction_executor.submit(
+                    run_subcompaction, subcompaction))
+        except Exception as e:
+            error = e
+        for future in futures:
+            try:
+                results = future.result()
+            except Exception as e:
+                error = e
+                continue
+            for id, size, key_range, num_keys in results:
+                ss_table = SSTable(self.store_name, id, size, [], self.path,
+                                   0, self.block_cache)
+                ss_table.level = level
+                ss_table.set_key_range(key_range)
+                ss_table.num_keys = num_keys
+                outputs.append(ss_table)
+        if error is not None:
+            if isinstance(error, BrokenProcessPool) or \
+                    len(futures) < len(subcompactions):
+                # a pool that lost a worker process fails every later
+                # submit, the next compaction starts a new one
+                self.subcompaction_executor.shutdown(wait=False)
+                self.subcompaction_executor = None
+            # a killed worker leaves its unfinished file behind
+            for subcompaction in subcompactions:
+                for id in subcompaction.ids:
+                    SSTable(self.store_name, id, 0, [], self.path, 0,
+                            self.block_cache).clean()
+            raise error
+        self.subcompaction_count += len(subcompactions)
+        return outputs
+
+    def _has_older_versions(self, inputs: List[SSTable],
+                            newest: SSTable) -> bool:
+        """
+        :param inputs: the inputs of a compaction
+        :param newest: the input get searches first
+        :return: True if an sstable that is not an input may hold an
+        older version of a key of the inputs: it is searched after the
+        newest input and its keys overlap the keys of the inputs
+        """
+        key_ranges = [key_range for key_range in
+                      (ss_table.key_range() for ss_table in inputs)
+                      if key_range is not None]
+        if not key_ranges:
+            return False
+        smallest = min(key_range[0] for key_range in key_ranges)
+        largest = max(key_range[1] for key_range in key_ranges)
+        ss_tables = self._snapshot_sstables()
+        older = ss_tables[:ss_tables.index(newest)]
+        return any(ss_table.overlaps(smallest, largest)
+                   for ss_table in older if ss_table not in inputs)
+
+    def _output_num_keys(self, inputs: List[SSTable],
+                         target_file_size: Union[int, None]) -> int:
+        """
+        the bloom filter of a merged sstable is sized before its keys are
+        known. a single output gets at most the keys of all inputs. a
+        split output holds about target_file_size bytes and one block, it
+        gets the keys of as many input bytes, at most the keys of all
+        inputs
+        :param inputs: the inputs of a compaction
+        :param target_file_size: bytes of a merged sstable, None for a
+        single output
+        :return: the number of keys the bloom filter of an output is sized
+        for
+        """
+        num_keys = sum(ss_table.count_keys() for ss_table in inputs)
+        input_size = sum(ss_table.size for ss_table in inputs)
+        if target_file_size is None or input_size == 0:
+            return num_keys
+        return min(num_keys, -(-num_keys * (target_file_size +
+                                            self.block_size) // input_size))
+
+    def _write_sstables(self, records: Iterable[Tuple[Any, ...]],
+                        level: int, target_file_size: Union[int, None],
+                        num_keys: int) -> List[SSTable]:
+        """
+        write records into new v2 sstables of level, starting a new one
+        whenever one reaches target_file_size bytes. if writing fails the
+        unfinished file and the finished sstables are deleted
+        :param records: tuples (key, value, timestamp) in key order,
+        value None for a removed key
+        :param level: the level of the new sstables
+        :param target_file_size: bytes of a new sstable, None writes one
+        sstable
+        :param num_keys: the number of keys the bloom filter of a new
+        sstable is sized for
+        :return: the new sstables in key order
+        """
+        outputs: List[SSTable] = []
+        builder = None
+        id = 0
+        try:
+            for key, value, time_stamp in records:
+                if builder is None:
+                    id = self._new_id()
+                    builder = self._sstable_builder(id, num_keys)
+                builder.add(key, value, time_stamp)
+                if target_file_size is not None and \
+                        builder.offset >= target_file_size:
+                    outputs.append(self._finish_sstable(builder, id, level))
+                    builder = None
+            if builder is not None:
+                outputs.append(self._finish_sstable(builder, id, level))
+        except Exception:
+            if builder is not None:
+                builder.abandon()
+            for ss_table in outputs:
+                ss_table.clean()
+            raise
+        return outputs
+
+    def _finish_sstable(self, builder: SSTableBuilder, id: int,
+                        level: int) -> SSTable:
+        """
+        :return: the sstable builder wrote, in level
+        """
+        size = builder.finish()
+        ss_table = SSTable(self.store_name, id, size, [], self.path, 0,
+                           self.block_cache)
+        ss_table.level = level
+        ss_table.set_key_range(builder.key_range())
+        ss_table.num_keys = builder.num_records
+        return ss_table
+
+    def _install_sstables(self, inputs: List[SSTable],
+                          outputs: List[SSTable]) -> None:
+        """
+        replace the input sstables with the output sstables in the
+        manifest and in ss_tables, then delete the input files. iterators
+        that still read an input keep its memory maps
+        :return: None
+        """
+        with self.flush_lock:
+            ss_tables = self._sorted_sstables(
+                [ss_table for ss_table in self.ss_tables
+                 if ss_table not in inputs] + outputs)
+            try:
+                self._save_sstables(ss_tables)
+            except Exception:
+                for ss_table in outputs:
+                    ss_table.clean()
+                raise
+            self.rwlock.wlock_acquire()
+            try:
+                self.ss_tables = ss_tables
+            finally:
+                self.rwlock.wlock_release()
+        self._notify_stalled_writers()
+        for ss_table in inputs:
+            ss_table.clean()
+
+    def _save_sstables(self, ss_tables: List[SSTable]) -> None:
+        """
+        the caller must hold flush_lock
+        :param ss_tables: the live sstables to write to the manifest
+        :return: None
+        """
+        self.manifest.save(self.id, ss_tables, self._sync_files())
+
+    @staticmethod
+    def _sorted_sstables(ss_tables: List[SSTable]) -> List[SSTable]:
+        """
+        :return: ss_tables in the order get searches them from the back:
+        deeper levels first, oldest first within a level. the sstables
+        merged from one run share their sequence and have disjoint keys
+        """
+        return sorted(ss_tables, key=lambda ss_table: (
+            -ss_table.level, ss_table.sequence, ss_table.id))
 
     def _flush_mem_to_disk(self, mem_table: InMemoryStore,
-                           time_stamp: dict) -> int:
+                           time_stamp: dict, id: int) -> int:
         """
-        flush memory table into disk
+        flush memory table into a v2 sstable file and its bloom file,
+        written by SSTableBuilder, see doc/table_format.md
         :param mem_table: table in memory
         :param time_stamp: the time stamp corresponding to data in mem_table,
-        if the mem_table is the newest mem_table, time stamp is empty.
-        index_table: in memory
-        data : tuple (key, offset in index_file for the key)
-        sstable_file: in disk
-        data: key_size(4 byte) + key + value_size(4 byte) +
-        value + time_stamp(8 byte)
-        index_file: in memory
-        data: key_size(4 byte) + key + offset(4 byte)
+        if the mem_table is the newest mem_table, time stamp is empty and
+        every record gets the time of the flush
+        :param id: id of the new sstable
         :return: size of sstable file
         """
+        return self._write_sstable(
+            self._mem_table_records(mem_table, time_stamp),
+            mem_table.length(), id)[0]
+
+    @staticmethod
+    def _mem_table_records(mem_table: InMemoryStore, time_stamp: dict) \
+            -> Iterator[Tuple[str, Union[str, None], int]]:
+        """
+        :return: the records of mem_table in key order as tuples (key,
+        value, timestamp), value None for a removed key. without
+        time_stamp every record gets the time of the call
+        """
+        flush_time = int(time() * 1000000)
         iterator = mem_table.iterator()
-        ss_table_file_name = self.store_name + str(self.id) + ".ss"
-        index_file_name = self.store_name + str(self.id) + ".index"
-        ss_table_file = open(os.path.join(self.ss_table_dir,
-                                          ss_table_file_name), "wb+")
-        index_file = open(os.path.join(self.index_dir, index_file_name), "wb+")
-        offset = 0
-        key_index = 0
-        key_size = 0
-        interval = self._index_interval(self.mem_table.get_size())
-        index_offset = 0
         while iterator.valid():
             iterator.next()
             key = iterator.key()
-            removed = iterator.is_removed()
-            if key_index % interval == 0:
-                self.index_table.append((key, pack("i", index_offset)))
-            key_size = len(key.encode())
-            bin_key_size = pack("i", key_size)
-            bin_offset = pack("i", offset)
-            index_file.write(bin_key_size)
-            index_file.write(key.encode())
-            index_file.write(bin_offset)
-            index_offset += self.INT_SIZE + key_size + self.INT_SIZE
-            if removed:
-                ss_table_file.write(b'\x00\x00\x00\x00')
-                ss_table_file.write(bin_key_size)
-                ss_table_file.write(key.encode())
-                offset += self.INDICATOR_SIZE + self.INT_SIZE + key_size \
-                    + self.TIMESTAMP_SIZE
-            else:
-                value = iterator.value()
-                print(value)
-                val_size = len(value.encode())
-                bin_val_size = pack("i", val_size)
-                ss_table_file.write(b'\x01\x00\x00\x00')
-                ss_table_file.write(bin_key_size)
-                ss_table_file.write(key.encode())
-                ss_table_file.write(bin_val_size)
-                ss_table_file.write(value.encode())
-                offset += self.INDICATOR_SIZE + self.INT_SIZE + key_size + \
-                    self.INT_SIZE + val_size + self.TIMESTAMP_SIZE
-            if len(time_stamp) != 0:
-                ss_table_file.write(time_stamp[key])
-            else:
-                timestamp = int(time() * 1000000)
-                bin_timestamp = pack("q", timestamp)
-                ss_table_file.write(bin_timestamp)
-            key_index += 1
-        self.last_index = index_offset - self.INT_SIZE - \
-            key_size - self.INT_SIZE
-        index_file.close()
-        ss_table_file.close()
-        return offset
+            value = None if iterator.is_removed() else iterator.value()
+            yield key, value, time_stamp[key] if time_stamp else flush_time
 
-    def _flush_to_disk(self) -> int:
+    def _write_sstable(self, records: Iterable[
+            Tuple[str, Union[str, None], int]], num_keys: int,
+            id: int) -> Tuple[int, Union[Tuple[str, str], None]]:
         """
-        flush self.mem_table to disk
-        :return: size of new created sstable file
+        write records into a new v2 sstable. the unfinished file is
+        deleted if writing fails
+        :param records: tuples (key, value, timestamp) in key order,
+        value None for a removed key
+        :param num_keys: the number of records, sizes the bloom filter
+        :param id: id of the new sstable
+        :return: tuple (size of sstable file, (smallest key, largest key)),
+        the key range is None if there are no records
         """
-        return self._flush_mem_to_disk(self.mem_table, {})
+        builder = self._sstable_builder(id, num_keys)
+        try:
+            for key, value, time_stamp in records:
+                builder.add(key, value, time_stamp)
+            return builder.finish(), builder.key_range()
+        except Exception:
+            builder.abandon()
+            raise
 
-    def _index_interval(self, size) -> int:
+    def _sstable_builder(self, id: int, num_keys: int) -> SSTableBuilder:
         """
-        :param size: size of a in memory table
-        :return: the index interval calculated based on index_ratio
+        :param id: id of the new sstable
+        :param num_keys: the number of records, or an estimate of it,
+        sizes the bloom filter
+        :return: a builder of a new v2 sstable with the settings of the
+        store
+        """
+        return SSTableBuilder(self.store_name, id, self.path,
+                              self.block_size, self.restart_interval,
+                              self.compression, self.bloom_bits_per_key,
+                              num_keys, self._sync_files(),
+                              self.rate_limiter)
+
+    def _flush_to_disk(self) -> int:
+        """
+        flush self.mem_table to disk
+        :return: size of new created sstable file
         """
-        if size == 0:
-            return 0
-        index_counter = size * self.index_ratio
-        interval = size / index_counter
-        return interval
+        return self._flush_mem_to_disk(self.mem_table, {}, self._new_id())
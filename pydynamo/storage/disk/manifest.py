@@ -0,0 +1,100 @@
+from ..error import StorageException
+from ..error import ErrorType
+from .sstable import SSTable
+from struct import pack, unpack
+from typing import Any, Dict, List, Tuple
+import json
+import os
+
+
+class Manifest(object):
+    """
+    The list of live sstables of a store, kept in path/store_name/MANIFEST
+    as json:
+    {"version": 1, "next_id": id the next sstable gets,
+     "sstables": [{"id", "size", "last_index", "level", "sequence",
+                   "key_range", "num_keys", "index_table"}, ...]}
+    sstables are listed in the order the store searches them from the
+    back: deeper levels first, oldest first within a level. key_range is
+    [smallest key, largest key], null for a sstable without records.
+    num_keys is the number of records, null if it is not known.
+    index_table is the in-memory index of a v1 sstable as [key, offset]
+    pairs, empty for v2 sstables, whose block index is in the sstable
+    file. The file is replaced atomically:
+    the new manifest is written to MANIFEST.tmp and renamed over the old
+    one, so a crash leaves either the old or the new list.
+    """
+    VERSION = 1
+    FILE_NAME = "MANIFEST"
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: the path of the store
+        """
+        self.path = path
+        self.file_path = os.path.join(path, self.FILE_NAME)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.file_path)
+
+    def load(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        :return: tuple (next_id, sstables), one dict per live sstable with
+        id, size, last_index, level, sequence, key_range, num_keys and
+        index_table
+        """
+        try:
+            with open(self.file_path, "r") as file:
+                manifest = json.load(file)
+        except ValueError as e:
+            raise StorageException(ErrorType.IO_ERROR,
+                                   "The manifest is corrupted: " + str(e))
+        if manifest.get("version") != self.VERSION:
+            raise StorageException(ErrorType.IO_ERROR,
+                                   "Unknown manifest version " +
+                                   str(manifest.get("version")))
+        ss_tables = manifest["sstables"]
+        for ss_table in ss_tables:
+            ss_table["index_table"] = [
+                (key, pack("i", offset))
+                for key, offset in ss_table["index_table"]]
+            if ss_table.get("key_range") is not None:
+                ss_table["key_range"] = tuple(ss_table["key_range"])
+        return manifest["next_id"], ss_tables
+
+    def save(self, next_id: int, ss_tables: List[SSTable],
+             sync: bool = False) -> None:
+        """
+        replace the manifest with the list of ss_tables
+        :param next_id: the id the next sstable gets
+        :param ss_tables: the live sstables in search order
+        :param sync: fsync the manifest and the store directory
+        :return: None
+        """
+        manifest = {
+            "version": self.VERSION,
+            "next_id": next_id,
+            "sstables": [{
+                "id": ss_table.id,
+                "size": ss_table.size,
+                "last_index": ss_table.last_index,
+                "level": ss_table.level,
+                "sequence": ss_table.sequence,
+                "key_range": ss_table.key_range(),
+                "num_keys": ss_table.num_keys,
+                "index_table": [[key, unpack("i", offset)[0]]
+                                for key, offset in ss_table.index_table]
+            } for ss_table in ss_tables]}
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(manifest, file)
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp_path, self.file_path)
+        if sync:
+            directory = os.open(self.path, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
@@ -0,0 +1,69 @@
+from ..error import StorageException
+from typing import List
+import threading
+
+
+class MemoryBudget(object):
+    """
+    One memory limit shared by the memory tables of several stores.
+    Stores charge the change of their memory table memory after every
+    write. When the total goes over the limit, the store with the largest
+    memory table is flushed first, until the total fits again.
+    """
+
+    def __init__(self, limit: int) -> None:
+        """
+        :param limit: bytes all registered memory tables may use together
+        """
+        self.limit = limit
+        self.usage = 0
+        self.stores: List = []
+        self.lock = threading.Lock()
+
+    def register(self, store) -> None:
+        """
+        :param store: a store that charges this budget, it must provide
+        get_memory_usage() and flush()
+        :return: None
+        """
+        with self.lock:
+            self.stores.append(store)
+
+    def charge(self, delta: int) -> None:
+        """
+        :param delta: change of memory usage in bytes, negative when
+        a memory table is flushed
+        :return: None
+        """
+        with self.lock:
+            self.usage += delta
+
+    def get_usage(self) -> int:
+        return self.usage
+
+    def enforce(self) -> None:
+        """
+        flush the largest memory tables until the usage is within limit.
+        it must be called without holding the lock of any store.
+        a store whose flush fails is skipped instead of raising into the
+        caller, which may be a writer of another store. the failed
+        mem_table stays pending and that store retries it on its next write
+        :return: None
+        """
+        failed: List = []
+        while True:
+            with self.lock:
+                if self.usage <= self.limit:
+                    return
+                candidates = [store for store in self.stores
+                              if store not in failed]
+                if not candidates:
+                    return
+                largest = max(candidates,
+                              key=lambda store: store.get_memory_usage())
+            if largest.get_memory_usage() == 0:
+                return
+            try:
+                largest.flush()
+            except StorageException:
+                failed.append(largest)
@@ -0,0 +1,134 @@
+from ..error import StorageException
+from ..error import ErrorType
+from ..iterator import Iterator
+from bisect import bisect_left
+from heapq import heapify, heappop, heappush
+from itertools import islice
+from typing import Any, Callable, Iterable, List, Sequence, Tuple, Union
+import typing
+
+# a record starts with key and value, value is None for a removed key
+Record = Tuple[Any, ...]
+# a source returns its records in key order from the first key that is
+# not less than the start key, or from the first key for None
+Source = Callable[[Union[str, None]], Iterable[Record]]
+
+
+def list_source(records: List[Record]) -> Source:
+    """
+    :param records: records in key order
+    :return: a source of the records
+    """
+    keys = [record[0] for record in records]
+
+    def source(start_key: Union[str, None]) -> Iterable[Record]:
+        start = 0 if start_key is None else bisect_left(keys, start_key)
+        return islice(records, start, None)
+    return source
+
+
+def merge_records(sources: Sequence[Source],
+                  start_key: Union[str, None] = None) \
+        -> typing.Iterator[Record]:
+    """
+    k-way merge of sorted sources with a heap of their next records
+    :param sources: the sources, newest first: for a key in several
+    sources the record of the first one is the current version
+    :param start_key: start at the first key not less than start_key,
+    None starts at the first key
+    :return: the current record of every key in key order, removed keys
+    included. a record is read from its source when the merge reaches it
+    """
+    heap: List[Tuple[str, int, Record, typing.Iterator[Record]]] = []
+    for rank, source in enumerate(sources):
+        records = iter(source(start_key))
+        record = next(records, None)
+        if record is not None:
+            heap.append((record[0], rank, record, records))
+    heapify(heap)
+    last_key = None
+    while heap:
+        key, rank, record, records = heappop(heap)
+        following = next(records, None)
+        if following is not None:
+            heappush(heap, (following[0], rank, following, records))
+        # equal keys leave the heap newest first
+        if key != last_key:
+            last_key = key
+            yield record
+
+
+class MergingIterator(Iterator):
+    """
+    Iterator over the live keys of several sorted sources, such as the
+    mem_tables and sstables of a store. The sources are merged by
+    merge_records: a key takes its value from the newest source that has
+    it and removed keys are skipped, so a full scan reads every record of
+    every source once and a partial scan reads about as many records as
+    it returns. seek restarts the merge at the key.
+    """
+
+    def __init__(self, sources: Sequence[Source]) -> None:
+        """
+        :param sources: the sources, newest first
+        """
+        self.sources = sources
+        self.records: typing.Iterator[Record] = iter(())
+        self.current: Union[Record, None] = None
+        self.peeked: Union[Record, None] = None
+        self.seek_to_first()
+
+    def seek(self, key: str) -> None:
+        """
+        :param key: the key the iterator will point to
+        :return: None
+        """
+        self.records = merge_records(self.sources, key)
+        self.peeked = None
+        found = self._peek()
+        if found is None or found[0] != key:
+            self.seek_to_first()
+            raise StorageException(ErrorType.NOT_FOUND,
+                                   "This key cannot be found in store.")
+        self.next()
+
+    def seek_to_first(self) -> None:
+        self.records = merge_records(self.sources)
+        self.current = None
+        self.peeked = None
+
+    def valid(self) -> bool:
+        return self._peek() is not None
+
+    def next(self) -> None:
+        peeked = self._peek()
+        if peeked is None:
+            raise StorageException(ErrorType.NONE_POINTER,
+                                   "There is no next")
+        self.current = peeked
+        self.peeked = None
+
+    def _peek(self) -> Union[Record, None]:
+        """
+        :return: the next live record, None if there is none
+        """
+        if self.peeked is None:
+            for record in self.records:
+                if record[1] is not None:
+                    self.peeked = record
+                    break
+        return self.peeked
+
+    def value(self) -> str:
+        if self.current is None:
+            raise StorageException(ErrorType.NONE_POINTER,
+                                   "This object is None and "
+                                   "it has no attribute value.")
+        return self.current[1]
+
+    def key(self) -> str:
+        if self.current is None:
+            raise StorageException(ErrorType.NONE_POINTER,
+                                   "This object is None and "
+                                   "it has no attribute key.")
+        return self.current[0]
@@ -0,0 +1,182 @@
+from ..error import StorageException
+from ..error import ErrorType
+from time import monotonic, sleep
+from typing import Any, Dict, List, Union
+import threading
+
+
+class RateLimiter(object):
+    """
+    A token bucket for the bytes background writers, flushes and
+    compactions, write to disk, shared by the stores of an engine. Tokens
+    are added at bytes_per_second up to burst_seconds worth of them. A
+    writer takes the tokens for a write before making it and sleeps while
+    the bucket is in debt, so writers that share the limiter together
+    write about bytes_per_second. 0 bytes per second does not limit.
+    In auto mode the stores report the latency of their gets. Every
+    tune_period seconds the limiter compares the 99th percentile of the
+    reported latencies with read_latency_slo: above it the rate is
+    halved, down to min_bytes_per_second, below half of it the rate grows
+    by a quarter, up to bytes_per_second.
+    """
+    MAX_SAMPLES = 10000
+
+    def __init__(self, bytes_per_second: int = 0,
+                 burst_seconds: float = 0.1,
+                 read_latency_slo: Union[float, None] = None,
+                 min_bytes_per_second: int = 1024 * 1024,
+                 tune_period: float = 1.0) -> None:
+        """
+        :param bytes_per_second: bytes background writers may write per
+        second, the largest rate of auto mode. 0 does not limit
+        :param burst_seconds: the bucket holds the tokens of this many
+        seconds, written without waiting after the writers were idle
+        :param read_latency_slo: seconds the 99th percentile of get
+        latency should stay under, None turns auto mode off
+        :param min_bytes_per_second: the smallest rate of auto mode
+        :param tune_period: seconds between two adjustments of auto mode
+        """
+        if bytes_per_second < 0 or burst_seconds <= 0 or \
+                min_bytes_per_second < 1 or tune_period <= 0 or \
+                (read_latency_slo is not None and read_latency_slo <= 0):
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid.")
+        self.lock = threading.Lock()
+        self.burst_seconds = burst_seconds
+        self.max_bytes_per_second = bytes_per_second
+        self.bytes_per_second = bytes_per_second
+        self.tokens = bytes_per_second * burst_seconds
+        self.last_refill = monotonic()
+        self.read_latency_slo = read_latency_slo
+        self.min_bytes_per_second = min_bytes_per_second
+        self.tune_period = tune_period
+        self.last_tune = self.last_refill
+        self.latencies: List[float] = []
+        self.read_p99 = 0.0
+        self.requested_bytes = 0
+        self.wait_seconds = 0.0
+        self.waits = 0
+
+    def set_bytes_per_second(self, bytes_per_second: int) -> None:
+        """
+        change the rate, writers that are already sleeping finish their
+        sleep. in auto mode this is the largest rate
+        :param bytes_per_second: bytes background writers may write per
+        second, 0 does not limit
+        :return: None
+        """
+        if bytes_per_second < 0:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid. "
+                                   "It should be at least 0")
+        with self.lock:
+            self._refill(monotonic())
+            self.max_bytes_per_second = bytes_per_second
+            self.bytes_per_second = bytes_per_second
+            self.tokens = min(self.tokens,
+                              bytes_per_second * self.burst_seconds)
+
+    def set_read_latency_slo(self,
+                             read_latency_slo: Union[float, None]) -> None:
+        """
+        :param read_latency_slo: seconds the 99th percentile of get
+        latency should stay under, None turns auto mode off and goes back
+        to the largest rate
+        :return: None
+        """
+        if read_latency_slo is not None and read_latency_slo <= 0:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "This input is not valid. "
+                                   "It should be positive")
+        with self.lock:
+            self.read_latency_slo = read_latency_slo
+            self.latencies = []
+            self.last_tune = monotonic()
+            if read_latency_slo is None:
+                self.bytes_per_second = self.max_bytes_per_second
+
+    def is_auto(self) -> bool:
+        """
+        :return: True if the stores should report their get latency
+        """
+        return self.read_latency_slo is not None
+
+    def request(self, num_bytes: int) -> None:
+        """
+        take the tokens for a write of num_bytes, sleeping until the
+        bucket is out of debt
+        :param num_bytes: bytes about to be written
+        :return: None
+        """
+        with self.lock:
+            now = monotonic()
+            self._tune(now)
+            self.requested_bytes += num_bytes
+            rate = self.bytes_per_second
+            if rate == 0:
+                return
+            self._refill(now)
+            self.tokens -= num_bytes
+            wait = -self.tokens / rate if self.tokens < 0 else 0.0
+            if wait > 0:
+                self.wait_seconds += wait
+                self.waits += 1
+        if wait > 0:
+            sleep(wait)
+
+    def record_read_latency(self, seconds: float) -> None:
+        """
+        report the latency of a get in auto mode
+        :param seconds: time the get took
+        :return: None
+        """
+        with self.lock:
+            if len(self.latencies) < self.MAX_SAMPLES:
+                self.latencies.append(seconds)
+            self._tune(monotonic())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        :return: the current and largest rate, whether auto mode is on,
+        the last 99th percentile of get latency, the bytes requested and
+        the number and seconds of waits
+        """
+        with self.lock:
+            return {"bytes_per_second": self.bytes_per_second,
+                    "max_bytes_per_second": self.max_bytes_per_second,
+                    "auto": self.read_latency_slo is not None,
+                    "read_p99": self.read_p99,
+                    "requested_bytes": self.requested_bytes,
+                    "waits": self.waits,
+                    "wait_seconds": self.wait_seconds}
+
+    def _refill(self, now: float) -> None:
+        """
+        the caller must hold lock
+        """
+        rate = self.bytes_per_second
+        self.tokens = min(self.tokens + (now - self.last_refill) * rate,
+                          rate * self.burst_seconds)
+        self.last_refill = now
+
+    def _tune(self, now: float) -> None:
+        """
+        the caller must hold lock. adjust the rate in auto mode once
+        tune_period has passed since the last adjustment
+        """
+        slo = self.read_latency_slo
+        if slo is None or now - self.last_tune < self.tune_period or \
+                self.max_bytes_per_second == 0:
+            return
+        self._refill(now)
+        self.last_tune = now
+        latencies = sorted(self.latencies)
+        self.latencies = []
+        self.read_p99 = latencies[len(latencies) * 99 // 100] \
+            if latencies else 0.0
+        rate = self.bytes_per_second
+        if self.read_p99 > slo:
+            rate = max(rate // 2, self.min_bytes_per_second)
+        elif self.read_p99 < slo / 2:
+            rate = rate + rate // 4 + 1
+        self.bytes_per_second = min(rate, self.max_bytes_per_second)
@@ -0,0 +1,70 @@
+from ..error import StorageException
+from ..error import ErrorType
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+import threading
+
+
+class RowCache(object):
+    """
+    A least recently used cache of the results of searching the sstables
+    of a store for a key: the value, or None if the key is removed or not
+    in any sstable. It holds at most capacity keys. The store invalidates
+    a key whenever it writes it, so a cached result is never older than
+    the sstables.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        """
+        :param capacity: number of keys the cache holds
+        """
+        if capacity < 1:
+            raise StorageException(ErrorType.INVALID_INPUT,
+                                   "The capacity should be at least 1.")
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.rows: "OrderedDict[str, Union[str, None]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Union[str, None]]:
+        """
+        :param key: the key to find
+        :return: tuple (found, value). found is False if key is not
+        cached, value is None if the sstables do not have a live value
+        """
+        with self.lock:
+            if key not in self.rows:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            self.rows.move_to_end(key)
+            return True, self.rows[key]
+
+    def put(self, key: str, value: Union[str, None]) -> None:
+        """
+        :param key: the key searched in the sstables
+        :param value: the value found, None if there is no live value
+        :return: None
+        """
+        with self.lock:
+            self.rows[key] = value
+            self.rows.move_to_end(key)
+            if len(self.rows) > self.capacity:
+                self.rows.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self.lock:
+            self.rows.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.rows.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        :return: hits, misses, number of cached keys and capacity
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self.rows), "capacity": self.capacity}
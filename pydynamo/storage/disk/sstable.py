@@ -3,21 +3,40 @@ from ..error import StorageException
 from ..error import ErrorType
 from .sstableiterator import SStableIterator
 from .diskiterator import DiskIterator
-from typing import List
+from .bloomfilter import BloomFilter
+from .sstablereader import SSTableReader
+from .blockreader import BlockSSTableReader
+from .blockcache import BlockCache
+from typing import Iterator, List, Tuple, Union
 import os
+import threading
 
 
 class SSTable(Store):
+    """
+    A sstable on disk. Opening it only keeps its id, size and index
+    parameters: the reader, with the block index of a v2 sstable, and the
+    bloom filter are loaded on first access, so a store with many sstables
+    opens without reading them. level is the compaction level the store
+    keeps the sstable in, 0 for a flushed mem_table. sequence orders the
+    sstables of a level by age: the id of a flushed sstable, the sequence
+    of the newest input for a merged one. num_keys is the number of
+    records, removed keys included, None until it is known.
+    """
+
     def __init__(self, store_name: str, store_id: int,
-                 size: int, index_table: List, path: str, last_index) -> None:
+                 size: int, index_table: List, path: str, last_index,
+                 block_cache: Union[BlockCache, None] = None) -> None:
         """
         :param store_name: name of the store this sstable belongs to
         :param store_id: id of the sstable
         :param size: size of sstable file
-        :param index_table: index table stored in memory
+        :param index_table: index table stored in memory, v1 sstable only
         :param path: the path the sstable and index files stored in
-        :param last_index: the offset of last
-        key-data-time set data in sstable file
+        :param last_index: the offset of last key-data-time set data
+        in index file, v1 sstable only
+        :param block_cache: cache of decoded data blocks shared with other
+        sstables, v2 sstable only
         """
         self.store_name = store_name
         self.id = store_id
@@ -25,10 +44,132 @@ class SSTable(Store):
         self.index_table = index_table
         self.path = path
         self.last_index = last_index
-        self.disk_iterator = self.iterator()
+        self.block_cache = block_cache
+        self.lock = threading.Lock()
+        self._reader: Union[SSTableReader, BlockSSTableReader, None] = None
+        self._bloom_filter: Union[BloomFilter, None] = None
+        self._bloom_filter_loaded = False
+        self._disk_iterator: Union[SStableIterator, None] = None
+        self.level = 0
+        self.sequence = store_id
+        self.num_keys: Union[int, None] = None
+        self._key_range: Union[Tuple[str, str], None] = None
+        self._key_range_loaded = False
+
+    def open(self) -> None:
+        """
+        load the reader and the bloom filter now, for a sstable that is
+        read right after it is written
+        :return: None
+        """
+        self.reader
+        self.bloom_filter
+
+    @property
+    def reader(self) -> Union[SSTableReader, BlockSSTableReader]:
+        """
+        :return: the reader of the sstable file, opened on first access
+        """
+        reader = self._reader
+        if reader is None:
+            with self.lock:
+                if self._reader is None:
+                    if BlockSSTableReader.is_block_file(
+                            BlockSSTableReader.file_path(
+                                self.store_name, self.id, self.path)):
+                        self._reader = BlockSSTableReader(
+                            self.store_name, self.id, self.path,
+                            self.block_cache)
+                    else:
+                        self._reader = SSTableReader(
+                            self.store_name, self.id, self.path,
+                            self.index_table, self.last_index)
+                reader = self._reader
+        return reader
+
+    @property
+    def bloom_filter(self) -> Union[BloomFilter, None]:
+        """
+        :return: the bloom filter, loaded on first access, None if the
+        sstable was written without one
+        """
+        if not self._bloom_filter_loaded:
+            with self.lock:
+                if not self._bloom_filter_loaded:
+                    self._bloom_filter = self._load_bloom_filter()
+                    self._bloom_filter_loaded = True
+        return self._bloom_filter
+
+    @property
+    def disk_iterator(self) -> SStableIterator:
+        """
+        :return: the iterator get and get_timestamp move, created on first
+        access
+        """
+        if self._disk_iterator is None:
+            self._disk_iterator = self.iterator()
+        return self._disk_iterator
+
+    def key_range(self) -> Union[Tuple[str, str], None]:
+        """
+        :return: tuple (smallest key, largest key), None if the sstable
+        has no records. read from the sstable on first call unless
+        set_key_range gave it
+        """
+        if not self._key_range_loaded:
+            self.set_key_range(self.reader.key_range())
+        return self._key_range
+
+    def set_key_range(self, key_range: Union[Tuple[str, str], None]) \
+            -> None:
+        """
+        :param key_range: tuple (smallest key, largest key) known from the
+        manifest, None for a sstable without records
+        :return: None
+        """
+        self._key_range = key_range
+        self._key_range_loaded = True
+
+    def count_keys(self) -> int:
+        """
+        :return: num_keys, counted once by reading the records if the
+        sstable was written before the manifest kept it
+        """
+        if self.num_keys is None:
+            self.num_keys = sum(1 for _ in self.records(fill_cache=False))
+        return self.num_keys
+
+    def overlaps(self, smallest: str, largest: str) -> bool:
+        """
+        :return: True if a key of the sstable is in [smallest, largest]
+        """
+        key_range = self.key_range()
+        return key_range is not None and key_range[0] <= largest and \
+            smallest <= key_range[1]
 
     def contain(self, key: str) -> bool:
-        return self.disk_iterator.contain(key)
+        """
+        :param key: the key user intends to find in sstable
+        :return: True if key, removed or not, is in sstable.
+        the bloom filter answers most keys that are not in sstable
+        without reading the index file
+        """
+        if self.bloom_filter is not None and \
+                not self.bloom_filter.might_contain(key):
+            return False
+        return self.reader.find(key) is not None
+
+    def _load_bloom_filter(self) -> Union[BloomFilter, None]:
+        """
+        :return: the bloom filter stored next to the index file, None if
+        the sstable was written without one
+        """
+        bloom_path = os.path.join(self.path, "index",
+                                  self.store_name + str(self.id) + ".bloom")
+        if not os.path.exists(bloom_path):
+            return None
+        with open(bloom_path, "rb") as bloom_file:
+            return BloomFilter.from_bytes(bloom_file.read())
 
     def get(self, key: str) -> str:
         """
@@ -38,6 +179,25 @@ class SSTable(Store):
         self.disk_iterator.seek(key)
         return self.disk_iterator.value()
 
+    def lookup(self, key: str) -> Tuple[bool, bool, Union[str, None], int]:
+        """
+        find key with one index search and one decode of the memory
+        mapped sstable file, in a v2 sstable one data block is read.
+        it does not move disk_iterator, so concurrent readers can share
+        the sstable
+        :param key: the key user intends to find in sstable
+        :return: tuple (found, removed, value, timestamp). found is False
+        if key is not in sstable, value is None if key is removed
+        """
+        if self.bloom_filter is not None and \
+                not self.bloom_filter.might_contain(key):
+            return False, False, None, 0
+        found = self.reader.seek(key)
+        if found is None:
+            return False, False, None, 0
+        removed, _, value, time_stamp, _ = found[1]
+        return True, removed, value, time_stamp
+
     def get_timestamp(self, key: str) -> int:
         """
         :param key: the key user intends to find in sstable
@@ -54,20 +214,56 @@ class SSTable(Store):
         """
         :return: return a iterator of this sstable
         """
-        return SStableIterator(self.store_name,
-                               self.id, self.size, self.index_table,
-                               self.path, self.last_index)
+        return SStableIterator(self.reader, self.reader.data_size)
 
     def diskiterator(self):
-        return DiskIterator(self.store_name, self.id,
-                            self.size, self.index_table,
-                            self.path, self.last_index)
+        """
+        :return: return a iterator of this sstable that skips removed keys
+        """
+        return DiskIterator(self.reader, self.reader.data_size)
+
+    def records(self, start_key: Union[str, None] = None,
+                fill_cache: bool = True) \
+            -> Iterator[Tuple[str, Union[str, None], int]]:
+        """
+        :param start_key: the records start at the first key that is not
+        less than start_key, None starts at the first key
+        :param fill_cache: False reads the records without the block
+        cache
+        :return: the records in key order as tuples (key, value,
+        timestamp), value is None for a removed key. each record is
+        decoded when it is reached
+        """
+        reader = self.reader
+        if start_key is None:
+            if reader.data_size == 0:
+                return
+            record = reader.read_record(0, "", fill_cache)
+        else:
+            found = reader.lower_bound(start_key)
+            if found is None:
+                return
+            record = found[1]
+        while True:
+            _, key, value, time_stamp, next_offset = record
+            yield key, value, time_stamp
+            if next_offset >= reader.data_size:
+                return
+            record = reader.read_record(next_offset, key, fill_cache)
 
     def remove(self, key: str) -> None:
         raise StorageException(ErrorType.ACTION_FORBIDDEN,
                                "SSTable cannot be modified.")
 
     def clean(self) -> None:
+        """
+        delete the files of this sstable and drop its blocks from the
+        block cache. the memory maps of the reader stay valid for
+        iterators that are still in use
+        :return: None
+        """
+        if self._reader is not None:
+            self._reader.evict()
         ss_table_dir = os.path.join(self.path, "sstable")
         index_dir = os.path.join(self.path, "index")
         ss_table_file_name = self.store_name + str(self.id) + ".ss"
@@ -78,3 +274,7 @@ class SSTable(Store):
             os.remove(sstable_path)
         if os.path.exists(index_path):
             os.remove(index_path)
+        bloom_path = os.path.join(index_dir,
+                                  self.store_name + str(self.id) + ".bloom")
+        if os.path.exists(bloom_path):
+            os.remove(bloom_path)
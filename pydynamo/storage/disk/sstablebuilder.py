@@ -0,0 +1,224 @@
+from .blockreader import BlockSSTableReader, encode_varint
+from .bloomfilter import BloomFilter
+from .ratelimiter import RateLimiter
+from struct import Struct, pack
+from typing import List, Tuple, Union
+import os
+
+
+class SSTableBuilder(object):
+    """
+    Write one v2 sstable file, see doc/table_format.md, from records
+    added in key order. Records are serialized into a reused block
+    buffer, finished blocks are collected in an output buffer and written
+    in chunks of WRITE_BUFFER_SIZE bytes, so a flush makes a few large
+    write calls instead of several per record. The bloom filter of the
+    sstable is built on the way and written by finish().
+    """
+    WRITE_BUFFER_SIZE = 1024 * 1024
+    # indicator and shared, unshared and value size when all of them are
+    # below 128, which makes each varint a single byte
+    SHORT_HEADER = Struct("BBBB")
+    SHORT_REMOVED_HEADER = Struct("BBB")
+    TIMESTAMP = Struct("q")
+
+    def __init__(self, store_name: str, id: int, path: str,
+                 block_size: int = 4096, restart_interval: int = 16,
+                 compression: int = BlockSSTableReader.RAW_BLOCK,
+                 bloom_bits_per_key: int = 10,
+                 num_keys: int = 0,
+                 sync: bool = False,
+                 rate_limiter: Union[RateLimiter, None] = None) -> None:
+        """
+        :param store_name: the name of store the sstable belongs to
+        :param id: the id of the sstable
+        :param path: the path of the store, the sstable file is written
+        to path/sstable and the bloom file to path/index
+        :param block_size: bytes of records in a data block
+        :param restart_interval: number of keys from one restart point
+        to the next
+        :param compression: block type of the codec data blocks are
+        compressed with
+        :param bloom_bits_per_key: bits of the bloom filter for each key,
+        0 writes no bloom filter
+        :param num_keys: the number of keys that will be added, or an
+        estimate of it, used to size the bloom filter
+        :param sync: fsync the sstable file and the bloom file in finish()
+        :param rate_limiter: takes the bytes of every write to the
+        sstable file before it is made
+        """
+        self.ss_table_path = BlockSSTableReader.file_path(store_name, id,
+                                                          path)
+        self.bloom_path = os.path.join(path, "index",
+                                       store_name + str(id) + ".bloom")
+        self.block_size = block_size
+        self.restart_interval = restart_interval
+        self.compression = compression
+        self.sync = sync
+        self.rate_limiter = rate_limiter
+        self.bloom_bits_per_key = bloom_bits_per_key
+        self.bloom_filter = None
+        if bloom_bits_per_key > 0:
+            self.bloom_filter = BloomFilter.create(bloom_bits_per_key,
+                                                   num_keys)
+        self.file = open(self.ss_table_path, "wb")
+        # bytes written to file or waiting in buffer
+        self.offset = 0
+        self.buffer = bytearray()
+        self.block = bytearray()
+        self.restarts: List[int] = []
+        self.records = 0
+        # records added to the sstable, records counts those of the block
+        self.num_records = 0
+        self.block_index = bytearray()
+        self.last_key = b""
+        self.first_key: Union[bytes, None] = None
+
+    def add(self, key: str, value: Union[str, None],
+            time_stamp: int) -> None:
+        """
+        :param key: the key, greater than every key added before
+        :param value: the value, None for a removed key
+        :param time_stamp: the time of the operation
+        :return: None
+        """
+        bin_key = key.encode()
+        if self.first_key is None:
+            self.first_key = bin_key
+        if self.bloom_filter is not None:
+            self.bloom_filter.add(key)
+        block = self.block
+        if self.records % self.restart_interval == 0:
+            self.restarts.append(len(block))
+            shared = 0
+        else:
+            shared = self._shared_prefix(self.last_key, bin_key)
+        unshared = len(bin_key) - shared
+        if value is None:
+            if shared < 0x80 and unshared < 0x80:
+                block += self.SHORT_REMOVED_HEADER.pack(0, shared, unshared)
+            else:
+                block.append(0)
+                block += encode_varint(shared)
+                block += encode_varint(unshared)
+            block += bin_key[shared:]
+        else:
+            bin_value = value.encode()
+            val_size = len(bin_value)
+            if shared < 0x80 and unshared < 0x80 and val_size < 0x80:
+                block += self.SHORT_HEADER.pack(1, shared, unshared,
+                                                val_size)
+            else:
+                block.append(1)
+                block += encode_varint(shared)
+                block += encode_varint(unshared)
+                block += encode_varint(val_size)
+            block += bin_key[shared:]
+            block += bin_value
+        block += self.TIMESTAMP.pack(time_stamp)
+        self.last_key = bin_key
+        self.records += 1
+        self.num_records += 1
+        if len(block) >= self.block_size:
+            self._finish_block()
+
+    @staticmethod
+    def _shared_prefix(a: bytes, b: bytes) -> int:
+        """
+        :return: length of the common prefix of a and b, binary searched
+        with slice comparisons instead of a loop over the bytes
+        """
+        low = 0
+        high = min(len(a), len(b))
+        while low < high:
+            mid = (low + high + 1) // 2
+            if a[:mid] == b[:mid]:
+                low = mid
+            else:
+                high = mid - 1
+        return low
+
+    def _finish_block(self) -> None:
+        """
+        end the data block with its restart points, compress it, move it
+        to the output buffer with its trailer and add its block index entry
+        """
+        block = self.block
+        data_size = len(block)
+        restarts = self.restarts
+        block += pack(str(len(restarts)) + "i", *restarts)
+        block += pack("i", len(restarts))
+        block_type = BlockSSTableReader.RAW_BLOCK
+        content: Union[bytes, bytearray] = block
+        if self.compression != BlockSSTableReader.RAW_BLOCK:
+            compressed = BlockSSTableReader.COMPRESS[self.compression](block)
+            if len(compressed) < len(block) - len(block) // 8:
+                block_type = self.compression
+                content = compressed
+        self.block_index += pack("i", len(self.last_key)) + self.last_key + \
+            pack(BlockSSTableReader.INDEX_ENTRY_FORMAT, self.offset,
+                 len(content), data_size)
+        self._write(content)
+        self._write(pack("B", block_type))
+        block.clear()
+        self.restarts = []
+        self.records = 0
+
+    def _write(self, data: Union[bytes, bytearray]) -> None:
+        self.buffer += data
+        self.offset += len(data)
+        if len(self.buffer) >= self.WRITE_BUFFER_SIZE:
+            self._write_buffer()
+
+    def _write_buffer(self) -> None:
+        if self.rate_limiter is not None:
+            self.rate_limiter.request(len(self.buffer))
+        self.file.write(self.buffer)
+        self.buffer.clear()
+
+    def key_range(self) -> Union[Tuple[str, str], None]:
+        """
+        :return: tuple (first key, last key) added, None if no record was
+        added
+        """
+        if self.first_key is None:
+            return None
+        return str(self.first_key, "utf-8"), str(self.last_key, "utf-8")
+
+    def finish(self) -> int:
+        """
+        write the last data block, the block index, the footer and the
+        bloom file, then close the sstable file
+        :return: size of sstable file
+        """
+        if self.block:
+            self._finish_block()
+        index_offset = self.offset
+        self._write(self.block_index)
+        self._write(pack("B", BlockSSTableReader.RAW_BLOCK))
+        self._write(pack(BlockSSTableReader.FOOTER_FORMAT, index_offset,
+                         len(self.block_index),
+                         BlockSSTableReader.PREFIX_RECORDS,
+                         BlockSSTableReader.VERSION,
+                         BlockSSTableReader.MAGIC))
+        self._write_buffer()
+        if self.sync:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.file.close()
+        if self.bloom_filter is not None:
+            with open(self.bloom_path, "wb") as bloom_file:
+                bloom_file.write(self.bloom_filter.to_bytes())
+                if self.sync:
+                    bloom_file.flush()
+                    os.fsync(bloom_file.fileno())
+        return self.offset
+
+    def abandon(self) -> None:
+        """
+        close and delete the unfinished sstable file after a failure
+        :return: None
+        """
+        self.file.close()
+        if os.path.exists(self.ss_table_path):
+            os.remove(self.ss_table_path)
@@ -1,48 +1,36 @@
 from ..error import StorageException
 from ..error import ErrorType
 from ..iterator import Iterator
-from struct import unpack
-import os
-from typing import Tuple
+from .sstablereader import SSTableReader
+from .blockreader import BlockSSTableReader
+from typing import Tuple, Union
+
+
+# a decoded record: (removed, key, value, timestamp, next offset)
+Record = Tuple[bool, str, Union[str, None], int, int]
 
 
 class SStableIterator(Iterator):
-    INT_SIZE = 4
-    TIMESTAMP_SIZE = 8
-    INDICATOR_SIZE = 4
+    """
+    Cursor over the records of a sstable. A record is decoded once when
+    the iterator reaches it: key(), value(), timestamp(), length() and
+    is_removed() read the cached fields, and the cached next offset
+    moves the cursor on. valid() decodes the following record and keeps
+    it for next().
+    """
 
-    def __init__(self, store_name: str,
-                 id: int, size: int, index_table, path, last_index) -> None:
+    def __init__(self, reader: Union[SSTableReader, BlockSSTableReader],
+                 size: int) -> None:
         """
-        :param store_name: the name of store the sstable belongs to
-        :param id: the id of the sstable
-        :param size: the size of sstable file
-        :param index_table: the index table stored in memory for this sstable
-        :param path: the path the sstable file and index file store in
-        :param last_index: the offset of last
-        key-data-time set data in sstable file
+        :param reader: the memory mapped sstable file and index file
+        :param size: the size of the records in sstable file
         """
-        sstable_file_name = store_name + str(id) + ".ss"
-        index_file_name = store_name + str(id) + ".index"
-        self.cur = None
-        sstable_dir = os.path.join(path, "sstable")
-        index_dir = os.path.join(path, "index")
-        self.sstable_file = open(os.path.join(sstable_dir, sstable_file_name),
-                                 "rb")
-        self.index_file = open(os.path.join(index_dir, index_file_name), "rb")
-        self.index_table = index_table
+        self.reader = reader
         self.cur_offset = 0
         self.file_size = size
-        self.last_index = last_index
         self.dummy_first = True
-
-    def __del__(self) -> None:
-        """
-        close sstable file and index file
-        :return: None
-        """
-        self.sstable_file.close()
-        self.index_file.close()
+        self.current: Union[Record, None] = None
+        self.peeked: Union[Tuple[int, Record], None] = None
 
     def seek(self, key: str) -> None:
         """
@@ -52,20 +40,11 @@ class SStableIterator(Iterator):
         if self.file_size == 0:
             raise StorageException(ErrorType.NOT_FOUND,
                                    "The key is not found in table.")
-        index_range = self._get_range(key)
-        if index_range[0] == index_range[1]:
-            offset = index_range[0]
-            self.index_file.seek(offset)
-            key_size = unpack("i", self.index_file.read(self.INT_SIZE))[0]
-            self.index_file.read(key_size)
-            self.cur_offset = unpack("i",
-                                     self.index_file.read(self.INT_SIZE))[0]
-        else:
-            offset = self._get_offset(key, index_range[0], index_range[1])
-            if offset is None:
-                raise StorageException(ErrorType.NOT_FOUND,
-                                       "The key is not found in table.")
-            self.cur_offset = offset
+        found = self.reader.seek(key)
+        if found is None:
+            raise StorageException(ErrorType.NOT_FOUND,
+                                   "The key is not found in table.")
+        self._move_to(found[0], found[1])
 
     def seek_to_first(self) -> None:
         """
@@ -74,43 +53,15 @@ class SStableIterator(Iterator):
         """
         self.cur_offset = 0
         self.dummy_first = True
+        self.current = None
+        self.peeked = None
 
     def valid(self) -> bool:
         """
         :return: true if the iterator has next.
         Otherwise false. considering empty sstable
         """
-        if self.cur_offset < 0:
-            return False
-        elif self.cur_offset == 0 and self.file_size == 0:
-            return False
-        else:
-            if self.cur_offset >= self.file_size:
-                return False
-            self.sstable_file.seek(self.cur_offset)
-            indicator = unpack("i", self.sstable_file.
-                               read(self.INDICATOR_SIZE))[0]
-            if indicator == 0:
-                key_size_str = self.sstable_file.read(self.INT_SIZE)
-                key_size = unpack("i", key_size_str)[0]
-                self.sstable_file.read(key_size)
-                self.sstable_file.read(self.TIMESTAMP_SIZE)
-                offset = self.cur_offset + self.INDICATOR_SIZE \
-                    + self.INT_SIZE \
-                    + key_size + self.TIMESTAMP_SIZE
-            else:
-                key_size_str = self.sstable_file.read(self.INT_SIZE)
-                key_size = unpack("i", key_size_str)[0]
-                self.sstable_file.read(key_size)
-                val_size_str = self.sstable_file.read(self.INT_SIZE)
-                val_size = unpack("i", val_size_str)[0]
-                self.sstable_file.read(val_size)
-                offset = self.cur_offset + \
-                    self.INDICATOR_SIZE + self.INT_SIZE \
-                    + key_size + self.INT_SIZE + val_size + self.TIMESTAMP_SIZE
-            if offset >= self.file_size:
-                return False
-            return True
+        return self._peek() is not None
 
     def next(self) -> None:
         """
@@ -118,116 +69,84 @@ class SStableIterator(Iterator):
         otherwise, raise an exception
         :return: None
         """
-        if self.file_size == 0:
+        peeked = self._peek()
+        if peeked is None:
             raise StorageException(ErrorType.NONE_POINTER,
                                    "There is no next")
-        elif self.cur_offset == 0 and self.dummy_first:
-            self.cur_offset = 0
-            self.dummy_first = False
-        elif self.cur_offset >= 0:
-            self.sstable_file.seek(self.cur_offset)
-            indicator = unpack("i", self.sstable_file.
-                               read(self.INDICATOR_SIZE))[0]
-            if indicator == 0:
-                key_size_str = self.sstable_file.read(self.INT_SIZE)
-                key_size = unpack("i", key_size_str)[0]
-                self.sstable_file.read(key_size)
-                self.sstable_file.read(self.TIMESTAMP_SIZE)
-                self.cur_offset = self.cur_offset + \
-                    self.INDICATOR_SIZE + self.INT_SIZE + key_size \
-                    + self.TIMESTAMP_SIZE
+        self._move_to(peeked[0], peeked[1])
+
+    def _move_to(self, offset: int, record: Record) -> None:
+        self.cur_offset = offset
+        self.current = record
+        self.dummy_first = False
+        self.peeked = None
+
+    def _peek(self) -> Union[Tuple[int, Record], None]:
+        """
+        :return: the offset and the decoded record after the current one,
+        the first record before the first call of next.
+        None if there is none
+        """
+        if self.peeked is None:
+            prev_key = ""
+            if self.dummy_first:
+                offset = 0
             else:
-                key_size_str = self.sstable_file.read(self.INT_SIZE)
-                key_size = unpack("i", key_size_str)[0]
-                self.sstable_file.read(key_size)
-                val_size_str = self.sstable_file.read(self.INT_SIZE)
-                val_size = unpack("i", val_size_str)[0]
-                self.sstable_file.read(val_size)
-                self.cur_offset = self.cur_offset + \
-                    self.INDICATOR_SIZE + self.INT_SIZE + key_size \
-                    + self.INT_SIZE + val_size + self.TIMESTAMP_SIZE
-            if self.cur_offset >= self.file_size:
-                raise StorageException(ErrorType.NONE_POINTER,
-                                       "There is no next")
+                offset = self._current()[4]
+                prev_key = self._current()[1]
+            if offset < self.file_size:
+                self.peeked = offset, self.reader.read_record(offset,
+                                                              prev_key)
+        return self.peeked
+
+    def _current(self) -> Record:
+        """
+        :return: the decoded record the iterator points to. it is only
+        decoded here before the first next(), at the first record, which
+        is a restart point of a v2 sstable
+        """
+        if self.current is None:
+            self.current = self.reader.read_record(self.cur_offset)
+        return self.current
 
     def value(self) -> str:
         """
         :return: the value of the key-value-time
         set data the iterator points to
         """
-        self.sstable_file.seek(self.cur_offset)
-        indicator = unpack("i", self.sstable_file.
-                           read(self.INDICATOR_SIZE))[0]
-        if indicator == 1:
-            key_size_str = self.sstable_file.read(self.INT_SIZE)
-            key_size = unpack("i", key_size_str)[0]
-            self.sstable_file.read(key_size)
-            val_size_str = self.sstable_file.read(self.INT_SIZE)
-            val_size = unpack("i", val_size_str)[0]
-            value = self.sstable_file.read(val_size).decode()
-            return value
-        else:
+        value = self._current()[2]
+        if value is None:
             raise StorageException(ErrorType.NOT_FOUND,
                                    "The node is removed.")
+        return value
 
     def key(self) -> str:
         """
         :return: the key of the key-value-time set data the iterator points to
         """
-        self.sstable_file.seek(self.cur_offset)
-        self.sstable_file.read(self.INDICATOR_SIZE)
-        key_size_str = self.sstable_file.read(self.INT_SIZE)
-        key_size = unpack("i", key_size_str)[0]
-        key = self.sstable_file.read(key_size).decode()
-        return key
+        return self._current()[1]
 
     def timestamp(self) -> int:
         """
         :return: the time of the key-value-time
         set data the iterator points to
         """
-        self.sstable_file.seek(self.cur_offset)
-        indicator = unpack("i", self.sstable_file.
-                           read(self.INDICATOR_SIZE))[0]
-        if indicator == 1:
-            key_size_str = self.sstable_file.read(self.INT_SIZE)
-            key_size = unpack("i", key_size_str)[0]
-            self.sstable_file.read(key_size)
-            val_size_str = self.sstable_file.read(self.INT_SIZE)
-            val_size = unpack("i", val_size_str)[0]
-            self.sstable_file.read(val_size)
-            bin_time_stamp = self.sstable_file.read(self.TIMESTAMP_SIZE)
-        else:
-            key_size_str = self.sstable_file.read(self.INT_SIZE)
-            key_size = unpack("i", key_size_str)[0]
-            self.sstable_file.read(key_size)
-            bin_time_stamp = self.sstable_file.read(self.TIMESTAMP_SIZE)
-        time_stamp = unpack("q", bin_time_stamp)[0]
-        return time_stamp
+        return self._current()[3]
 
     def length(self) -> int:
         """
         :return: the length of the key-value-time
         set data the iterator points to
         """
-        self.sstable_file.seek(self.cur_offset)
-        indicator = unpack("i", self.sstable_file.
-                           read(self.INDICATOR_SIZE))[0]
-        if indicator == 1:
-            key_size_str = self.sstable_file.read(self.INT_SIZE)
-            key_size = unpack("i", key_size_str)[0]
-            self.sstable_file.read(key_size)
-            val_size_str = self.sstable_file.read(self.INT_SIZE)
-            val_size = unpack("i", val_size_str)[0]
-            length = self.INDICATOR_SIZE + self.INT_SIZE + key_size \
-                + self.INT_SIZE + val_size \
-                + self.TIMESTAMP_SIZE
-        else:
-            key_size_str = self.sstable_file.read(self.INT_SIZE)
-            key_size = unpack("i", key_size_str)[0]
-            length = self.INDICATOR_SIZE + self.INT_SIZE + key_size \
-                + self.TIMESTAMP_SIZE
-        return length
+        return self._current()[4] - self.cur_offset
+
+    def record(self) -> Tuple[bool, str, Union[str, None], int]:
+        """
+        :return: tuple (removed, key, value, timestamp) of the data set
+        the iterator points to, value is None for a removed key
+        """
+        removed, key, value, time_stamp, _ = self._current()
+        return removed, key, value, time_stamp
 
     def get_cur_offset(self) -> int:
         """
@@ -236,71 +155,7 @@ class SStableIterator(Iterator):
         return self.cur_offset
 
     def contain(self, key: str) -> bool:
-        offset_range = self._get_range(key)
-        offset = self._get_offset(key, offset_range[0], offset_range[1])
-        if offset is None:
-            return False
-        return True
+        return self.reader.find(key) is not None
 
     def is_removed(self) -> bool:
-        self.sstable_file.seek(self.cur_offset)
-        indicator = unpack("i", self.sstable_file.
-                           read(self.INDICATOR_SIZE))[0]
-        if indicator == 0:
-            return True
-        else:
-            return False
-
-    def _get_range(self, key: str) -> Tuple[int, int]:
-        """
-        :param key: the key user intends to find
-        :return: the index range for key according
-        to the index table in memory
-        """
-        start = -1
-        end = -1
-        index_table_len = len(self.index_table)
-        left = 0
-        right = index_table_len - 1
-        while left <= right and right >= 0 and left < index_table_len:
-            mid = int((left + right) / 2)
-            cur_data = self.index_table[mid]
-            if cur_data[0] == key:
-                start = unpack("i", cur_data[1])[0]
-                end = unpack("i", cur_data[1])[0]
-                return start, end
-            elif cur_data[0] < key:
-                left = mid + 1
-                start = unpack("i", cur_data[1])[0]
-            elif cur_data[0] > key:
-                right = mid - 1
-                end = unpack("i", cur_data[1])[0]
-        return start, end
-
-    # _get_offset: find the offset of key in index file
-    def _get_offset(self, key: str, start, end):
-        """
-        :param key: the key user intends to find in sstable
-        :param start: the start of the index range
-        :param end: the end of the index range
-        :return: the offset of the key;
-        if the offset is not found, return None
-        """
-        if start == -1:
-            start = 0
-        if end == -1:
-            end = self.last_index
-        self.index_file.seek(start)
-        bin_key = key.encode()
-        while start <= end:
-            key_size_str = self.index_file.read(self.INT_SIZE)
-            key_size = unpack("i", key_size_str)[0]
-            cur_key = self.index_file.read(key_size)
-            if cur_key == bin_key:
-                offset_str = self.index_file.read(self.INT_SIZE)
-                offset = unpack("i", offset_str)[0]
-                return offset
-            else:
-                self.index_file.read(self.INT_SIZE)
-            start += self.INT_SIZE + key_size + self.INT_SIZE
-        return None
+        return self._current()[0]
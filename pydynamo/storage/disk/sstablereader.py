@@ -0,0 +1,263 @@
+from struct import unpack_from
+from typing import List, Tuple, Union
+import mmap
+import os
+
+
+class SSTableReader(object):
+    """
+    Read-only access to the sstable file and index file of a v1 sstable
+    through memory maps. Records are decoded with struct.unpack_from on
+    the mapped buffer and keys are compared as memoryview slices, so once
+    the pages are resident a lookup or a scan step makes no system call.
+    The reader keeps no position: it can be shared by the sstable and all
+    of its iterators, and used by concurrent readers.
+    """
+    INT_SIZE = 4
+    TIMESTAMP_SIZE = 8
+    INDICATOR_SIZE = 4
+
+    def __init__(self, store_name: str, id: int, path: str,
+                 index_table: List, last_index: int) -> None:
+        """
+        :param store_name: the name of store the sstable belongs to
+        :param id: the id of the sstable
+        :param path: the path the sstable file and index file store in
+        :param index_table: the index table stored in memory for this sstable
+        :param last_index: the offset of last
+        key-data-time set data in index file
+        """
+        sstable_file_name = store_name + str(id) + ".ss"
+        index_file_name = store_name + str(id) + ".index"
+        self.sstable_map = self._map(
+            os.path.join(path, "sstable", sstable_file_name))
+        self.index_map = self._map(
+            os.path.join(path, "index", index_file_name))
+        self.sstable_view = memoryview(self.sstable_map)
+        self.index_view = memoryview(self.index_map)
+        self.index_table = index_table
+        self.last_index = last_index
+        self.data_size = len(self.sstable_map)
+
+    @staticmethod
+    def _map(file_path: str) -> Union[mmap.mmap, bytes]:
+        """
+        :param file_path: the file to map
+        :return: a read-only memory map of the file. an empty file
+        cannot be mapped, an empty bytes object stands in for it
+        """
+        with open(file_path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def evict(self) -> None:
+        """
+        v1 sstables are not kept in the block cache
+        :return: None
+        """
+        pass
+
+    def is_removed(self, offset: int) -> bool:
+        """
+        :param offset: offset of a record in sstable file
+        :return: True if the record is a removed key
+        """
+        return unpack_from("i", self.sstable_map, offset)[0] == 0
+
+    def key(self, offset: int) -> memoryview:
+        """
+        :param offset: offset of a record in sstable file
+        :return: utf-8 bytes of the key of the record
+        """
+        key_size = unpack_from("i", self.sstable_map,
+                               offset + self.INDICATOR_SIZE)[0]
+        start = offset + self.INDICATOR_SIZE + self.INT_SIZE
+        return self.sstable_view[start:start + key_size]
+
+    def value(self, offset: int) -> Union[memoryview, None]:
+        """
+        :param offset: offset of a record in sstable file
+        :return: utf-8 bytes of the value of the record,
+        None for a removed key
+        """
+        indicator, key_size = unpack_from("ii", self.sstable_map, offset)
+        if indicator == 0:
+            return None
+        start = offset + self.INDICATOR_SIZE + self.INT_SIZE + key_size
+        val_size = unpack_from("i", self.sstable_map, start)[0]
+        start += self.INT_SIZE
+        return self.sstable_view[start:start + val_size]
+
+    def timestamp(self, offset: int) -> int:
+        """
+        :param offset: offset of a record in sstable file
+        :return: the timestamp of the record
+        """
+        return unpack_from("q", self.sstable_map,
+                           offset + self.length(offset)
+                           - self.TIMESTAMP_SIZE)[0]
+
+    def length(self, offset: int) -> int:
+        """
+        :param offset: offset of a record in sstable file
+        :return: the length of the record in bytes
+        """
+        indicator, key_size = unpack_from("ii", self.sstable_map, offset)
+        length = self.INDICATOR_SIZE + self.INT_SIZE + key_size \
+            + self.TIMESTAMP_SIZE
+        if indicator == 1:
+            val_size = unpack_from("i", self.sstable_map,
+                                   offset + length - self.TIMESTAMP_SIZE)[0]
+            length += self.INT_SIZE + val_size
+        return length
+
+    def read_record(self, offset: int, prev_key: str = "",
+                    fill_cache: bool = True) \
+            -> Tuple[bool, str, Union[str, None], int, int]:
+        """
+        decode a whole record in one pass
+        :param offset: offset of a record in sstable file
+        :param prev_key: not used, v1 records keep their keys in full
+        :param fill_cache: not used, v1 sstables are not cached
+        :return: tuple (removed, key, value, timestamp, offset of the
+        next record), value is None for a removed key
+        """
+        return self.decode_record(self.sstable_view, offset)
+
+    @classmethod
+    def decode_record(cls, buffer: memoryview, offset: int) \
+            -> Tuple[bool, str, Union[str, None], int, int]:
+        """
+        :param buffer: a sstable file or a data block of a v2 sstable
+        :param offset: offset of a record in buffer
+        :return: tuple (removed, key, value, timestamp, offset of the
+        next record in buffer), value is None for a removed key
+        """
+        indicator, key_size = unpack_from("ii", buffer, offset)
+        pos = offset + cls.INDICATOR_SIZE + cls.INT_SIZE
+        key = str(buffer[pos:pos + key_size], "utf-8")
+        pos += key_size
+        value = None
+        if indicator == 1:
+            val_size = unpack_from("i", buffer, pos)[0]
+            pos += cls.INT_SIZE
+            value = str(buffer[pos:pos + val_size], "utf-8")
+            pos += val_size
+        time_stamp = unpack_from("q", buffer, pos)[0]
+        return indicator == 0, key, value, time_stamp, \
+            pos + cls.TIMESTAMP_SIZE
+
+    def seek(self, key: str) -> Union[
+            Tuple[int, Tuple[bool, str, Union[str, None], int, int]], None]:
+        """
+        :param key: the key user intends to find in sstable
+        :return: offset and decoded record of key,
+        None if key is not in sstable
+        """
+        offset = self.find(key)
+        if offset is None:
+            return None
+        return offset, self.read_record(offset)
+
+    def key_range(self) -> Union[Tuple[str, str], None]:
+        """
+        :return: tuple (smallest key, largest key) of the sstable, None
+        if it has no records. the last entry of the index file holds the
+        largest key
+        """
+        if len(self.sstable_map) == 0:
+            return None
+        key_size = unpack_from("i", self.index_map, self.last_index)[0]
+        start = self.last_index + self.INT_SIZE
+        return self.read_record(0)[1], \
+            str(self.index_view[start:start + key_size], "utf-8")
+
+    def lower_bound(self, key: str) -> Union[
+            Tuple[int, Tuple[bool, str, Union[str, None], int, int]], None]:
+        """
+        scan the index file from the index range of key for the first key
+        that is not less than key
+        :param key: a key, not necessarily in sstable
+        :return: offset and decoded record of that key, None if every key
+        is less than key
+        """
+        if len(self.sstable_map) == 0:
+            return None
+        pos = max(self._get_range(key)[0], 0)
+        bin_key = key.encode()
+        while pos <= self.last_index:
+            key_size = unpack_from("i", self.index_map, pos)[0]
+            key_start = pos + self.INT_SIZE
+            if bytes(self.index_view[key_start:key_start + key_size]) >= \
+                    bin_key:
+                offset = unpack_from("i", self.index_map,
+                                     key_start + key_size)[0]
+                return offset, self.read_record(offset)
+            pos = key_start + key_size + self.INT_SIZE
+        return None
+
+    def find(self, key: str) -> Union[int, None]:
+        """
+        :param key: the key user intends to find in sstable
+        :return: offset of the record of key in sstable file,
+        None if key is not in sstable
+        """
+        if len(self.sstable_map) == 0:
+            return None
+        start, end = self._get_range(key)
+        if start == end and start != -1:
+            key_size = unpack_from("i", self.index_map, start)[0]
+            return unpack_from("i", self.index_map,
+                               start + self.INT_SIZE + key_size)[0]
+        return self._get_offset(key, start, end)
+
+    def _get_range(self, key: str) -> Tuple[int, int]:
+        """
+        :param key: the key user intends to find
+        :return: the index range for key according
+        to the index table in memory
+        """
+        start = -1
+        end = -1
+        index_table_len = len(self.index_table)
+        left = 0
+        right = index_table_len - 1
+        while left <= right and right >= 0 and left < index_table_len:
+            mid = int((left + right) / 2)
+            cur_data = self.index_table[mid]
+            if cur_data[0] == key:
+                start = unpack_from("i", cur_data[1])[0]
+                end = start
+                return start, end
+            elif cur_data[0] < key:
+                left = mid + 1
+                start = unpack_from("i", cur_data[1])[0]
+            elif cur_data[0] > key:
+                right = mid - 1
+                end = unpack_from("i", cur_data[1])[0]
+        return start, end
+
+    def _get_offset(self, key: str, start: int,
+                    end: int) -> Union[int, None]:
+        """
+        :param key: the key user intends to find in sstable
+        :param start: the start of the index range
+        :param end: the end of the index range
+        :return: the offset of the key;
+        if the offset is not found, return None
+        """
+        if start == -1:
+            start = 0
+        if end == -1:
+            end = self.last_index
+        bin_key = key.encode()
+        index_map = self.index_map
+        index_view = self.index_view
+        while start <= end:
+            key_size = unpack_from("i", index_map, start)[0]
+            key_start = start + self.INT_SIZE
+            if index_view[key_start:key_start + key_size] == bin_key:
+                return unpack_from("i", index_map, key_start + key_size)[0]
+            start = key_start + key_size + self.INT_SIZE
+        return None
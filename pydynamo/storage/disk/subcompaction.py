@@ -0,0 +1,133 @@
+from .sstable import SSTable
+from .blockreader import BlockSSTableReader
+from .sstablebuilder import SSTableBuilder
+from .ratelimiter import RateLimiter
+from .mergingiterator import merge_records
+from functools import partial
+from itertools import takewhile
+from typing import List, Tuple, Union
+
+
+def split_keys(inputs: List[SSTable], count: int) -> List[str]:
+    """
+    pick the keys that split the inputs of a compaction into count key
+    ranges of about the same number of index entries. the candidates are
+    the keys the inputs already keep in memory: the last key of every
+    data block of a v2 sstable, the keys of index_table of a v1 sstable
+    :param inputs: the sstables of a compaction
+    :param count: the number of key ranges wanted
+    :return: at most count - 1 keys in increasing order, a range starts
+    at a split key and ends before the next one
+    """
+    boundaries = set()
+    for ss_table in inputs:
+        reader = ss_table.reader
+        if isinstance(reader, BlockSSTableReader):
+            boundaries.update(reader.last_keys)
+        else:
+            boundaries.update(key for key, _ in ss_table.index_table)
+    keys = sorted(boundaries)
+    count = min(count, len(keys) + 1)
+    return [keys[len(keys) * i // count] for i in range(1, count)]
+
+
+class Subcompaction(object):
+    """
+    A key range of a compaction, merged on its own in a worker process.
+    It holds only what the worker needs to open the inputs and write the
+    outputs, so it pickles without the store: the inputs as tuples (id,
+    size, index_table, last_index), newest first, the key range, the ids
+    reserved for its outputs and the settings of SSTableBuilder.
+    """
+
+    def __init__(self, store_name: str, path: str,
+                 inputs: List[Tuple[int, int, List, int]],
+                 start_key: Union[str, None], end_key: Union[str, None],
+                 drop_removed: bool, ids: List[int],
+                 target_file_size: int, num_keys: int, block_size: int,
+                 restart_interval: int, compression: int,
+                 bloom_bits_per_key: int, sync: bool,
+                 bytes_per_second: int) -> None:
+        """
+        :param store_name: name of the store
+        :param path: the path of the store
+        :param inputs: the input sstables, newest first
+        :param start_key: the first key of the range, None for the first
+        key of the inputs
+        :param end_key: the range ends before end_key, None for the last
+        key of the inputs
+        :param drop_removed: True to leave removed keys out
+        :param ids: ids of the output sstables, a range that fills them
+        all writes the rest into the last one
+        :param target_file_size: bytes of an output sstable
+        :param num_keys: the number of keys the bloom filter of an output
+        sstable is sized for
+        :param bytes_per_second: bytes the worker may write per second,
+        0 does not limit
+        """
+        self.store_name = store_name
+        self.path = path
+        self.inputs = inputs
+        self.start_key = start_key
+        self.end_key = end_key
+        self.drop_removed = drop_removed
+        self.ids = ids
+        self.target_file_size = target_file_size
+        self.num_keys = num_keys
+        self.block_size = block_size
+        self.restart_interval = restart_interval
+        self.compression = compression
+        self.bloom_bits_per_key = bloom_bits_per_key
+        self.sync = sync
+        self.bytes_per_second = bytes_per_second
+
+
+def run_subcompaction(subcompaction: Subcompaction) \
+        -> List[Tuple[int, int, Union[Tuple[str, str], None], int]]:
+    """
+    body of a worker process: merge the records of the inputs in the key
+    range of subcompaction into new v2 sstables. if writing fails the
+    unfinished file and the finished sstables are deleted
+    :return: tuples (id, size, (smallest key, largest key), number of
+    keys) of the new sstables in key order
+    """
+    task = subcompaction
+    sources = [partial(SSTable(task.store_name, id, size, index_table,
+                               task.path, last_index).records,
+                       fill_cache=False)
+               for id, size, index_table, last_index in task.inputs]
+    records = merge_records(sources, task.start_key)
+    end_key = task.end_key
+    if end_key is not None:
+        records = takewhile(lambda record: record[0] < end_key, records)
+    rate_limiter = RateLimiter(task.bytes_per_second)
+    outputs: List[Tuple[int, int, Union[Tuple[str, str], None], int]] = []
+    builder = None
+    id = 0
+    try:
+        for key, value, time_stamp in records:
+            if value is None and task.drop_removed:
+                continue
+            if builder is None:
+                id = task.ids[len(outputs)]
+                builder = SSTableBuilder(
+                    task.store_name, id, task.path,
+                    task.block_size, task.restart_interval,
+                    task.compression, task.bloom_bits_per_key, task.num_keys,
+                    task.sync, rate_limiter)
+            builder.add(key, value, time_stamp)
+            if builder.offset >= task.target_file_size and \
+                    len(outputs) < len(task.ids) - 1:
+                outputs.append((id, builder.finish(), builder.key_range(),
+                                builder.num_records))
+                builder = None
+        if builder is not None:
+            outputs.append((id, builder.finish(), builder.key_range(),
+                            builder.num_records))
+    except Exception:
+        if builder is not None:
+            builder.abandon()
+        for id, size, _, _ in outputs:
+            SSTable(task.store_name, id, size, [], task.path, 0).clean()
+        raise
+    return outputs
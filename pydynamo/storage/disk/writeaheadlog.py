@@ -0,0 +1,158 @@
+from ..error import StorageException
+from ..error import ErrorType
+from struct import pack, unpack_from
+from typing import Iterator, Tuple, Union
+import os
+import threading
+import zlib
+
+
+class WriteAheadLog(object):
+    """
+    An append-only log of the writes of one mem_table. Every set and
+    remove is appended before it is applied to the mem_table, so the
+    mem_table can be rebuilt by replaying the log after the process dies.
+    The file is written without a user space buffer, a write that
+    returned is in the operating system even if the process dies.
+    Sync modes decide when the log is forced to disk:
+    none: never, a crash of the machine can lose recent writes
+    always: fsync after every write
+    group: a writer waits until the log is synced up to its write; one
+    writer syncs for all writers that appended in the meantime, so
+    concurrent writers share one fsync
+    Record format, little endian:
+    [length   ] (4 bytes): length of the payload
+    [checksum ] (4 bytes): crc32 of the payload
+    [payload  ]: operation(1 byte, 1 set, 0 remove) + key_size(4 byte) +
+    key + value_size(4 byte) + value, a remove has no value_size and value
+    """
+    NONE = "none"
+    ALWAYS = "always"
+    GROUP = "group"
+    SYNC_MODES = (NONE, ALWAYS, GROUP)
+    HEADER_SIZE = 8
+
+    def __init__(self, file_path: str, sync_mode: str) -> None:
+        """
+        :param file_path: path of the log file, created if it does not exist
+        :param sync_mode: none, always or group
+        """
+        self.file_path = file_path
+        self.sync_mode = sync_mode
+        self.file = open(file_path, "ab", buffering=0)
+        # sequence numbers of appended and of synced records
+        self.written = 0
+        self.synced = 0
+        self.syncing = False
+        self.sync_count = 0
+        self.condition = threading.Condition()
+
+    def append(self, key: str, value: Union[str, None]) -> int:
+        """
+        append a set, or a remove if value is None. the caller serializes
+        appends with the writes to the mem_table
+        :return: sequence number of the record, for sync()
+        """
+        bin_key = key.encode()
+        if value is None:
+            payload = pack("<Bi", 0, len(bin_key)) + bin_key
+        else:
+            bin_value = value.encode()
+            payload = pack("<Bi", 1, len(bin_key)) + bin_key + \
+                pack("<i", len(bin_value)) + bin_value
+        record = pack("<II", len(payload), zlib.crc32(payload)) + payload
+        try:
+            self.file.write(record)
+            if self.sync_mode == self.ALWAYS:
+                self._fsync()
+        except OSError as e:
+            raise StorageException(ErrorType.IO_ERROR,
+                                   "Writing the log failed: " + str(e))
+        with self.condition:
+            self.written += 1
+            if self.sync_mode == self.ALWAYS:
+                self.synced = self.written
+            return self.written
+
+    def sync(self, sequence: int) -> None:
+        """
+        in group mode, wait until the log is synced up to record sequence.
+        the first waiter syncs every record appended so far while later
+        waiters wait for it. it must be called without the store lock, so
+        writers can append while the log is synced
+        :param sequence: the sequence number append returned
+        :return: None
+        """
+        if self.sync_mode != self.GROUP:
+            return
+        with self.condition:
+            while self.synced < sequence:
+                if self.syncing:
+                    self.condition.wait()
+                    continue
+                self.syncing = True
+                target = self.written
+                self.condition.release()
+                error = None
+                try:
+                    self._fsync()
+                except OSError as e:
+                    error = e
+                finally:
+                    self.condition.acquire()
+                    self.syncing = False
+                    self.condition.notify_all()
+                if error is not None:
+                    raise StorageException(ErrorType.IO_ERROR,
+                                           "Syncing the log failed: " +
+                                           str(error))
+                self.synced = max(self.synced, target)
+
+    def _fsync(self) -> None:
+        os.fsync(self.file.fileno())
+        self.sync_count += 1
+
+    def close(self) -> None:
+        """
+        sync the log unless the sync mode is none, and close it. writers
+        waiting in sync() return
+        :return: None
+        """
+        with self.condition:
+            while self.syncing:
+                self.condition.wait()
+            if self.sync_mode != self.NONE and self.synced < self.written:
+                self._fsync()
+            self.synced = self.written
+            self.file.close()
+            self.condition.notify_all()
+
+    @classmethod
+    def replay(cls, file_path: str) -> Iterator[Tuple[str, Union[str, None]]]:
+        """
+        :param file_path: path of a log file
+        :return: the logged writes in order as tuples (key, value), value
+        is None for a remove. replay stops at the first record that is
+        cut off or does not match its checksum, the write that was in
+        progress when the process died
+        """
+        with open(file_path, "rb") as file:
+            data = file.read()
+        pos = 0
+        while pos + cls.HEADER_SIZE <= len(data):
+            length, checksum = unpack_from("<II", data, pos)
+            payload = data[pos + cls.HEADER_SIZE:
+                           pos + cls.HEADER_SIZE + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                return
+            operation, key_size = unpack_from("<Bi", payload, 0)
+            start = 5  # operation and key_size
+            key = str(payload[start:start + key_size], "utf-8")
+            value = None
+            if operation == 1:
+                start += key_size
+                val_size = unpack_from("<i", payload, start)[0]
+                start += 4
+                value = str(payload[start:start + val_size], "utf-8")
+            yield key, value
+            pos += cls.HEADER_SIZE + length
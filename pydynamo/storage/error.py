@@ -6,6 +6,7 @@ class ErrorType(Enum):
     INVALID_INPUT = 1
     NONE_POINTER = 2
     ACTION_FORBIDDEN = 3
+    IO_ERROR = 4
 
 
 class StorageException(Exception):
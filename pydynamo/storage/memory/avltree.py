@@ -0,0 +1,207 @@
+from .binarysearchtree import BinarySearchTree
+from .treenode import TreeNode
+from ..error import StorageException, ErrorType
+from typing import List, Tuple, Union
+
+
+class AVLTree(BinarySearchTree):
+    """
+    A self-balancing binary search tree with the same interface as
+    BinarySearchTree. Every node keeps the height of its subtree and the
+    tree is rebalanced with rotations on the way back from an insert or a
+    removal, so the height stays O(log n) whatever order keys arrive in.
+    Insert and removal are iterative: the path from the root is kept in
+    a list instead of on the call stack.
+    """
+
+    def insert(self, key: str, value: Union[str, None]) -> None:
+        """
+        insert a key-value set. if the key is already in the tree, its
+        value is replaced and the node is no longer marked as removed
+        :param key: key of the new node
+        :param value: value of the new node
+        :return: None
+        """
+        self._put(key, value, False)
+
+    def upsert(self, key: str,
+               value: str) -> Tuple[bool, bool, Union[str, None]]:
+        """
+        insert or update a key-value set in a single descent of the tree
+        :param key: key to be set
+        :param value: new value of key
+        :return: the previous state of the node as a tuple
+        (found, removed, value). found is False if key was not in the tree
+        """
+        return self._put(key, value, False)
+
+    def tombstone(self, key: str) -> Tuple[bool, bool, Union[str, None]]:
+        """
+        mark key as removed in a single descent of the tree. an existing
+        node keeps its value, a missing key gets a new removed node
+        :param key: key to be removed
+        :return: the previous state of the node as a tuple
+        (found, removed, value). found is False if key was not in the tree
+        """
+        return self._put(key, None, True)
+
+    def remove(self, key: str) -> None:
+        """
+        mark key as removed, see tombstone
+        :param key: key to be removed
+        :return: None
+        """
+        self._put(key, None, True)
+
+    def _put(self, key: str, value: Union[str, None],
+             remove: bool) -> Tuple[bool, bool, Union[str, None]]:
+        path: List[TreeNode] = []
+        cur = self.root
+        while cur:
+            if key == cur.key:
+                previous = (True, cur.remove, cur.value)
+                if not remove:
+                    cur.value = value
+                cur.remove = remove
+                return previous
+            path.append(cur)
+            if key < cur.key:
+                cur = cur.left
+            else:
+                cur = cur.right
+        node = TreeNode(key, value)
+        node.remove = remove
+        self.size += 1
+        if not path:
+            self.root = node
+        else:
+            parent = path[-1]
+            if key < parent.key:
+                parent.left = node
+            else:
+                parent.right = node
+            self._rebalance_path(path)
+        return False, False, None
+
+    def remove_node(self, key: str) -> None:
+        """
+        physically remove the node of key from the tree
+        :param key: key of the node to be removed
+        :return: None
+        """
+        path: List[TreeNode] = []
+        cur = self.root
+        while cur and cur.key != key:
+            path.append(cur)
+            if key < cur.key:
+                cur = cur.left
+            else:
+                cur = cur.right
+        if cur is None:
+            raise StorageException(ErrorType.NOT_FOUND,
+                                   "This key is not in table.")
+        if cur.left and cur.right:
+            # move the in-order successor into this node and
+            # remove the successor instead, it has no left child
+            path.append(cur)
+            successor = cur.right
+            while successor.left:
+                path.append(successor)
+                successor = successor.left
+            cur.key = successor.key
+            cur.value = successor.value
+            cur.remove = successor.remove
+            cur = successor
+        child = cur.left if cur.left else cur.right
+        if not path:
+            self.root = child
+        else:
+            parent = path[-1]
+            if parent.left is cur:
+                parent.left = child
+            else:
+                parent.right = child
+        self.size -= 1
+        self._rebalance_path(path)
+
+    def balance_tree(self) -> None:
+        """
+        the tree is rebalanced on every insert and removal,
+        so there is nothing left to do here
+        :return: None
+        """
+        pass
+
+    def height(self) -> int:
+        """
+        :return: the height of the tree, 0 for an empty tree
+        """
+        return self._height(self.root)
+
+    def _rebalance_path(self, path: List[TreeNode]) -> None:
+        """
+        walk back from the bottom of path to the root, updating heights
+        and rotating unbalanced nodes. stops as soon as a subtree keeps
+        its previous height, because nothing above it can change
+        :param path: nodes from the root down to the parent of the
+        inserted or removed node
+        :return: None
+        """
+        for i in range(len(path) - 1, -1, -1):
+            node = path[i]
+            old_height = node.height
+            new_root = self._rebalance(node)
+            if new_root is not node:
+                if i == 0:
+                    self.root = new_root
+                else:
+                    parent = path[i - 1]
+                    if parent.left is node:
+                        parent.left = new_root
+                    else:
+                        parent.right = new_root
+            if new_root.height == old_height:
+                break
+
+    def _rebalance(self, node: TreeNode) -> TreeNode:
+        """
+        :param node: root of a subtree whose children are balanced
+        :return: the new root of the balanced subtree
+        """
+        self._update_height(node)
+        balance = self._height(node.left) - self._height(node.right)
+        if balance > 1:
+            if self._height(node.left.left) < self._height(node.left.right):
+                node.left = self._rotate_left(node.left)
+            return self._rotate_right(node)
+        if balance < -1:
+            if self._height(node.right.right) < \
+                    self._height(node.right.left):
+                node.right = self._rotate_right(node.right)
+            return self._rotate_left(node)
+        return node
+
+    def _rotate_left(self, node: TreeNode) -> TreeNode:
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+        self._update_height(node)
+        self._update_height(pivot)
+        return pivot
+
+    def _rotate_right(self, node: TreeNode) -> TreeNode:
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+        self._update_height(node)
+        self._update_height(pivot)
+        return pivot
+
+    def _update_height(self, node: TreeNode) -> None:
+        left = self._height(node.left)
+        right = self._height(node.right)
+        node.height = (left if left > right else right) + 1
+
+    @staticmethod
+    def _height(node: Union[TreeNode, None]) -> int:
+        return node.height if node else 0
@@ -1,44 +1,66 @@
 from .binarysearchtree import BinarySearchTree
 from ..error import StorageException
 from ..error import ErrorType
-from typing import Union
+from typing import List, Union
 from .treenode import TreeNode
 from ..iterator import Iterator
 
 
 class InMemoryIterator(Iterator):
+    """
+    In-order cursor over a memory table. The cursor keeps a stack of the
+    nodes still to be visited (the pending ancestors of the current node
+    and the left spine of its right subtree), so next() is amortized O(1)
+    and a full walk is O(n). valid() only looks at that stack and never
+    searches the tree again.
+    The tree must not be modified while the cursor is in use.
+    """
+
     def __init__(self, database: BinarySearchTree) -> None:
         self.database = database
         self.cur: Union[None, TreeNode] = None
         self.start = True
+        self.stack: List[TreeNode] = []
 
     def seek(self, key: str) -> None:
-        if self.database.contain(key):
-            self.cur = self.database.get_node(key)
-        else:
-            self.seek_to_first()
-            raise StorageException(ErrorType.NOT_FOUND,
-                                   "This key cannot be found in store.")
+        stack: List[TreeNode] = []
+        node = self.database.root
+        while node:
+            if key == node.key:
+                self.cur = node
+                self.stack = stack
+                self._push_left_spine(node.right)
+                self.start = False
+                return
+            elif key < node.key:
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+        self.seek_to_first()
+        raise StorageException(ErrorType.NOT_FOUND,
+                               "This key cannot be found in store.")
 
     def seek_to_first(self) -> None:
         self.cur = None
         self.start = True
+        self.stack = []
 
     def valid(self) -> bool:
-        if self.database.find_min() is None:
-            return False
-        elif self.cur is None and self.start:
-            return True
-        elif self.database.find_next(self.cur):
-            return True
-        return False
+        if self.start:
+            return self.database.root is not None
+        return len(self.stack) > 0
 
     def next(self) -> None:
-        if self.cur is None and self.start:
-            self.cur = self.database.find_min()
+        if self.start:
+            self.stack = []
+            self._push_left_spine(self.database.root)
+            self.start = False
+        if self.stack:
+            self.cur = self.stack.pop()
+            self._push_left_spine(self.cur.right)
         else:
-            self.cur = self.database.find_next(self.cur)
-        self.start = False
+            self.cur = None
 
     def value(self) -> str:
         if self.cur:
@@ -60,3 +82,14 @@ class InMemoryIterator(Iterator):
         if self.cur and self.cur.remove:
             return True
         return False
+
+    def _push_left_spine(self, node: Union[None, TreeNode]) -> None:
+        """
+        push node and all of its left descendants onto the stack,
+        the smallest key ends up on top
+        :param node: root of the subtree to descend into
+        :return: None
+        """
+        while node:
+            self.stack.append(node)
+            node = node.left
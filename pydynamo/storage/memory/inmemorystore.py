@@ -1,19 +1,24 @@
-from .binarysearchtree import BinarySearchTree
+from .avltree import AVLTree
 from ..store import Store
 from ..error import StorageException
 from ..error import ErrorType
 from .inmemoryiterator import InMemoryIterator
+from .treenode import TreeNode
+from typing import Iterator, List, Tuple, Union
+import sys
 
 
 class InMemoryStore(Store):
     INT_SIZE = 4
     TIMESTAMP_SIZE = 8
     INDICATOR_SIZE = 4
+    NODE_MEMORY = sys.getsizeof(TreeNode("", None))
 
     def __init__(self, store_name):
         self.store_name = store_name
-        self.database = BinarySearchTree()
+        self.database = AVLTree()
         self.size = 0
+        self.memory_usage = 0
 
     def set(self, key: str, value: str) -> None:
         """
@@ -22,19 +27,29 @@ class InMemoryStore(Store):
         update size: 16 is the total size for key_size, val_size, timestamp
         updating size to track the size of sstable file
         if flush the memory table into ss table
+        the tree is descended once, upsert returns the previous state
+        of the node that the size is updated from.
+        key and value sizes are counted in utf-8 bytes, as they are
+        written to the sstable file
+        update memory_usage: the python objects of the node, key and value
         :return:
         """
-        if self.database.contain_not_removed(key):
-            prev_value = self.database.get(key)
-            self.database.update(key, value)
-            self.size = self.size - len(prev_value) + len(value)
-        elif self.database.contain(key):
-            self.database.update(key, value)
-            self.size = self.size + self.INT_SIZE + len(value)
-        else:
-            self.database.insert(key, value)
+        found, removed, prev_value = self.database.upsert(key, value)
+        val_size = len(value.encode())
+        if not found:
             self.size += self.INDICATOR_SIZE + self.INT_SIZE \
-                + len(key) + self.INT_SIZE + len(value) + self.TIMESTAMP_SIZE
+                + len(key.encode()) + self.INT_SIZE + val_size \
+                + self.TIMESTAMP_SIZE
+            self.memory_usage += self.NODE_MEMORY + sys.getsizeof(key) \
+                + sys.getsizeof(value)
+        elif removed:
+            self.size = self.size + self.INT_SIZE + val_size
+            self.memory_usage += sys.getsizeof(value) - \
+                self._object_memory(prev_value)
+        else:
+            self.size = self.size - len(prev_value.encode()) + val_size
+            self.memory_usage += sys.getsizeof(value) - \
+                self._object_memory(prev_value)
 
     def contain_key(self, key: str) -> bool:
         return self.database.contain(key)
@@ -45,28 +60,83 @@ class InMemoryStore(Store):
         return True
 
     def get(self, key: str) -> str:
-        if not self.database.contain_not_removed(key):
+        node = self.database.get_node(key)
+        if node is None or node.remove:
             raise StorageException(ErrorType.NOT_FOUND,
                                    "This key cannot be found in store.")
-        return self.database.get(key)
+        return node.value
+
+    def lookup(self, key: str) -> Tuple[bool, bool, Union[str, None]]:
+        """
+        :param key: the key to be found
+        :return: tuple (found, removed, value) from a single descent of
+        the tree. found is False if key is not in memory table
+        """
+        node = self.database.get_node(key)
+        if node is None:
+            return False, False, None
+        return True, node.remove, node.value
 
     def iterator(self) -> InMemoryIterator:
         return InMemoryIterator(self.database)
 
+    def records(self, start_key: Union[str, None] = None) \
+            -> Iterator[Tuple[str, Union[str, None]]]:
+        """
+        :param start_key: the records start at the first key that is not
+        less than start_key, None starts at the first key
+        :return: the records in key order as tuples (key, value), value is
+        None for a removed key. the tree must not be modified while the
+        records are read
+        """
+        stack: List[TreeNode] = []
+        node = self.database.root
+        while node:
+            if start_key is None or node.key >= start_key:
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node.key, None if node.remove else node.value
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+
     def remove(self, key: str) -> None:
-        if self.database.contain(key):
-            if self.database.contain_not_removed(key):
-                value = self.database.get(key)
-                self.database.remove(key)
-                self.size = self.size - self.INT_SIZE - len(value)
-        else:
-            self.database.remove(key)
+        found, removed, prev_value = self.database.tombstone(key)
+        if not found:
             self.size = self.size + self.INDICATOR_SIZE + \
-                self.INT_SIZE + len(key)
+                self.INT_SIZE + len(key.encode()) + self.TIMESTAMP_SIZE
+            self.memory_usage += self.NODE_MEMORY + sys.getsizeof(key)
+        elif not removed:
+            self.size = self.size - self.INT_SIZE - len(prev_value.encode())
 
     def clean(self) -> None:
-        self.database = BinarySearchTree()
+        self.database = AVLTree()
         self.size = 0
+        self.memory_usage = 0
 
     def get_size(self) -> int:
         return self.size
+
+    def length(self) -> int:
+        """
+        :return: the number of keys in memory table, removed keys included
+        """
+        return self.database.length()
+
+    def get_memory_usage(self) -> int:
+        """
+        :return: bytes of python objects held by this memory table:
+        tree nodes, keys and values
+        """
+        return self.memory_usage
+
+    @staticmethod
+    def _object_memory(value: Union[str, None]) -> int:
+        if value is None:
+            return 0
+        return sys.getsizeof(value)
@@ -1,7 +1,12 @@
 class TreeNode(object):
+    # a memory table holds millions of nodes, __slots__ keeps each of
+    # them to a fixed-size object without a per-instance __dict__
+    __slots__ = ("key", "value", "left", "right", "remove", "height")
+
     def __init__(self, key, value):
         self.key = key
         self.value = value
         self.left = None
         self.right = None
         self.remove = False
+        self.height = 1
@@ -0,0 +1,106 @@
+import math
+import random
+import unittest
+from pydynamo.storage.memory.avltree import AVLTree
+from pydynamo.storage.error import StorageException
+
+
+class AVLTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = AVLTree()
+        self.tree.insert("2", "abandon")
+        self.tree.insert("1", "definition")
+        self.tree.insert("4", "support")
+        self.tree.insert("3", "aggressive")
+
+    def _assert_balanced(self, tree: AVLTree) -> None:
+        def check(node) -> int:
+            if node is None:
+                return 0
+            left = check(node.left)
+            right = check(node.right)
+            self.assertTrue(abs(left - right) <= 1)
+            self.assertEqual(node.height, max(left, right) + 1)
+            if node.left:
+                self.assertTrue(node.left.key < node.key)
+            if node.right:
+                self.assertTrue(node.right.key > node.key)
+            return node.height
+        check(tree.root)
+        self.assertTrue(tree.height() <=
+                        1.45 * math.log2(tree.length() + 2))
+
+    def _keys(self, tree: AVLTree) -> list:
+        keys = []
+        node = tree.find_min()
+        while node:
+            keys.append(node.key)
+            node = tree.find_next(node)
+        return keys
+
+    def test_get_contain(self) -> None:
+        self.assertTrue(self.tree.contain("1"))
+        self.assertTrue(self.tree.contain("4"))
+        self.assertTrue(not self.tree.contain("5"))
+        self.assertEqual(self.tree.get("3"), "aggressive")
+        self.assertEqual(self.tree.get("5"), None)
+        self.assertEqual(self.tree.length(), 4)
+
+    def test_insert_existing_key(self) -> None:
+        self.tree.remove("2")
+        self.assertTrue(not self.tree.contain_not_removed("2"))
+        self.tree.insert("2", "again")
+        self.assertEqual(self.tree.get("2"), "again")
+        self.assertTrue(self.tree.contain_not_removed("2"))
+        self.assertEqual(self.tree.length(), 4)
+
+    def test_sequential_keys(self) -> None:
+        tree = AVLTree()
+        for i in range(20000):
+            tree.insert("%08d" % i, str(i))
+        self._assert_balanced(tree)
+        self.assertEqual(tree.length(), 20000)
+        for i in range(0, 20000, 7):
+            self.assertEqual(tree.get("%08d" % i), str(i))
+        self.assertEqual(self._keys(tree), sorted(self._keys(tree)))
+
+    def test_remove_node(self) -> None:
+        tree = AVLTree()
+        keys = ["%05d" % i for i in range(3000)]
+        for key in keys:
+            tree.insert(key, key)
+        shuffled = list(keys)
+        random.Random(7).shuffle(shuffled)
+        removed = set(shuffled[:2000])
+        for key in shuffled[:2000]:
+            tree.remove_node(key)
+        self._assert_balanced(tree)
+        self.assertEqual(tree.length(), 1000)
+        self.assertEqual(self._keys(tree),
+                         [key for key in keys if key not in removed])
+        with self.assertRaises(StorageException):
+            tree.remove_node(shuffled[0])
+
+    def test_remove_node_keeps_remove_flag(self) -> None:
+        self.tree.remove("3")
+        self.tree.remove_node("2")
+        self.assertTrue(not self.tree.contain_not_removed("3"))
+        self.assertTrue(self.tree.contain_not_removed("4"))
+
+    def test_upsert_tombstone(self) -> None:
+        self.assertEqual(self.tree.upsert("5", "new"), (False, False, None))
+        self.assertEqual(self.tree.upsert("5", "newer"),
+                         (True, False, "new"))
+        self.assertEqual(self.tree.tombstone("5"), (True, False, "newer"))
+        self.assertEqual(self.tree.tombstone("5"), (True, True, "newer"))
+        self.assertEqual(self.tree.upsert("5", "back"),
+                         (True, True, "newer"))
+        self.assertTrue(self.tree.contain_not_removed("5"))
+        self.assertEqual(self.tree.tombstone("6"), (False, False, None))
+        self.assertTrue(self.tree.contain("6"))
+        self.assertTrue(not self.tree.contain_not_removed("6"))
+        self.assertEqual(self.tree.length(), 6)
+        self._assert_balanced(self.tree)
+
+    def test_node_has_no_dict(self) -> None:
+        self.assertTrue(not hasattr(self.tree.root, "__dict__"))
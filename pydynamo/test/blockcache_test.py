@@ -0,0 +1,64 @@
+import unittest
+from pydynamo.storage.disk.blockcache import BlockCache
+from pydynamo.storage.error import StorageException
+
+
+class BlockCacheTest(unittest.TestCase):
+    def test_get_put(self):
+        cache = BlockCache(100)
+        table = cache.new_id()
+        self.assertEqual(cache.get(table, 0), None)
+        cache.put(table, 0, "block0", 10)
+        self.assertEqual(cache.get(table, 0), "block0")
+        self.assertEqual(cache.get(cache.new_id(), 0), None)
+        stats = cache.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["usage"], 10)
+
+    def test_new_id(self):
+        cache = BlockCache(100)
+        self.assertNotEqual(cache.new_id(), cache.new_id())
+
+    def test_evict_least_recently_used(self):
+        cache = BlockCache(30)
+        table = cache.new_id()
+        cache.put(table, 0, "block0", 10)
+        cache.put(table, 1, "block1", 10)
+        cache.put(table, 2, "block2", 10)
+        cache.get(table, 0)
+        cache.put(table, 3, "block3", 10)
+        self.assertEqual(cache.get(table, 1), None)
+        self.assertEqual(cache.get(table, 0), "block0")
+        self.assertEqual(cache.get(table, 2), "block2")
+        self.assertEqual(cache.get(table, 3), "block3")
+        self.assertEqual(cache.get_stats()["usage"], 30)
+
+    def test_replace(self):
+        cache = BlockCache(30)
+        cache.put(1, 0, "old", 20)
+        cache.put(1, 0, "new", 5)
+        self.assertEqual(cache.get(1, 0), "new")
+        self.assertEqual(cache.get_stats()["usage"], 5)
+
+    def test_too_large(self):
+        cache = BlockCache(10)
+        cache.put(1, 0, "large", 11)
+        self.assertEqual(cache.get(1, 0), None)
+        self.assertEqual(cache.get_stats()["usage"], 0)
+
+    def test_erase(self):
+        cache = BlockCache(100)
+        cache.put(1, 0, "a", 10)
+        cache.put(1, 5, "b", 10)
+        cache.put(2, 0, "c", 10)
+        cache.erase(1)
+        self.assertEqual(cache.get(1, 0), None)
+        self.assertEqual(cache.get(1, 5), None)
+        self.assertEqual(cache.get(2, 0), "c")
+        self.assertEqual(cache.get_stats()["usage"], 10)
+
+    def test_invalid_capacity(self):
+        with self.assertRaises(StorageException):
+            BlockCache(-1)
@@ -0,0 +1,34 @@
+import unittest
+from pydynamo.storage.disk.bloomfilter import BloomFilter
+
+
+class BloomFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.bloom_filter = BloomFilter.create(10, 10000)
+        for i in range(10000):
+            self.bloom_filter.add("key" + str(i))
+
+    def test_no_false_negative(self) -> None:
+        for i in range(10000):
+            self.assertTrue(self.bloom_filter.might_contain("key" + str(i)))
+
+    def test_false_positive_rate(self) -> None:
+        false_positives = 0
+        for i in range(10000):
+            if self.bloom_filter.might_contain("missing" + str(i)):
+                false_positives += 1
+        self.assertTrue(false_positives < 200)
+
+    def test_serialize(self) -> None:
+        loaded = BloomFilter.from_bytes(self.bloom_filter.to_bytes())
+        self.assertEqual(loaded.num_probes, self.bloom_filter.num_probes)
+        self.assertEqual(loaded.num_bits, self.bloom_filter.num_bits)
+        for i in range(0, 10000, 13):
+            self.assertTrue(loaded.might_contain("key" + str(i)))
+            self.assertEqual(loaded.might_contain("missing" + str(i)),
+                             self.bloom_filter.might_contain(
+                                 "missing" + str(i)))
+
+    def test_empty(self) -> None:
+        bloom_filter = BloomFilter.create(10, 0)
+        self.assertTrue(not bloom_filter.might_contain("key"))
@@ -0,0 +1,101 @@
+import unittest
+
+from pydynamo.storage.disk.compaction import LeveledCompaction
+from pydynamo.storage.disk.compaction import SizeTieredCompaction
+from pydynamo.storage.disk.sstable import SSTable
+from pydynamo.storage.error import StorageException
+
+
+def sstable(id, level, size, smallest, largest):
+    """
+    :return: a sstable with the given level, size and key range that
+    has no files, for picking compactions
+    """
+    ss_table = SSTable("test", id, size, [], "/nonexistent", 0)
+    ss_table.level = level
+    ss_table.set_key_range((smallest, largest))
+    return ss_table
+
+
+class LeveledCompactionTest(unittest.TestCase):
+    def test_invalid(self):
+        with self.assertRaises(StorageException):
+            LeveledCompaction(level0_trigger=0)
+        with self.assertRaises(StorageException):
+            LeveledCompaction(size_ratio=1)
+
+    def test_level0(self):
+        strategy = LeveledCompaction(level0_trigger=2, base_level_size=1000)
+        level1 = [sstable(1, 1, 100, "a", "c"), sstable(2, 1, 100, "d", "f"),
+                  sstable(3, 1, 100, "x", "z")]
+        first = sstable(4, 0, 10, "b", "b")
+        self.assertEqual(strategy.pick(level1 + [first]), None)
+        second = sstable(5, 0, 10, "e", "e")
+        compaction = strategy.pick(level1 + [first, second])
+        self.assertEqual(compaction.output_level, 1)
+        self.assertEqual(compaction.inputs,
+                         [first, second, level1[0], level1[1]])
+        self.assertFalse(compaction.is_trivial_move())
+
+    def test_deeper_level_round_robin(self):
+        strategy = LeveledCompaction(base_level_size=100, size_ratio=10)
+        level1 = [sstable(1, 1, 60, "a", "c"), sstable(2, 1, 60, "d", "f")]
+        level2 = [sstable(3, 2, 100, "e", "g")]
+        self.assertEqual(strategy.scores(level1 + level2)[1:3], [1.2, 0.1])
+        compaction = strategy.pick(level1 + level2)
+        self.assertEqual(compaction.inputs, [level1[0]])
+        self.assertEqual(compaction.output_level, 2)
+        self.assertTrue(compaction.is_trivial_move())
+        compaction = strategy.pick(level1 + level2)
+        self.assertEqual(compaction.inputs, [level1[1], level2[0]])
+        compaction = strategy.pick(level1 + level2)
+        self.assertEqual(compaction.inputs, [level1[0]])
+
+    def test_last_level_not_compacted(self):
+        strategy = LeveledCompaction(base_level_size=1, max_levels=2)
+        self.assertEqual(strategy.pick([sstable(1, 1, 100, "a", "z")]),
+                         None)
+
+
+class SizeTieredCompactionTest(unittest.TestCase):
+    def test_invalid(self):
+        with self.assertRaises(StorageException):
+            SizeTieredCompaction(min_threshold=1)
+        with self.assertRaises(StorageException):
+            SizeTieredCompaction(min_threshold=4, max_threshold=3)
+        with self.assertRaises(StorageException):
+            SizeTieredCompaction(bucket_high=0.9)
+
+    def test_buckets(self):
+        strategy = SizeTieredCompaction(min_sstable_size=10)
+        ss_tables = [sstable(1, 0, 1000, "a", "z"),
+                     sstable(2, 0, 1400, "a", "z"),
+                     sstable(3, 0, 100, "a", "z"),
+                     sstable(4, 0, 120, "a", "z"),
+                     sstable(5, 0, 2, "a", "z"),
+                     sstable(6, 0, 9, "a", "z"),
+                     sstable(7, 0, 90, "a", "z")]
+        self.assertEqual(strategy.buckets(ss_tables),
+                         [ss_tables[0:2], ss_tables[2:4], ss_tables[4:6],
+                          ss_tables[6:]])
+        self.assertEqual(strategy.get_stats(ss_tables)["buckets"],
+                         [[2, 1200], [2, 110], [2, 5], [1, 90]])
+
+    def test_pick(self):
+        strategy = SizeTieredCompaction(min_threshold=2, max_threshold=3,
+                                        min_sstable_size=0)
+        large = [sstable(1, 0, 1000, "a", "z"), sstable(2, 0, 1000, "a", "z")]
+        self.assertEqual(strategy.pick(large[:1]), None)
+        small = [sstable(id, 0, 100, "a", "z") for id in range(3, 7)]
+        compaction = strategy.pick(large + small)
+        self.assertEqual(compaction.inputs, small[:3])
+        self.assertEqual(compaction.output_level, 0)
+        compaction = strategy.pick(large + small[:2])
+        self.assertEqual(compaction.inputs, small[:2])
+
+    def test_runs_of_similar_size(self):
+        strategy = SizeTieredCompaction(min_threshold=2, min_sstable_size=0)
+        ss_tables = [sstable(1, 0, 100, "a", "z"),
+                     sstable(2, 0, 1000, "a", "z"),
+                     sstable(3, 0, 100, "a", "z")]
+        self.assertEqual(strategy.pick(ss_tables), None)
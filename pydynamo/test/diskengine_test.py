@@ -0,0 +1,114 @@
+import unittest
+import tempfile
+from pydynamo.storage.disk.diskengine import DiskStorageEngine
+from pydynamo.storage.disk.diskstore import DiskStore
+from pydynamo.storage.error import StorageException
+
+
+class DiskStorageEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_create_get_store(self):
+        engine = DiskStorageEngine(self.tempdir.name, 100000, 100000)
+        new_store = engine.create_store("test")
+        self.assertTrue(isinstance(new_store, DiskStore))
+        with self.assertRaises(StorageException):
+            engine.create_store("test")
+        with self.assertRaises(StorageException):
+            engine.get_store("bad")
+        self.assertEqual(engine.get_store("test"), new_store)
+
+    def test_create_store_compression(self):
+        engine = DiskStorageEngine(self.tempdir.name, 100000, 100000)
+        store = engine.create_store("test", compression="zlib")
+        for i in range(100):
+            store.set("key" + str(i), "value " * 20)
+        store.flush()
+        self.assertEqual(store.get("key42"), "value " * 20)
+        self.assertTrue(store.ss_tables[0].size < 100 * 120)
+        store.close()
+        with self.assertRaises(StorageException):
+            engine.create_store("other", compression="snappy")
+
+    def test_shared_block_cache(self):
+        engine = DiskStorageEngine(self.tempdir.name, 100000, 100000,
+                                   block_cache_size=1000000)
+        first = engine.create_store("first")
+        second = engine.create_store("second")
+        self.assertTrue(first.block_cache is second.block_cache)
+        first.set("key", "first")
+        second.set("key", "second")
+        first.flush()
+        second.flush()
+        self.assertEqual(first.get("key"), "first")
+        self.assertEqual(second.get("key"), "second")
+        self.assertEqual(first.get("key"), "first")
+        stats = engine.get_block_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertEqual(stats["entries"], 2)
+        first.close()
+        second.close()
+
+    def test_shared_rate_limiter(self):
+        engine = DiskStorageEngine(self.tempdir.name, 100000, 100000,
+                                   background_bytes_per_second=10 ** 9)
+        first = engine.create_store("first")
+        second = engine.create_store("second")
+        self.assertTrue(first.rate_limiter is engine.rate_limiter)
+        self.assertTrue(second.rate_limiter is engine.rate_limiter)
+        for store in (first, second):
+            for i in range(100):
+                store.set("key" + str(i), "value" + str(i))
+            store.flush()
+        stats = engine.get_rate_limiter_stats()
+        self.assertEqual(stats["bytes_per_second"], 10 ** 9)
+        self.assertEqual(stats["requested_bytes"],
+                         first.ss_tables[0].size + second.ss_tables[0].size)
+        first.close()
+        second.close()
+
+    def test_invalid_budget(self):
+        with self.assertRaises(StorageException):
+            DiskStorageEngine(self.tempdir.name, 100000, 0)
+
+    def test_memory_budget(self):
+        budget = 20000
+        engine = DiskStorageEngine(self.tempdir.name, 10 ** 9, budget)
+        big = engine.create_store("big")
+        small = engine.create_store("small")
+        for i in range(50):
+            small.set("small" + str(i), "value" + str(i))
+        small_usage = small.get_memory_usage()
+        for i in range(500):
+            big.set("big" + str(i), "value" + str(i))
+            self.assertTrue(engine.get_memory_usage() <= budget)
+            self.assertEqual(engine.get_memory_usage(),
+                             big.get_memory_usage() +
+                             small.get_memory_usage())
+        self.assertTrue(len(big.ss_tables) > 0)
+        self.assertEqual(len(small.ss_tables), 0)
+        self.assertEqual(small.get_memory_usage(), small_usage)
+        for i in range(500):
+            self.assertEqual(big.get("big" + str(i)), "value" + str(i))
+
+    def test_memory_budget_flush_failure(self):
+        engine = DiskStorageEngine(self.tempdir.name, 10 ** 9, 20000)
+        broken = engine.create_store("broken")
+        healthy = engine.create_store("healthy")
+
+        for i in range(100):
+            broken.set("broken" + str(i), "value" + str(i))
+
+        def fail(mem_table, time_stamp):
+            raise OSError("disk full")
+        broken.create_sstable = fail
+        for i in range(300):
+            healthy.set("healthy" + str(i), "value" + str(i))
+        self.assertTrue(len(healthy.ss_tables) > 0)
+        self.assertEqual(len(broken.ss_tables), 0)
+        for i in range(100):
+            self.assertEqual(broken.get("broken" + str(i)), "value" + str(i))
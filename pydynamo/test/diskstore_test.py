@@ -1,6 +1,14 @@
 import unittest
+from unittest import mock
+from concurrent.futures.process import BrokenProcessPool
 from ..storage.disk.diskstore import DiskStore
+from ..storage.disk.compaction import LeveledCompaction
+from ..storage.disk.compaction import SizeTieredCompaction
+from ..storage.disk.ratelimiter import RateLimiter
+from ..storage.error import StorageException
+import os
 import tempfile
+import threading
 
 
 class DiskStoreTest(unittest.TestCase):
@@ -9,91 +17,115 @@ class DiskStoreTest(unittest.TestCase):
         create a sstable stored in temp directory
         :return:
         """
-        with tempfile.TemporaryDirectory() as tempdirname:
-            self.disk_2000 = DiskStore("test1", tempdirname, 2000)
-            self.disk_200 = DiskStore("test2", tempdirname, 200)
-            self.disk_20 = DiskStore("test3", tempdirname, 20)
-            self.dis = DiskStore("test4", tempdirname, 10)
-            for i in range(100):
-                self.disk_2000.set(str(i), "result" + str(i))
-                self.disk_200.set(str(i), "result" + str(i))
-                self.disk_20.set(str(i), "result" + str(i))
-            for i in range(50):
-                self.disk_2000.set(str(i), "new" + str(i))
-                self.disk_200.set(str(i), "new" + str(i))
-                self.disk_20.set(str(i), "new" + str(i))
+        self.tempdir = tempfile.TemporaryDirectory()
+        tempdirname = self.tempdir.name
+        self.disk_2000 = DiskStore("test1", tempdirname, 2000)
+        self.disk_200 = DiskStore("test2", tempdirname, 200)
+        self.disk_20 = DiskStore("test3", tempdirname, 20)
+        self.dis = DiskStore("test4", tempdirname, 10)
+        for i in range(100):
+            self.disk_2000.set(str(i), "result" + str(i))
+            self.disk_200.set(str(i), "result" + str(i))
+            self.disk_20.set(str(i), "result" + str(i))
+        for i in range(50):
+            self.disk_2000.set(str(i), "new" + str(i))
+            self.disk_200.set(str(i), "new" + str(i))
+            self.disk_20.set(str(i), "new" + str(i))
+
+    def tearDown(self):
+        for disk in [self.disk_2000, self.disk_200, self.disk_20, self.dis]:
+            disk.close()
+        self.tempdir.cleanup()
 
     def test_iterator(self):
         print("TEST iterator ")
-        with tempfile.TemporaryDirectory() as tempdirname:
-            disk = DiskStore("temp", tempdirname, 20)
-            for i in range(100):
-                disk.set(str(i), "result" + str(i))
-            for i in range(100):
-                self.assertEqual(disk.get(str(i)), "result" + str(i))
-            for i in range(100):
-                if i % 2 == 0:
-                    disk.remove(str(i))
-            for i in range(100):
-                if i % 4 == 0:
-                    disk.set(str(i), "new" + str(i))
-            iterator = disk.iterator()
-            j = 0
-            while iterator.valid():
-                iterator.next()
-                self.assertEqual(iterator.key(), str(j))
-                self.assertEqual(iterator.value(), "result" + str(j))
-                j += 1
-                if j % 4 == 0:
-                    continue
-                elif j % 2 == 0:
-                    j += 1
+        for threshold in (20, 200, 1000):
+            with tempfile.TemporaryDirectory() as tempdirname:
+                disk = DiskStore("temp", tempdirname, threshold)
+                disk.set_auto_compaction(False)
+                for i in range(100):
+                    disk.set(str(i), "result" + str(i))
+                for i in range(100):
+                    self.assertEqual(disk.get(str(i)), "result" + str(i))
+                for i in range(100):
+                    if i % 2 == 0:
+                        disk.remove(str(i))
+                for i in range(100):
+                    if i % 4 == 0:
+                        disk.set(str(i), "new" + str(i))
+                ss_tables = list(disk.ss_tables)
+                iterator = disk.iterator()
+                for ss_table in ss_tables:
+                    self.assertTrue(ss_table in disk.ss_tables)
+                self.assertEqual(disk.compaction_count, 0)
+                expected = {}
+                for i in range(100):
+                    if i % 4 == 0:
+                        expected[str(i)] = "new" + str(i)
+                    elif i % 2 == 1:
+                        expected[str(i)] = "result" + str(i)
+                items = []
+                while iterator.valid():
+                    iterator.next()
+                    items.append((iterator.key(), iterator.value()))
+                self.assertEqual(items, sorted(expected.items()))
+                disk.close()
+
+    def test_iterator_snapshot(self):
+        print("TEST iterator snapshot ")
         with tempfile.TemporaryDirectory() as tempdirname:
             disk = DiskStore("temp", tempdirname, 200)
+            disk.set_auto_compaction(False)
             for i in range(100):
-                disk.set(str(i), "result" + str(i))
-            for i in range(100):
-                self.assertEqual(disk.get(str(i)), "result" + str(i))
-            for i in range(100):
-                if i % 2 == 0:
-                    disk.remove(str(i))
-            for i in range(100):
-                if i % 4 == 0:
-                    disk.set(str(i), "new" + str(i))
+                disk.set(str(i).zfill(3), "result" + str(i))
+            disk.remove("050")
             iterator = disk.iterator()
-            j = 0
+            disk.set("050", "new")
+            disk.remove("051")
+            disk.set("100", "result100")
+            disk.flush()
+            disk.merge()
+            iterator.seek("049")
+            iterator.next()
+            self.assertEqual(iterator.key(), "051")
+            with self.assertRaises(StorageException):
+                iterator.seek("050")
+            keys = []
             while iterator.valid():
                 iterator.next()
-                self.assertEqual(iterator.key(), str(j))
-                self.assertEqual(iterator.value(), "result" + str(j))
-                j += 1
-                if j % 4 == 0:
-                    continue
-                elif j % 2 == 0:
-                    j += 1
-        with tempfile.TemporaryDirectory() as tempdirname:
-            disk = DiskStore("temp", tempdirname, 1000)
-            for i in range(100):
-                disk.set(str(i), "result" + str(i))
-            for i in range(100):
-                self.assertEqual(disk.get(str(i)), "result" + str(i))
-            for i in range(100):
-                if i % 2 == 0:
-                    disk.remove(str(i))
-            for i in range(100):
-                if i % 4 == 0:
-                    disk.set(str(i), "new" + str(i))
+                keys.append(iterator.key())
+            self.assertEqual(keys, [str(i).zfill(3) for i in range(100)
+                                    if i != 50])
             iterator = disk.iterator()
-            j = 0
-            while iterator.valid():
+            iterator.seek("050")
+            self.assertEqual(iterator.value(), "new")
+            iterator.next()
+            self.assertEqual(iterator.key(), "052")
+            disk.close()
+
+    def test_iterator_moves_mem_table(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            with disk.flush_lock:
+                for i in range(100):
+                    disk.set(str(i).zfill(3), "result" + str(i))
+                mem_table = disk.mem_table
+                iterator = disk.iterator()
+                self.assertEqual(disk.mem_table.get_size(), 0)
+                self.assertEqual(disk.immutable_mem_tables, [mem_table])
+                disk.set("000", "new")
+                self.assertTrue(iterator.valid())
                 iterator.next()
-                self.assertEqual(iterator.key(), str(j))
-                self.assertEqual(iterator.value(), "result" + str(j))
-                j += 1
-                if j % 4 == 0:
-                    continue
-                elif j % 2 == 0:
-                    j += 1
+                self.assertEqual(iterator.value(), "result0")
+                disk.iterator()
+                self.assertEqual(len(disk.immutable_mem_tables), 2)
+                disk.iterator()
+                self.assertEqual(len(disk.immutable_mem_tables), 2)
+            disk.flush()
+            self.assertEqual(len(disk.ss_tables), 2)
+            self.assertEqual(disk.get("000"), "new")
+            disk.close()
 
     def test_remove(self):
         print("TEST remove ")
@@ -111,6 +143,7 @@ class DiskStoreTest(unittest.TestCase):
                     self.assertEqual(disk.get(str(i)), None)
                 else:
                     self.assertEqual(disk.get(str(i)), "result" + str(i))
+            disk.close()
         with tempfile.TemporaryDirectory() as tempdirname:
             disk = DiskStore("temp", tempdirname, 200)
             for i in range(100):
@@ -125,6 +158,7 @@ class DiskStoreTest(unittest.TestCase):
                     self.assertEqual(disk.get(str(i)), None)
                 else:
                     self.assertEqual(disk.get(str(i)), "result" + str(i))
+            disk.close()
         with tempfile.TemporaryDirectory() as tempdirname:
             disk = DiskStore("temp", tempdirname, 20)
             for i in range(100):
@@ -139,6 +173,7 @@ class DiskStoreTest(unittest.TestCase):
                     self.assertEqual(disk.get(str(i)), None)
                 else:
                     self.assertEqual(disk.get(str(i)), "result" + str(i))
+            disk.close()
 
     def test_get(self):
         for i in range(50):
@@ -162,6 +197,7 @@ class DiskStoreTest(unittest.TestCase):
                 disk.set(str(i), "new" + str(i))
             for i in range(100):
                 self.assertEqual(disk.get(str(i)), "new" + str(i))
+            disk.close()
         with tempfile.TemporaryDirectory() as tempdirname:
             disk = DiskStore("temp", tempdirname, 200)
             for i in range(100):
@@ -172,6 +208,7 @@ class DiskStoreTest(unittest.TestCase):
                 disk.set(str(i), "new" + str(i))
             for i in range(100):
                 self.assertEqual(disk.get(str(i)), "new" + str(i))
+            disk.close()
         with tempfile.TemporaryDirectory() as tempdirname:
             disk = DiskStore("temp", tempdirname, 20)
             for i in range(100):
@@ -182,3 +219,731 @@ class DiskStoreTest(unittest.TestCase):
                 disk.set(str(i), "new" + str(i))
             for i in range(100):
                 self.assertEqual(disk.get(str(i)), "new" + str(i))
+            disk.close()
+
+    def test_background_flush(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 200)
+            disk.set_auto_compaction(False)
+            disk.set_max_pending_flushes(1)
+            for i in range(300):
+                disk.set(str(i), "result" + str(i))
+            for i in range(300):
+                self.assertEqual(disk.get(str(i)), "result" + str(i))
+            disk.flush()
+            self.assertEqual(disk.immutable_mem_tables, [])
+            self.assertTrue(len(disk.ss_tables) > 1)
+            for i in range(300):
+                self.assertEqual(disk.get(str(i)), "result" + str(i))
+            disk.close()
+
+    def test_reads_and_writes_during_flush(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 200)
+            disk.set_max_pending_flushes(2)
+            disk.flush_lock.acquire()
+            disk.set("0", "result0")
+            disk.remove("0")
+            i = 1
+            while len(disk.immutable_mem_tables) < 2:
+                disk.set(str(i), "result" + str(i))
+                i += 1
+            while disk.mem_table.get_size() < 200:
+                disk.set(str(i), "result" + str(i))
+                i += 1
+            self.assertEqual(disk.get("0"), None)
+            for j in range(1, i):
+                self.assertEqual(disk.get(str(j)), "result" + str(j))
+            writer = threading.Thread(target=disk.set,
+                                      args=("blocked", "value"))
+            writer.start()
+            writer.join(0.2)
+            self.assertTrue(writer.is_alive())
+            self.assertEqual(disk.ss_tables, [])
+            disk.flush_lock.release()
+            writer.join()
+            self.assertEqual(disk.get("blocked"), "value")
+            disk.flush()
+            self.assertEqual(disk.get("0"), None)
+            for j in range(1, i):
+                self.assertEqual(disk.get(str(j)), "result" + str(j))
+            disk.close()
+
+    def test_write_stall_sstables(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6,
+                             compaction_strategy=LeveledCompaction(
+                                 level0_trigger=100))
+            with self.assertRaises(StorageException):
+                disk.set_write_stall_limits(3, 3)
+            with self.assertRaises(StorageException):
+                disk.set_write_stall_limits(1, 3, 100, 0)
+            disk.set_write_stall_limits(2, 4, stall_delay=0.01)
+            for i in range(3):
+                disk.set(str(i), "result" + str(i))
+                disk.flush()
+            stats = disk.get_stats()["write_stall"]
+            self.assertEqual(stats["slowdowns"], 1)
+            self.assertEqual(stats["unmerged_sstables"], 3)
+            disk.set("3", "result3")
+            stats = disk.get_stats()["write_stall"]
+            self.assertEqual(stats["slowdowns"], 2)
+            # 2 unmerged sstables sleep 0.01, 3 of 4 sleep 5.5 times longer
+            self.assertAlmostEqual(stats["slowdown_seconds"],
+                                   0.01 + 0.01 * (1 + 4.5))
+            disk.flush()
+            writer = threading.Thread(target=disk.set,
+                                      args=("blocked", "value"))
+            writer.start()
+            writer.join(0.2)
+            self.assertTrue(writer.is_alive())
+            disk.set_compaction_strategy(LeveledCompaction(level0_trigger=2))
+            writer.join()
+            stats = disk.get_stats()["write_stall"]
+            self.assertEqual(stats["stops"], 1)
+            self.assertTrue(stats["stop_seconds"] >= 0.2)
+            self.assertEqual(stats["unmerged_sstables"], 0)
+            self.assertEqual(disk.get("blocked"), "value")
+            disk.set_auto_compaction(False)
+            for i in range(5):
+                disk.set(str(i), "new" + str(i))
+                disk.flush()
+            self.assertEqual(disk.get_stats()["write_stall"]["stops"], 1)
+            disk.close()
+
+    def test_write_stall_compaction_error(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 100)
+            disk.set_write_stall_limits(2, 4, stall_delay=0)
+
+            def fail(compaction):
+                raise OSError("disk failure")
+            disk._run_compaction = fail
+            errors = 0
+            for i in range(300):
+                try:
+                    disk.set(str(i).zfill(3), "value")
+                except StorageException:
+                    errors += 1
+                self.assertTrue(len(disk.ss_tables) <=
+                                4 + disk.max_pending_flushes + 1)
+            self.assertTrue(errors > 0)
+            self.assertTrue(disk.get_stats()["write_stall"]["stops"] >=
+                            errors)
+            del disk._run_compaction
+            for i in range(300):
+                disk.set(str(i).zfill(3), "new")
+            disk.close()
+            self.assertEqual(disk.get("299"), "new")
+
+    def test_write_stall_pending_bytes(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 200)
+            disk.set_max_pending_flushes(100)
+            disk.flush_lock.acquire()
+            i = 0
+            while not disk.immutable_mem_tables:
+                disk.set(str(i), "result" + str(i))
+                i += 1
+            pending = disk.get_stats()["write_stall"]["pending_flush_bytes"]
+            self.assertEqual(
+                pending, disk.immutable_mem_tables[0].get_memory_usage())
+            disk.set_write_stall_limits(20, 36, pending, 2 * pending,
+                                        stall_delay=0)
+            disk.set("a", "b")
+            self.assertEqual(disk.get_stats()["write_stall"]["slowdowns"], 1)
+            while len(disk.immutable_mem_tables) < 2:
+                disk.set(str(i), "result" + str(i))
+                i += 1
+            writer = threading.Thread(target=disk.set,
+                                      args=("blocked", "value"))
+            writer.start()
+            writer.join(0.2)
+            self.assertTrue(writer.is_alive())
+            disk.flush_lock.release()
+            writer.join()
+            self.assertEqual(disk.get_stats()["write_stall"]["stops"], 1)
+            self.assertEqual(disk.get("blocked"), "value")
+            disk.close()
+
+    def test_set_max_pending_flushes(self):
+        with self.assertRaises(StorageException):
+            self.dis.set_max_pending_flushes(0)
+
+    def test_flush_error_recovery(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            for i in range(10):
+                disk.set(str(i), "result" + str(i))
+            create_sstable = disk.create_sstable
+
+            def fail(mem_table, time_stamp):
+                raise OSError("disk full")
+            disk.create_sstable = fail
+            with self.assertRaises(StorageException):
+                disk.flush()
+            self.assertEqual(len(disk.immutable_mem_tables), 1)
+            for i in range(10):
+                self.assertEqual(disk.get(str(i)), "result" + str(i))
+            disk.create_sstable = create_sstable
+            disk.set("10", "result10")
+            disk.flush()
+            self.assertEqual(disk.immutable_mem_tables, [])
+            for i in range(11):
+                self.assertEqual(disk.get(str(i)), "result" + str(i))
+            disk.close()
+
+    def test_close_flushes_mem_table(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set("key", "value")
+            disk.close()
+            self.assertEqual(disk.mem_table.get_size(), 0)
+            self.assertEqual(len(disk.ss_tables), 1)
+            self.assertEqual(disk.get("key"), "value")
+
+    def test_get_newest_first(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set("a", "old")
+            disk.set("b", "old")
+            disk.flush()
+            disk.set("a", "new")
+            disk.remove("b")
+            disk.flush()
+            oldest = disk.ss_tables[0]
+
+            def fail(key):
+                raise AssertionError("older sstable should not be read")
+            oldest.lookup = fail
+            self.assertEqual(disk.get("a"), "new")
+            self.assertEqual(disk.get("b"), None)
+            disk.close()
+
+    def test_get_single_probe(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set("a", "value")
+            disk.flush()
+            ss_table = disk.ss_tables[0]
+            ss_table.get = None
+            ss_table.get_timestamp = None
+            ss_table.contain = None
+            self.assertEqual(disk.get("a"), "value")
+            self.assertEqual(disk.get("missing"), None)
+            disk.close()
+
+    def test_row_cache(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_row_cache_size(10)
+            disk.set("a", "old")
+            disk.set("b", "old")
+            disk.flush()
+            self.assertEqual(disk.get("a"), "old")
+            self.assertEqual(disk.get("missing"), None)
+            ss_table = disk.ss_tables[0]
+            lookup = ss_table.lookup
+
+            def fail(key):
+                raise AssertionError("cached key should not be looked up")
+            ss_table.lookup = fail
+            self.assertEqual(disk.get("a"), "old")
+            self.assertEqual(disk.get("missing"), None)
+            stats = disk.row_cache.get_stats()
+            self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+            ss_table.lookup = lookup
+            disk.set("a", "new")
+            disk.remove("b")
+            self.assertEqual(disk.get("a"), "new")
+            self.assertEqual(disk.get("b"), None)
+            disk.flush()
+            self.assertEqual(disk.get("a"), "new")
+            self.assertEqual(disk.get("b"), None)
+            disk.set("missing", "found")
+            disk.flush()
+            self.assertEqual(disk.get("missing"), "found")
+            disk.merge()
+            self.assertEqual(disk.get("a"), "new")
+            self.assertEqual(disk.get("b"), None)
+            self.assertEqual(disk.get("missing"), "found")
+            disk.close()
+
+    def test_row_cache_bounded(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_row_cache_size(5)
+            for i in range(20):
+                disk.set(str(i), "value" + str(i))
+            disk.flush()
+            for i in range(20):
+                self.assertEqual(disk.get(str(i)), "value" + str(i))
+            self.assertEqual(disk.row_cache.get_stats()["entries"], 5)
+            disk.set_row_cache_size(0)
+            self.assertEqual(disk.row_cache, None)
+            self.assertEqual(disk.get("3"), "value3")
+            with self.assertRaises(StorageException):
+                disk.set_row_cache_size(-1)
+            disk.close()
+
+    def test_recover_from_log(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            for wal_sync_mode in ("none", "always", "group"):
+                disk = DiskStore(wal_sync_mode, tempdirname, 10 ** 6,
+                                 wal_sync_mode=wal_sync_mode)
+                for i in range(20):
+                    disk.set(str(i), "result" + str(i))
+                disk.remove("3")
+                # the process dies without close()
+                disk = DiskStore(wal_sync_mode, tempdirname, 10 ** 6,
+                                 wal_sync_mode=wal_sync_mode)
+                self.assertEqual(disk.get("3"), None)
+                for i in range(4, 20):
+                    self.assertEqual(disk.get(str(i)), "result" + str(i))
+                disk.set("20", "result20")
+                disk = DiskStore(wal_sync_mode, tempdirname, 10 ** 6,
+                                 wal_sync_mode=wal_sync_mode)
+                self.assertEqual(disk.get("5"), "result5")
+                self.assertEqual(disk.get("20"), "result20")
+                disk.close()
+
+    def test_log_deleted_after_flush(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10)
+            disk.set_auto_compaction(False)
+            for i in range(25):
+                disk.set(str(i), "result" + str(i))
+            disk.flush()
+            self.assertTrue(len(disk.ss_tables) > 1)
+            self.assertEqual(os.listdir(disk.wal_dir), [])
+            disk.set("25", "result25")
+            self.assertEqual(len(os.listdir(disk.wal_dir)), 1)
+            disk.close()
+            self.assertEqual(os.listdir(disk.wal_dir), [])
+
+    def test_log_removal_retried(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            disk.set("key", "value")
+            # a crash before the flush leaves the log to replay
+            disk.wal.close()
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            disk.set("other", "value")
+            self.assertEqual(len(os.listdir(disk.wal_dir)), 2)
+            remove = os.remove
+
+            def remove_then_fail(file_path):
+                remove(file_path)
+                if file_path.startswith(disk.wal_dir):
+                    raise OSError("disk failure")
+            with mock.patch("os.remove", side_effect=remove_then_fail):
+                with self.assertRaises(StorageException):
+                    disk.flush()
+            self.assertEqual(len(os.listdir(disk.wal_dir)), 1)
+            disk.flush()
+            self.assertEqual(os.listdir(disk.wal_dir), [])
+            self.assertEqual(disk.get("key"), "value")
+            self.assertEqual(disk.get("other"), "value")
+            disk.close()
+
+    def test_log_off(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            with self.assertRaises(StorageException):
+                DiskStore("temp", tempdirname, 10, wal_sync_mode="sometimes")
+            disk = DiskStore("temp", tempdirname, 10 ** 6,
+                             wal_sync_mode="off")
+            disk.set("key", "value")
+            self.assertEqual(os.listdir(disk.wal_dir), [])
+            disk.close()
+
+    def test_reopen_from_manifest(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            for i in range(3):
+                for j in range(10):
+                    disk.set(str(j), "result" + str(i) + str(j))
+                disk.remove(str(i))
+                disk.flush()
+            disk.close()
+            ids = [ss_table.id for ss_table in disk.ss_tables]
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            self.assertEqual([ss_table.id for ss_table in disk.ss_tables],
+                             ids)
+            for ss_table in disk.ss_tables:
+                self.assertTrue(ss_table._reader is None)
+            self.assertEqual(disk.get("2"), None)
+            self.assertEqual(disk.get("1"), "result21")
+            self.assertEqual(disk.get("5"), "result25")
+            disk.set("5", "new")
+            disk.flush()
+            self.assertTrue(disk.ss_tables[-1].id > max(ids))
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            self.assertEqual(len(disk.ss_tables), len(ids) + 1)
+            self.assertEqual(disk.get("5"), "new")
+            self.assertEqual(disk.get("6"), "result26")
+            disk.close()
+
+    def test_reopen_deletes_unlisted_sstables(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set("a", "1")
+            disk.flush()
+            manifest = disk.manifest.load()
+            disk.set("b", "2")
+            disk.flush()
+            # the process dies after writing the sstable, before the
+            # manifest lists it
+            disk.manifest.save(manifest[0], disk.ss_tables[:1])
+            disk = DiskStore("temp", tempdirname, 10 ** 6,
+                             wal_sync_mode="off")
+            self.assertEqual(len(disk.ss_tables), 1)
+            self.assertEqual(len(os.listdir(disk.ss_table_dir)), 1)
+            self.assertEqual(disk.get("a"), "1")
+
+    def test_reopen_without_manifest(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set("a", "1")
+            disk.flush()
+            disk.set("a", "2")
+            disk.set("b", "3")
+            disk.close()
+            os.remove(disk.manifest.file_path)
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            self.assertEqual([ss_table.id for ss_table in disk.ss_tables],
+                             [0, 1])
+            self.assertTrue(disk.manifest.exists())
+            self.assertEqual(disk.get("a"), "2")
+            self.assertEqual(disk.get("b"), "3")
+            disk.set("c", "4")
+            disk.close()
+            self.assertEqual(disk.ss_tables[-1].id, 2)
+
+    def test_background_compaction(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.compaction_strategy = LeveledCompaction(
+                level0_trigger=2, base_level_size=2000, size_ratio=2)
+            for round in range(10):
+                for i in range(100):
+                    disk.set(str(i).zfill(3), "result" + str(round))
+                for i in range(round * 10, round * 10 + 10):
+                    disk.remove(str(i).zfill(3))
+                disk.flush()
+            disk.close()
+            self.assertTrue(disk.compaction_count > 0)
+            disk.compact()
+            strategy = disk.compaction_strategy
+            self.assertTrue(max(strategy.scores(disk.ss_tables)) < 1)
+            self.assertTrue(len(disk.ss_tables) < 10)
+            levels = strategy.levels(disk.ss_tables)
+            for level in levels[1:]:
+                key_ranges = sorted(ss_table.key_range()
+                                    for ss_table in level)
+                for left, right in zip(key_ranges, key_ranges[1:]):
+                    self.assertTrue(left[1] < right[0])
+            self.assertEqual(len(os.listdir(disk.ss_table_dir)),
+                             len(disk.ss_tables))
+            for i in range(90):
+                self.assertEqual(disk.get(str(i).zfill(3)), "result9")
+            for i in range(90, 100):
+                self.assertEqual(disk.get(str(i).zfill(3)), None)
+            reopened = DiskStore("temp", tempdirname, 10 ** 6)
+            self.assertEqual([(ss_table.id, ss_table.level)
+                              for ss_table in reopened.ss_tables],
+                             [(ss_table.id, ss_table.level)
+                              for ss_table in disk.ss_tables])
+            self.assertEqual(reopened.get("042"), "result9")
+            self.assertEqual(reopened.get("095"), None)
+
+    def test_size_tiered_compaction(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6,
+                             compaction_strategy="size_tiered")
+            disk.set_auto_compaction(False)
+            disk.compaction_strategy.min_sstable_size = 0
+            expected = {}
+            for round in range(8):
+                # every round but the first writes a few keys, then the
+                # smaller sstables fill up buckets of their own
+                keys = range(300) if round == 0 else \
+                    range(round * 20, round * 20 + 20)
+                for i in keys:
+                    disk.set(str(i).zfill(3), "result" + str(round))
+                    expected[str(i).zfill(3)] = "result" + str(round)
+                disk.remove(str(round * 5).zfill(3))
+                expected.pop(str(round * 5).zfill(3), None)
+                disk.flush()
+                disk.compact()
+            stats = disk.get_stats()
+            self.assertEqual(stats["compaction_strategy"], "size_tiered")
+            self.assertTrue(stats["compaction_count"] > 0)
+            self.assertEqual(stats["sstables"], len(disk.ss_tables))
+            self.assertTrue(all(count < 4 for count, _ in
+                                stats["compaction"]["buckets"]))
+            self.assertTrue(all(ss_table.level == 0
+                                for ss_table in disk.ss_tables))
+            for i in range(300):
+                self.assertEqual(disk.get(str(i).zfill(3)),
+                                 expected.get(str(i).zfill(3)))
+            iterator = disk.iterator()
+            items = []
+            while iterator.valid():
+                iterator.next()
+                items.append((iterator.key(), iterator.value()))
+            self.assertEqual(items, sorted(expected.items()))
+            disk.close()
+            reopened = DiskStore("temp", tempdirname, 10 ** 6,
+                                 compaction_strategy="size_tiered")
+            self.assertEqual([ss_table.id for ss_table in reopened.ss_tables],
+                             [ss_table.id for ss_table in disk.ss_tables])
+            for i in range(300):
+                self.assertEqual(reopened.get(str(i).zfill(3)),
+                                 expected.get(str(i).zfill(3)))
+            reopened.close()
+
+    def test_merged_bloom_filter_sized_from_inputs(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6,
+                             compaction_strategy="size_tiered")
+            disk.set_auto_compaction(False)
+            for round in range(2):
+                for i in range(round * 100, round * 100 + 200):
+                    disk.set(str(i).zfill(3), "value")
+                disk.flush()
+            self.assertEqual([ss_table.num_keys
+                              for ss_table in disk.ss_tables], [200, 200])
+            disk.ss_tables[0].num_keys = None
+            disk.merge()
+            merged, = disk.ss_tables
+            self.assertEqual(merged.num_keys, 300)
+            self.assertEqual(merged.bloom_filter.num_bits, 400 * 10)
+            disk.close()
+            reopened = DiskStore("temp", tempdirname, 10 ** 6)
+            self.assertEqual(reopened.ss_tables[0].num_keys, 300)
+            reopened.close()
+
+    def test_size_tiered_merges_run_in_place(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6,
+                             compaction_strategy=SizeTieredCompaction(
+                                 min_threshold=2, min_sstable_size=0))
+            disk.set_auto_compaction(False)
+            # size-tiered compaction writes one sstable whatever its size
+            disk.set_target_file_size(100)
+            for i in range(300):
+                disk.set(str(i).zfill(3), "old")
+            disk.flush()
+            for i in range(20):
+                disk.set(str(i).zfill(3), "small")
+            disk.remove("100")
+            disk.flush()
+            for i in range(20, 40):
+                disk.set(str(i).zfill(3), "small")
+            disk.flush()
+            for i in range(10, 300):
+                disk.set(str(i).zfill(3), "new")
+            disk.flush()
+            old, first, second, new = disk.ss_tables
+            disk.compact()
+            self.assertEqual(disk.compaction_count, 1)
+            merged = disk.ss_tables[1]
+            self.assertEqual(disk.ss_tables, [old, merged, new])
+            self.assertEqual(merged.sequence, second.id)
+            self.assertTrue(merged.id > new.id)
+            self.assertEqual(disk.get("005"), "small")
+            self.assertEqual(disk.get("015"), "new")
+            self.assertEqual(disk.get("035"), "new")
+            self.assertEqual(merged.lookup("100")[:2], (True, True))
+            disk.close()
+
+    def test_compaction_strategy(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            with self.assertRaises(StorageException):
+                DiskStore("temp", tempdirname, 10 ** 6,
+                          compaction_strategy="tiered")
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            stats = disk.get_stats()
+            self.assertEqual(stats["compaction_strategy"], "leveled")
+            self.assertEqual(stats["compaction"]["level_sstables"][0], 0)
+            self.assertEqual(stats["sstables"], 0)
+            disk.set_compaction_strategy("size_tiered")
+            self.assertEqual(disk.get_stats()["compaction_strategy"],
+                             "size_tiered")
+            with self.assertRaises(StorageException):
+                disk.set_compaction_strategy("tiered")
+            disk.close()
+
+    def test_rate_limiter(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            limiter = RateLimiter(10 ** 9, read_latency_slo=0.01)
+            disk = DiskStore("temp", tempdirname, 10 ** 6,
+                             rate_limiter=limiter)
+            disk.set_auto_compaction(False)
+            for round in range(2):
+                for i in range(100):
+                    disk.set(str(i), "result" + str(round))
+                disk.flush()
+            flushed = sum(ss_table.size for ss_table in disk.ss_tables)
+            self.assertEqual(limiter.requested_bytes, flushed)
+            merged = disk.merge()
+            self.assertEqual(limiter.requested_bytes, flushed + merged.size)
+            for i in range(100):
+                self.assertEqual(disk.get(str(i)), "result1")
+            self.assertEqual(len(limiter.latencies), 100)
+            limiter.set_read_latency_slo(None)
+            disk.get("0")
+            self.assertEqual(len(limiter.latencies), 0)
+            stats = disk.get_stats()["rate_limiter"]
+            self.assertEqual(stats["requested_bytes"], flushed + merged.size)
+            disk.close()
+
+    def test_merge_drops_removed_keys(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            disk.set("a", "1")
+            disk.set("b", "2")
+            disk.flush()
+            disk.remove("a")
+            disk.flush()
+            merged = disk.merge()
+            self.assertEqual(disk.ss_tables, [merged])
+            self.assertEqual(merged.level, 1)
+            self.assertEqual(merged.key_range(), ("b", "b"))
+            self.assertEqual(disk.get("a"), None)
+            self.assertEqual(disk.get("b"), "2")
+            disk.remove("b")
+            disk.flush()
+            self.assertEqual(disk.merge(), None)
+            self.assertEqual(disk.ss_tables, [])
+            self.assertEqual(os.listdir(disk.ss_table_dir), [])
+            disk.close()
+
+    def test_merge_splits_output(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            disk.set_block_size(256)
+            disk.set_target_file_size(2000)
+            for round in range(3):
+                for i in range(300):
+                    disk.set(str(i).zfill(3), "round" + str(round))
+                for i in range(round, 300, 7):
+                    disk.remove(str(i).zfill(3))
+                disk.flush()
+            misses = disk.block_cache.get_stats()["misses"]
+            disk.merge()
+            self.assertEqual(disk.block_cache.get_stats()["misses"], misses)
+            merged = disk.ss_tables
+            self.assertTrue(len(merged) > 2)
+            for ss_table in merged:
+                self.assertEqual(ss_table.level, 1)
+                self.assertTrue(ss_table.size < 3000)
+            key_ranges = [ss_table.key_range() for ss_table in merged]
+            self.assertEqual(key_ranges, sorted(key_ranges))
+            for (_, largest), (smallest, _) in zip(key_ranges,
+                                                   key_ranges[1:]):
+                self.assertTrue(largest < smallest)
+            live = [str(i).zfill(3) for i in range(300) if i % 7 != 2]
+            self.assertEqual([key for ss_table in merged
+                              for key, _, _ in ss_table.records()], live)
+            for key in live:
+                self.assertEqual(disk.get(key), "round2")
+            self.assertEqual(disk.get("002"), None)
+            disk.close()
+            reopened = DiskStore("temp", tempdirname, 10 ** 6)
+            self.assertEqual([ss_table.id for ss_table in reopened.ss_tables],
+                             [ss_table.id for ss_table in merged])
+            self.assertEqual(reopened.get("299"), "round2")
+            reopened.close()
+
+    def test_subcompactions(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            disk.set_block_size(256)
+            disk.set_target_file_size(2000)
+            disk.set_max_subcompactions(3)
+            for round in range(3):
+                for i in range(300):
+                    disk.set(str(i).zfill(3), "round" + str(round))
+                for i in range(round, 300, 7):
+                    disk.remove(str(i).zfill(3))
+                disk.flush()
+            disk.merge()
+            self.assertEqual(disk.get_stats()["subcompaction_count"], 3)
+            merged = disk.ss_tables
+            self.assertTrue(len(merged) >= 3)
+            key_ranges = [ss_table.key_range() for ss_table in merged]
+            self.assertEqual(key_ranges, sorted(key_ranges))
+            for (_, largest), (smallest, _) in zip(key_ranges,
+                                                   key_ranges[1:]):
+                self.assertTrue(largest < smallest)
+            live = [str(i).zfill(3) for i in range(300) if i % 7 != 2]
+            self.assertEqual([key for ss_table in merged
+                              for key, _, _ in ss_table.records()], live)
+            for key in live:
+                self.assertEqual(disk.get(key), "round2")
+            self.assertEqual(disk.get("002"), None)
+            disk.close()
+            self.assertIsNone(disk.subcompaction_executor)
+            reopened = DiskStore("temp", tempdirname, 10 ** 6)
+            self.assertEqual([ss_table.id for ss_table in reopened.ss_tables],
+                             [ss_table.id for ss_table in merged])
+            self.assertEqual(reopened.get("299"), "round2")
+            reopened.close()
+            self.assertEqual(sorted(os.listdir(os.path.join(
+                tempdirname, "temp", "sstable"))), sorted(
+                "temp" + str(ss_table.id) + ".ss" for ss_table in merged))
+
+    def test_subcompactions_broken_pool(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            disk.set_block_size(256)
+            disk.set_target_file_size(2000)
+            disk.set_max_subcompactions(3)
+            for round in range(4):
+                for i in range(300):
+                    disk.set(str(i).zfill(3), "round" + str(round))
+                disk.flush()
+                if round == 1:
+                    disk.merge()
+                    for process in list(
+                            disk.subcompaction_executor._processes.values()):
+                        process.kill()
+                        process.join()
+            with self.assertRaises(BrokenProcessPool):
+                disk.merge()
+            self.assertIsNone(disk.subcompaction_executor)
+            inputs = disk.ss_tables
+            self.assertEqual(sorted(os.listdir(os.path.join(
+                tempdirname, "temp", "sstable"))), sorted(
+                "temp" + str(ss_table.id) + ".ss" for ss_table in inputs))
+            disk.merge()
+            self.assertEqual(disk.get_stats()["subcompaction_count"], 6)
+            for i in range(300):
+                self.assertEqual(disk.get(str(i).zfill(3)), "round3")
+            disk.close()
+
+    def test_subcompactions_small_compaction(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            disk.set_max_subcompactions(4)
+            for i in range(100):
+                disk.set(str(i), str(i))
+            disk.flush()
+            disk.merge()
+            self.assertEqual(disk.get_stats()["subcompaction_count"], 0)
+            self.assertIsNone(disk.subcompaction_executor)
+            self.assertEqual(disk.get("42"), "42")
+            with self.assertRaises(StorageException):
+                disk.set_max_subcompactions(0)
+            disk.close()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+from struct import pack
+
+from pydynamo.storage.disk.manifest import Manifest
+from pydynamo.storage.disk.sstable import SSTable
+from pydynamo.storage.error import StorageException
+
+
+class ManifestTest(unittest.TestCase):
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            manifest = Manifest(tempdirname)
+            self.assertFalse(manifest.exists())
+            index_table = [("a", pack("i", 0)), ("m", pack("i", 120))]
+            ss_tables = [SSTable("test", 3, 400, index_table, tempdirname,
+                                 120),
+                         SSTable("test", 5, 900, [], tempdirname, 0)]
+            ss_tables[0].set_key_range(("a", "z"))
+            ss_tables[1].set_key_range(None)
+            ss_tables[1].level = 2
+            ss_tables[1].sequence = 4
+            ss_tables[1].num_keys = 70
+            manifest.save(6, ss_tables, sync=True)
+            self.assertTrue(manifest.exists())
+            self.assertEqual(os.listdir(tempdirname), ["MANIFEST"])
+            next_id, entries = manifest.load()
+            self.assertEqual(next_id, 6)
+            self.assertEqual(entries, [
+                {"id": 3, "size": 400, "last_index": 120, "level": 0,
+                 "sequence": 3, "key_range": ("a", "z"), "num_keys": None,
+                 "index_table": index_table},
+                {"id": 5, "size": 900, "last_index": 0, "level": 2,
+                 "sequence": 4, "key_range": None, "num_keys": 70,
+                 "index_table": []}])
+            manifest.save(7, ss_tables[1:])
+            self.assertEqual(manifest.load()[0], 7)
+            self.assertEqual(len(manifest.load()[1]), 1)
+
+    def test_corrupted(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            manifest = Manifest(tempdirname)
+            with open(manifest.file_path, "w") as file:
+                file.write("{\"version\": 1, \"next")
+            with self.assertRaises(StorageException):
+                manifest.load()
@@ -0,0 +1,86 @@
+import unittest
+
+from pydynamo.storage.disk.mergingiterator import MergingIterator
+from pydynamo.storage.disk.mergingiterator import list_source
+from pydynamo.storage.disk.mergingiterator import merge_records
+from pydynamo.storage.error import StorageException
+from pydynamo.storage.memory.inmemorystore import InMemoryStore
+
+
+class MergingIteratorTest(unittest.TestCase):
+    def setUp(self):
+        # newest first
+        self.sources = [
+            list_source([("b", "new b"), ("d", None), ("f", "f")]),
+            list_source([("a", "a"), ("b", "old b"), ("d", "old d"),
+                         ("e", None)]),
+            list_source([("c", "c"), ("e", "old e"), ("g", "g")])]
+
+    def items(self, iterator):
+        items = []
+        while iterator.valid():
+            iterator.next()
+            items.append((iterator.key(), iterator.value()))
+        return items
+
+    def test_merge_records(self):
+        self.assertEqual(list(merge_records(self.sources)),
+                         [("a", "a"), ("b", "new b"), ("c", "c"),
+                          ("d", None), ("e", None), ("f", "f"),
+                          ("g", "g")])
+        self.assertEqual([record[0] for record in
+                          merge_records(self.sources, "cc")],
+                         ["d", "e", "f", "g"])
+        self.assertEqual(list(merge_records([])), [])
+
+    def test_iterator(self):
+        iterator = MergingIterator(self.sources)
+        self.assertEqual(self.items(iterator),
+                         [("a", "a"), ("b", "new b"), ("c", "c"),
+                          ("f", "f"), ("g", "g")])
+        self.assertFalse(iterator.valid())
+        with self.assertRaises(StorageException):
+            iterator.next()
+        self.assertEqual(iterator.key(), "g")
+
+    def test_seek(self):
+        iterator = MergingIterator(self.sources)
+        with self.assertRaises(StorageException):
+            iterator.key()
+        iterator.seek("c")
+        self.assertEqual(iterator.key(), "c")
+        self.assertEqual(self.items(iterator), [("f", "f"), ("g", "g")])
+        with self.assertRaises(StorageException):
+            iterator.seek("d")
+        with self.assertRaises(StorageException):
+            iterator.value()
+        self.assertEqual(self.items(iterator)[0], ("a", "a"))
+        iterator.seek_to_first()
+        self.assertEqual(len(self.items(iterator)), 5)
+
+    def test_reads_lazily(self):
+        read = []
+
+        def source(start_key):
+            for i in range(int(start_key or 0), 1000):
+                read.append(i)
+                yield str(i).zfill(4), "value"
+        iterator = MergingIterator([source, list_source([])])
+        iterator.seek("0500")
+        iterator.next()
+        self.assertEqual(iterator.key(), "0501")
+        self.assertEqual(read, [500, 501, 502])
+
+    def test_mem_table_records(self):
+        mem_table = InMemoryStore("test")
+        for i in range(0, 100, 2):
+            mem_table.set(str(i).zfill(3), str(i))
+        mem_table.remove("010")
+        records = list(mem_table.records())
+        self.assertEqual(len(records), 50)
+        self.assertEqual(records[5], ("010", None))
+        self.assertEqual(records[6], ("012", "12"))
+        self.assertEqual([key for key, _ in mem_table.records("051")],
+                         [str(i).zfill(3) for i in range(52, 100, 2)])
+        self.assertEqual(list(mem_table.records("1")), [])
+        self.assertEqual(list(InMemoryStore("empty").records()), [])
@@ -0,0 +1,83 @@
+import unittest
+from unittest import mock
+
+from pydynamo.storage.disk.ratelimiter import RateLimiter
+from pydynamo.storage.error import StorageException
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.sleeps = []
+        patchers = [
+            mock.patch("pydynamo.storage.disk.ratelimiter.monotonic",
+                       lambda: self.now),
+            mock.patch("pydynamo.storage.disk.ratelimiter.sleep",
+                       self.sleeps.append)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_invalid(self):
+        with self.assertRaises(StorageException):
+            RateLimiter(-1)
+        with self.assertRaises(StorageException):
+            RateLimiter(1000, read_latency_slo=0)
+        with self.assertRaises(StorageException):
+            RateLimiter().set_bytes_per_second(-1)
+
+    def test_unlimited(self):
+        limiter = RateLimiter()
+        limiter.request(10 ** 9)
+        self.assertEqual(self.sleeps, [])
+        self.assertEqual(limiter.get_stats()["requested_bytes"], 10 ** 9)
+
+    def test_token_bucket(self):
+        limiter = RateLimiter(1000, burst_seconds=0.5)
+        limiter.request(500)
+        self.assertEqual(self.sleeps, [])
+        limiter.request(1000)
+        self.assertEqual(self.sleeps, [1.0])
+        self.now += 2
+        limiter.request(500)
+        self.assertEqual(self.sleeps, [1.0])
+        limiter.set_bytes_per_second(100)
+        limiter.request(100)
+        self.assertEqual(self.sleeps, [1.0, 1.0])
+        stats = limiter.get_stats()
+        self.assertEqual(stats["waits"], 2)
+        self.assertEqual(stats["wait_seconds"], 2.0)
+        limiter.set_bytes_per_second(0)
+        limiter.request(10 ** 6)
+        self.assertEqual(len(self.sleeps), 2)
+
+    def test_auto(self):
+        limiter = RateLimiter(8000, read_latency_slo=0.01,
+                              min_bytes_per_second=1000, tune_period=1)
+        self.assertTrue(limiter.is_auto())
+        for round in range(4):
+            for _ in range(100):
+                limiter.record_read_latency(0.001)
+            limiter.record_read_latency(0.02)
+            limiter.record_read_latency(0.02)
+            self.now += 1
+            limiter.request(0)
+        self.assertEqual(limiter.get_stats()["read_p99"], 0.02)
+        self.assertEqual(limiter.bytes_per_second, 1000)
+        for round in range(20):
+            limiter.record_read_latency(0.001)
+            self.now += 1
+            limiter.request(0)
+        self.assertEqual(limiter.bytes_per_second, 8000)
+        for _ in range(50):
+            limiter.record_read_latency(0.008)
+        self.now += 1
+        limiter.request(0)
+        self.assertEqual(limiter.bytes_per_second, 8000)
+        limiter.record_read_latency(0.5)
+        self.now += 1
+        limiter.request(0)
+        self.assertEqual(limiter.bytes_per_second, 4000)
+        limiter.set_read_latency_slo(None)
+        self.assertFalse(limiter.is_auto())
+        self.assertEqual(limiter.bytes_per_second, 8000)
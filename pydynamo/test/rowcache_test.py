@@ -0,0 +1,41 @@
+import unittest
+from pydynamo.storage.disk.rowcache import RowCache
+from pydynamo.storage.error import StorageException
+
+
+class RowCacheTest(unittest.TestCase):
+    def test_get_put(self):
+        cache = RowCache(10)
+        self.assertEqual(cache.get("a"), (False, None))
+        cache.put("a", "value")
+        cache.put("removed", None)
+        self.assertEqual(cache.get("a"), (True, "value"))
+        self.assertEqual(cache.get("removed"), (True, None))
+        stats = cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        self.assertEqual(stats["entries"], 2)
+
+    def test_evict_least_recently_used(self):
+        cache = RowCache(2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        self.assertEqual(cache.get("b"), (False, None))
+        self.assertEqual(cache.get("a"), (True, "1"))
+        self.assertEqual(cache.get("c"), (True, "3"))
+
+    def test_invalidate_clear(self):
+        cache = RowCache(10)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.invalidate("a")
+        cache.invalidate("missing")
+        self.assertEqual(cache.get("a"), (False, None))
+        self.assertEqual(cache.get("b"), (True, "2"))
+        cache.clear()
+        self.assertEqual(cache.get("b"), (False, None))
+
+    def test_invalid_capacity(self):
+        with self.assertRaises(StorageException):
+            RowCache(0)
@@ -3,9 +3,45 @@ from ..storage.disk.sstable import SSTable
 from ..storage.error import StorageException
 from ..storage.disk.sstableiterator import SStableIterator
 from ..storage.disk.diskstore import DiskStore
+from ..storage.disk.sstablereader import SSTableReader
+from ..storage.disk.blockreader import BlockSSTableReader
+from ..storage.disk.blockcache import BlockCache
+from struct import pack
+import os
 import tempfile
 
 
+def write_v1_sstable(path: str, store_name: str, records: list) -> SSTable:
+    """
+    write the sstable file and index file of a v1 sstable by hand
+    :param records: sorted list of (key, value), value None for a removed key
+    :return: the sstable opened on these files
+    """
+    os.makedirs(os.path.join(path, "sstable"))
+    os.makedirs(os.path.join(path, "index"))
+    ss_table = bytearray()
+    index = bytearray()
+    last_index = 0
+    for i, (key, value) in enumerate(records):
+        bin_key = key.encode()
+        last_index = len(index)
+        index += pack("i", len(bin_key)) + bin_key + \
+            pack("i", len(ss_table))
+        if value is None:
+            ss_table += pack("ii", 0, len(bin_key)) + bin_key
+        else:
+            ss_table += pack("ii", 1, len(bin_key)) + bin_key + \
+                pack("i", len(value.encode())) + value.encode()
+        ss_table += pack("q", 1000 + i)
+    with open(os.path.join(path, "sstable", store_name + "0.ss"),
+              "wb") as file:
+        file.write(ss_table)
+    with open(os.path.join(path, "index", store_name + "0.index"),
+              "wb") as file:
+        file.write(index)
+    return SSTable(store_name, 0, len(ss_table), [], path, last_index)
+
+
 class SStableTest(unittest.TestCase):
     def setUp(self):
         """
@@ -27,6 +63,8 @@ class SStableTest(unittest.TestCase):
             disk.flush()
             self.sstable = disk.ss_tables[0]
             self.tempdir = tempdirname
+            disk1.close()
+            disk.close()
 
     def test_smoke(self) -> None:
         self.assertTrue(isinstance(self.sstable, SSTable))
@@ -155,3 +193,369 @@ class SStableTest(unittest.TestCase):
         with self.assertRaises(StorageException):
             iterator.seek("test")
         self.assertTrue(not iterator.valid())
+
+    def test_bloom_filter(self) -> None:
+        self.assertTrue(self.sstable.bloom_filter is not None)
+        for i in range(100):
+            self.assertTrue(self.sstable.contain(str(i)))
+        skipped = 0
+        for i in range(1000):
+            if not self.sstable.bloom_filter.might_contain("missing" + str(i)):
+                skipped += 1
+            self.assertTrue(not self.sstable.contain("missing" + str(i)))
+        self.assertTrue(skipped > 950)
+
+    def test_bloom_filter_disabled(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("test", tempdirname, 2000000)
+            disk.set_bloom_bits_per_key(0)
+            disk.set("key", "value")
+            disk.flush()
+            self.assertTrue(disk.ss_tables[0].bloom_filter is None)
+            self.assertEqual(disk.get("key"), "value")
+            self.assertEqual(disk.get("missing"), None)
+            with self.assertRaises(StorageException):
+                disk.set_bloom_bits_per_key(-1)
+            disk.close()
+
+    def test_lookup(self) -> None:
+        found, removed, value, time_stamp = self.sstable.lookup("kelly")
+        self.assertTrue(found)
+        self.assertTrue(not removed)
+        self.assertEqual(value, "kpmg")
+        self.sstable.disk_iterator.seek("kelly")
+        self.assertEqual(time_stamp, self.sstable.disk_iterator.timestamp())
+        self.assertEqual(self.sstable.lookup("shen"), (False, False, None, 0))
+        self.assertEqual(self.sstable1.lookup("shen"),
+                         (False, False, None, 0))
+
+    def test_reader(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdirname:
+            records = [(str(i), None if i % 3 == 0 else "value" + str(i))
+                       for i in range(30)]
+            records.sort()
+            sstable = write_v1_sstable(tempdirname, "v1", records)
+            reader = sstable.reader
+            if not isinstance(reader, SSTableReader):
+                self.fail("a v1 sstable is read by SSTableReader")
+            self.assertTrue(isinstance(reader.key(0), memoryview))
+            offset = 0
+            keys = []
+            while offset < sstable.size:
+                removed, key, value, time_stamp, next_offset = \
+                    reader.read_record(offset)
+                self.assertEqual(removed, value is None)
+                self.assertEqual(next_offset - offset, reader.length(offset))
+                self.assertEqual(reader.find(key), offset)
+                bin_value = reader.value(offset)
+                if bin_value is not None:
+                    self.assertEqual(str(bin_value, "utf-8"), value)
+                self.assertEqual(reader.timestamp(offset), time_stamp)
+                keys.append(key)
+                offset = next_offset
+            self.assertEqual(keys, [key for key, _ in records])
+            self.assertEqual(reader.find("shen"), None)
+
+    def test_read_v1_sstable(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdirname:
+            records = [(str(i), None if i % 3 == 0 else "value" + str(i))
+                       for i in range(30)]
+            records.sort()
+            sstable = write_v1_sstable(tempdirname, "v1", records)
+            for key, value in records:
+                found, removed, found_value, _ = sstable.lookup(key)
+                self.assertTrue(found)
+                self.assertEqual(removed, value is None)
+                self.assertEqual(found_value, value)
+            self.assertEqual(sstable.lookup("shen"), (False, False, None, 0))
+            iterator = sstable.diskiterator()
+            live = []
+            while iterator.valid():
+                iterator.next()
+                live.append((iterator.key(), iterator.value()))
+            self.assertEqual(live, [record for record in records
+                                    if record[1] is not None])
+
+    def test_block_format(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("test", tempdirname, 2000000)
+            disk.set_block_size(256)
+            for i in range(1000):
+                disk.set("key" + str(i).zfill(4), "value" + str(i))
+            for i in range(0, 1000, 7):
+                disk.remove("key" + str(i).zfill(4))
+            disk.flush()
+            sstable = disk.ss_tables[0]
+            self.assertTrue(isinstance(sstable.reader, BlockSSTableReader))
+            self.assertTrue(len(sstable.reader.last_keys) > 1)
+            self.assertTrue(not os.path.exists(os.path.join(
+                tempdirname, "test", "index", "test0.index")))
+            for i in range(1000):
+                found, removed, value, _ = \
+                    sstable.lookup("key" + str(i).zfill(4))
+                self.assertTrue(found)
+                self.assertEqual(removed, i % 7 == 0)
+                if i % 7 != 0:
+                    self.assertEqual(value, "value" + str(i))
+            self.assertEqual(sstable.lookup("key"), (False, False, None, 0))
+            self.assertEqual(sstable.lookup("key9999"),
+                             (False, False, None, 0))
+            iterator = sstable.iterator()
+            count = 0
+            while iterator.valid():
+                iterator.next()
+                self.assertEqual(iterator.key(), "key" + str(count).zfill(4))
+                self.assertEqual(iterator.is_removed(), count % 7 == 0)
+                count += 1
+            self.assertEqual(count, 1000)
+            iterator = sstable.diskiterator()
+            iterator.seek("key0500")
+            iterator.next()
+            self.assertEqual(iterator.key(), "key0501")
+            self.assertEqual(disk.get("key0999"), "value999")
+            disk.close()
+
+    def test_disk_iterator_skips_removed(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("test", tempdirname, 2000000)
+            disk.remove("a")
+            disk.set("b", "live")
+            disk.remove("c")
+            disk.flush()
+            iterator = disk.ss_tables[0].diskiterator()
+            self.assertTrue(iterator.valid())
+            iterator.next()
+            self.assertEqual(iterator.key(), "b")
+            self.assertEqual(iterator.value(), "live")
+            self.assertTrue(not iterator.valid())
+            disk.close()
+
+    def test_iterator_single_record(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("test", tempdirname, 2000000)
+            disk.set("only", "one")
+            disk.flush()
+            iterator = disk.ss_tables[0].iterator()
+            self.assertTrue(iterator.valid())
+            iterator.next()
+            self.assertEqual(iterator.value(), "one")
+            self.assertTrue(not iterator.valid())
+            disk.close()
+
+    def test_iterator_decodes_each_record_once(self) -> None:
+        reader = self.sstable.reader
+        calls = []
+        read_record = reader.read_record
+
+        def counting_read_record(offset, prev_key=""):
+            calls.append(offset)
+            return read_record(offset, prev_key)
+
+        reader.read_record = counting_read_record
+        try:
+            iterator = self.sstable.iterator()
+            count = 0
+            while iterator.valid():
+                iterator.next()
+                iterator.key()
+                iterator.value()
+                iterator.timestamp()
+                iterator.length()
+                iterator.is_removed()
+                iterator.record()
+                count += 1
+            self.assertEqual(count, 104)
+            self.assertEqual(len(calls), 104)
+            self.assertEqual(len(set(calls)), 104)
+        finally:
+            del reader.read_record
+
+    def test_prefix_keys(self) -> None:
+        keys = sorted("tenant%d:region%d:entity:%05d" % (i % 3, i % 5, i)
+                      for i in range(500))
+        keys += ["tenant9:été", "tenant9:été:1",
+                 "tenant9:éé"]
+        sizes = []
+        with tempfile.TemporaryDirectory() as tempdirname:
+            for restart_interval, cache_size in ((1, 0), (16, 0), (16, 500),
+                                                 (16, 100000)):
+                disk = DiskStore("test" + str(restart_interval) + "_" +
+                                 str(cache_size), tempdirname, 2000000,
+                                 block_cache=BlockCache(cache_size))
+                disk.set_block_size(1024)
+                disk.set_restart_interval(restart_interval)
+                for i, key in enumerate(keys):
+                    if i % 11 == 0:
+                        disk.remove(key)
+                    else:
+                        disk.set(key, "value" + str(i))
+                disk.flush()
+                sstable = disk.ss_tables[0]
+                sizes.append(sstable.size)
+                for i, key in enumerate(keys):
+                    found, removed, value, _ = sstable.lookup(key)
+                    self.assertTrue(found)
+                    self.assertEqual(removed, i % 11 == 0)
+                    if i % 11 != 0:
+                        self.assertEqual(value, "value" + str(i))
+                    self.assertEqual(sstable.lookup(key + "!"),
+                                     (False, False, None, 0))
+                iterator = sstable.iterator()
+                scanned = []
+                while iterator.valid():
+                    iterator.next()
+                    scanned.append(iterator.key())
+                self.assertEqual(scanned, sorted(keys))
+                iterator = sstable.diskiterator()
+                iterator.seek(keys[250])
+                iterator.next()
+                self.assertEqual(iterator.key(), keys[251])
+                disk.close()
+        self.assertTrue(sizes[1] < sizes[0])
+        self.assertEqual(sizes[1], sizes[3])
+
+    def test_compression(self) -> None:
+        values = ['{"id": %d, "name": "user%d", "tags": ["a", "b"], '
+                  '"active": true}' % (i, i) for i in range(600)]
+        sizes = {}
+        with tempfile.TemporaryDirectory() as tempdirname:
+            for compression in ("none", "zlib", "lzma", "bz2"):
+                disk = DiskStore(compression, tempdirname, 2000000,
+                                 compression=compression,
+                                 block_cache=BlockCache(
+                                     0 if compression == "zlib" else 100000))
+                for i, value in enumerate(values):
+                    disk.set("key" + str(i).zfill(4), value)
+                disk.remove("key0007")
+                disk.flush()
+                sstable = disk.ss_tables[0]
+                sizes[compression] = sstable.size
+                for i, value in enumerate(values):
+                    found, removed, found_value, _ = \
+                        sstable.lookup("key" + str(i).zfill(4))
+                    self.assertTrue(found)
+                    self.assertEqual(removed, i == 7)
+                    if i != 7:
+                        self.assertEqual(found_value, value)
+                iterator = sstable.diskiterator()
+                count = 0
+                while iterator.valid():
+                    iterator.next()
+                    self.assertEqual(iterator.value(),
+                                     values[int(iterator.key()[3:])])
+                    count += 1
+                self.assertEqual(count, 599)
+                disk.close()
+        for compression in ("zlib", "lzma", "bz2"):
+            self.assertTrue(sizes[compression] < sizes["none"] / 2)
+        with self.assertRaises(StorageException):
+            DiskStore("test", self.tempdir, 2000000, compression="snappy")
+
+    def test_compression_skips_incompressible_blocks(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("test", tempdirname, 2000000,
+                             compression="zlib")
+            disk.set_block_size(1)
+            for i in range(200):
+                disk.set("key" + str(i).zfill(4), os.urandom(20).hex())
+            disk.flush()
+            reader = disk.ss_tables[0].reader
+            for offset, size in zip(reader.block_offsets,
+                                    reader.block_sizes):
+                self.assertEqual(reader.sstable_map[offset + size],
+                                 BlockSSTableReader.RAW_BLOCK)
+            self.assertEqual(len(disk.get("key0100")), 40)
+            disk.close()
+
+    def test_block_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdirname:
+            cache = BlockCache(1000000)
+            disk = DiskStore("test", tempdirname, 2000000,
+                             block_cache=cache)
+            disk.set_block_size(512)
+            for i in range(500):
+                disk.set("key" + str(i).zfill(4), "value" + str(i))
+            disk.flush()
+            sstable = disk.ss_tables[0]
+            self.assertEqual(sstable.get("key0100"), "value100")
+            stats = cache.get_stats()
+            self.assertEqual((stats["hits"], stats["misses"]), (0, 1))
+            self.assertEqual(sstable.get("key0100"), "value100")
+            self.assertEqual(disk.get("key0100"), "value100")
+            stats = cache.get_stats()
+            self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+            self.assertEqual(stats["entries"], 1)
+            self.assertTrue(stats["usage"] > 0)
+            iterator = sstable.iterator()
+            while iterator.valid():
+                iterator.next()
+            stats = cache.get_stats()
+            self.assertEqual(stats["entries"],
+                             len(sstable.reader.last_keys))
+            self.assertEqual(stats["misses"], stats["entries"])
+            sstable.clean()
+            self.assertEqual(cache.get_stats()["entries"], 0)
+            self.assertEqual(cache.get_stats()["usage"], 0)
+            self.assertEqual(sstable.lookup("key0100")[2], "value100")
+            self.assertEqual(cache.get_stats()["entries"], 0)
+            disk.close()
+
+    def test_block_cache_bounded(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdirname:
+            cache = BlockCache(4000)
+            disk = DiskStore("test", tempdirname, 2000000,
+                             block_cache=cache)
+            disk.set_block_size(256)
+            for i in range(2000):
+                disk.set("key" + str(i).zfill(4), "value" + str(i))
+            disk.flush()
+            for i in range(2000):
+                self.assertEqual(disk.get("key" + str(i).zfill(4)),
+                                 "value" + str(i))
+                self.assertTrue(cache.get_stats()["usage"] <= 4000)
+            disk.close()
+
+    def test_records(self) -> None:
+        keys = ["key" + str(i).zfill(4) for i in range(0, 600, 2)]
+        with tempfile.TemporaryDirectory() as tempdirname:
+            for restart_interval, cache_size in ((1, 0), (16, 0),
+                                                 (16, 100000)):
+                disk = DiskStore("test" + str(restart_interval) + "_" +
+                                 str(cache_size), tempdirname, 2000000,
+                                 block_cache=BlockCache(cache_size))
+                disk.set_block_size(256)
+                disk.set_restart_interval(restart_interval)
+                for i, key in enumerate(keys):
+                    if i % 5 == 0:
+                        disk.remove(key)
+                    else:
+                        disk.set(key, "value" + str(i))
+                disk.flush()
+                sstable = disk.ss_tables[0]
+                records = [(key, value) for key, value, _
+                           in sstable.records()]
+                self.assertEqual(records, [
+                    (key, None if i % 5 == 0 else "value" + str(i))
+                    for i, key in enumerate(keys)])
+                for start in (0, 1, 137, 298, 299):
+                    self.assertEqual(
+                        [key for key, _, _ in
+                         sstable.records("key" + str(start).zfill(4))],
+                        keys[(start + 1) // 2:])
+                self.assertEqual(list(sstable.records("key9")), [])
+                self.assertEqual(
+                    [key for key, _, _ in sstable.records("a")], keys)
+                disk.close()
+        with tempfile.TemporaryDirectory() as tempdirname:
+            records = [(str(i), None if i % 3 == 0 else "value" + str(i))
+                       for i in range(30)]
+            records.sort()
+            sstable = write_v1_sstable(tempdirname, "v1", records)
+            self.assertEqual([(key, value) for key, value, _
+                              in sstable.records()], records)
+            self.assertEqual([key for key, _, _ in sstable.records("15")],
+                             [key for key, _ in records if key >= "15"])
+            self.assertEqual([key for key, _, _ in sstable.records("155")],
+                             [key for key, _ in records if key >= "155"])
+            self.assertEqual(list(sstable.records("a")), [])
+            self.assertEqual(list(self.sstable1.records()), [])
@@ -0,0 +1,100 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+from pydynamo.storage.disk.sstable import SSTable
+from pydynamo.storage.disk.sstablebuilder import SSTableBuilder
+from pydynamo.storage.disk.blockreader import BlockSSTableReader
+
+
+class SSTableBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = self.tempdir.name
+        os.mkdir(os.path.join(self.path, "sstable"))
+        os.mkdir(os.path.join(self.path, "index"))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_build(self):
+        records = []
+        for i in range(300):
+            key = "key" + str(i).zfill(4)
+            if i % 50 == 0:
+                key += "k" * 200
+            value = None if i % 7 == 0 else "value" * (i % 40)
+            records.append((key, value, 1000 + i))
+        builder = SSTableBuilder("test", 0, self.path, block_size=512,
+                                 num_keys=len(records))
+        for record in records:
+            builder.add(*record)
+        size = builder.finish()
+        self.assertEqual(size, os.path.getsize(os.path.join(
+            self.path, "sstable", "test0.ss")))
+        self.assertTrue(os.path.exists(os.path.join(
+            self.path, "index", "test0.bloom")))
+        sstable = SSTable("test", 0, size, [], self.path, 0)
+        self.assertTrue(len(sstable.reader.last_keys) > 1)
+        for key, value, time_stamp in records:
+            self.assertEqual(sstable.lookup(key),
+                             (True, value is None, value, time_stamp))
+        iterator = sstable.iterator()
+        scanned = []
+        while iterator.valid():
+            iterator.next()
+            scanned.append(iterator.record())
+        self.assertEqual(scanned, [(value is None, key, value, time_stamp)
+                                   for key, value, time_stamp in records])
+
+    def test_empty(self):
+        builder = SSTableBuilder("test", 0, self.path)
+        size = builder.finish()
+        sstable = SSTable("test", 0, size, [], self.path, 0)
+        self.assertEqual(sstable.lookup("a"), (False, False, None, 0))
+        self.assertTrue(not sstable.iterator().valid())
+
+    def test_large_writes(self):
+        builder = SSTableBuilder("test", 0, self.path, num_keys=2000)
+        builder.WRITE_BUFFER_SIZE = 64 * 1024
+        with mock.patch.object(builder, "file",
+                               wraps=builder.file) as file:
+            for i in range(2000):
+                builder.add("key" + str(i).zfill(5), "v" * 100, i)
+            builder.finish()
+            self.assertTrue(file.write.call_count < 10)
+
+    def test_sync(self):
+        with mock.patch("os.fsync") as fsync:
+            builder = SSTableBuilder("test", 0, self.path)
+            builder.add("a", "b", 1)
+            builder.finish()
+            self.assertEqual(fsync.call_count, 0)
+            builder = SSTableBuilder("test", 1, self.path, sync=True)
+            builder.add("a", "b", 1)
+            builder.finish()
+            self.assertEqual(fsync.call_count, 2)
+
+    def test_abandon(self):
+        builder = SSTableBuilder("test", 0, self.path)
+        builder.add("a", "b", 1)
+        builder.abandon()
+        self.assertTrue(not os.path.exists(
+            BlockSSTableReader.file_path("test", 0, self.path)))
+
+    def test_shared_prefix(self):
+        self.assertEqual(SSTableBuilder._shared_prefix(b"abcd", b"abxy"), 2)
+        self.assertEqual(SSTableBuilder._shared_prefix(b"abc", b"abcd"), 3)
+        self.assertEqual(SSTableBuilder._shared_prefix(b"", b"abc"), 0)
+        self.assertEqual(SSTableBuilder._shared_prefix(b"x", b"y"), 0)
+
+    def test_num_records(self):
+        builder = SSTableBuilder("test", 0, self.path, block_size=64,
+                                 num_keys=10)
+        for i in range(1000):
+            builder.add("key" + str(i).zfill(4), None if i % 3 else "v", i)
+        self.assertEqual(builder.num_records, 1000)
+        builder.finish()
+        sstable = SSTable("test", 0, 0, [], self.path, 0)
+        self.assertEqual(sstable.count_keys(), 1000)
+        self.assertEqual(sstable.bloom_filter.num_bits, 100)
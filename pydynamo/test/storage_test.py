@@ -97,3 +97,65 @@ class StoreTest(unittest.TestCase):
         self.store.clean()
         iterator = self.store.iterator()
         self.assertEqual(iterator.valid(), False)
+
+    def test_iterator_full_walk(self):
+        store = InMemoryStore("test")
+        for i in range(5000):
+            store.set("%05d" % i, "v" + str(i))
+        iterator = store.iterator()
+        store.database.find_next = None
+        store.database.find_min = None
+        keys = []
+        while iterator.valid():
+            iterator.next()
+            keys.append(iterator.key())
+        self.assertEqual(keys, ["%05d" % i for i in range(5000)])
+
+    def test_iterator_seek_next(self):
+        store = InMemoryStore("test")
+        for i in range(100):
+            store.set("%03d" % i, "v" + str(i))
+        iterator = store.iterator()
+        iterator.seek("042")
+        self.assertEqual(iterator.value(), "v42")
+        keys = []
+        while iterator.valid():
+            iterator.next()
+            keys.append(iterator.key())
+        self.assertEqual(keys, ["%03d" % i for i in range(43, 100)])
+        iterator.seek("099")
+        self.assertTrue(not iterator.valid())
+
+    def test_size(self):
+        store = InMemoryStore("test")
+        store.set("key", "value")
+        self.assertEqual(store.get_size(), 4 + 4 + 3 + 4 + 5 + 8)
+        store.set("key", "val")
+        self.assertEqual(store.get_size(), 4 + 4 + 3 + 4 + 3 + 8)
+        store.remove("key")
+        self.assertEqual(store.get_size(), 4 + 4 + 3 + 8)
+        store.remove("key")
+        self.assertEqual(store.get_size(), 4 + 4 + 3 + 8)
+        store.set("key", "value")
+        self.assertEqual(store.get_size(), 4 + 4 + 3 + 4 + 5 + 8)
+
+    def test_size_utf8(self):
+        store = InMemoryStore("test")
+        store.set("kéy", "中文")
+        self.assertEqual(store.get_size(), 4 + 4 + 4 + 4 + 6 + 8)
+        store.remove("é")
+        self.assertEqual(store.get_size(), 4 + 4 + 4 + 4 + 6 + 8 +
+                         4 + 4 + 2 + 8)
+
+    def test_memory_usage(self):
+        store = InMemoryStore("test")
+        self.assertEqual(store.get_memory_usage(), 0)
+        store.set("key", "value")
+        usage = store.get_memory_usage()
+        self.assertTrue(usage > store.get_size())
+        store.set("key", "value" * 100)
+        self.assertTrue(store.get_memory_usage() > usage + 400)
+        store.set("key", "value")
+        self.assertEqual(store.get_memory_usage(), usage)
+        store.clean()
+        self.assertEqual(store.get_memory_usage(), 0)
@@ -0,0 +1,67 @@
+import unittest
+from ..storage.disk.diskstore import DiskStore
+from ..storage.disk.subcompaction import Subcompaction, run_subcompaction
+from ..storage.disk.subcompaction import split_keys
+from .sstable_test import write_v1_sstable
+from struct import pack
+import os
+import tempfile
+
+
+class SubcompactionTest(unittest.TestCase):
+    def test_split_keys_v2(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            disk.set_block_size(256)
+            for i in range(0, 400, 2):
+                disk.set(str(i).zfill(3), "value")
+            disk.flush()
+            for i in range(1, 400, 2):
+                disk.set(str(i).zfill(3), "value")
+            disk.flush()
+            inputs = disk.ss_tables
+            boundaries = sorted(set(inputs[0].reader.last_keys) |
+                                set(inputs[1].reader.last_keys))
+            keys = split_keys(inputs, 4)
+            self.assertEqual(len(keys), 3)
+            self.assertEqual(keys, sorted(keys))
+            self.assertTrue(set(keys) <= set(boundaries))
+            self.assertEqual(split_keys(inputs, 1), [])
+            self.assertEqual(len(split_keys(inputs, 1000)), len(boundaries))
+            disk.close()
+
+    def test_split_keys_v1(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            records = [(str(i).zfill(3), "value") for i in range(100)]
+            ss_table = write_v1_sstable(tempdirname, "v1", records)
+            ss_table.index_table = [[key, pack("i", 0)] for key in
+                                    ("010", "030", "050", "070", "090")]
+            self.assertEqual(split_keys([ss_table], 2), ["050"])
+            self.assertEqual(split_keys([ss_table], 10),
+                             ["010", "030", "050", "070", "090"])
+
+    def test_run_subcompaction(self):
+        with tempfile.TemporaryDirectory() as tempdirname:
+            disk = DiskStore("temp", tempdirname, 10 ** 6)
+            disk.set_auto_compaction(False)
+            for round in range(2):
+                for i in range(100):
+                    disk.set(str(i).zfill(3), "round" + str(round))
+                disk.remove("050")
+                disk.flush()
+            inputs = [(ss_table.id, ss_table.size, [], 0)
+                      for ss_table in reversed(disk.ss_tables)]
+            task = Subcompaction("temp", disk.path, inputs, "040", "060",
+                                 True, [10, 11], 100, 10, 64, 16, 0, 10,
+                                 False, 0)
+            outputs = run_subcompaction(task)
+            self.assertEqual([id for id, _, _, _ in outputs], [10, 11])
+            self.assertEqual(sum(num_keys for _, _, _, num_keys in outputs),
+                             19)
+            self.assertEqual(outputs[0][2][0], "040")
+            self.assertEqual(outputs[-1][2][1], "059")
+            disk.close()
+            for id, _, _, _ in outputs:
+                self.assertTrue(os.path.exists(os.path.join(
+                    disk.path, "sstable", "temp" + str(id) + ".ss")))
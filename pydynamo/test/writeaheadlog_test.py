@@ -0,0 +1,73 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from pydynamo.storage.disk.writeaheadlog import WriteAheadLog
+
+
+class WriteAheadLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tempdir.name, "test0.log")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_replay(self):
+        wal = WriteAheadLog(self.file_path, WriteAheadLog.NONE)
+        self.assertEqual(wal.append("a", "1"), 1)
+        self.assertEqual(wal.append("b", ""), 2)
+        self.assertEqual(wal.append("a", None), 3)
+        self.assertEqual(wal.append("c" * 300, "v" * 300), 4)
+        wal.close()
+        self.assertEqual(list(WriteAheadLog.replay(self.file_path)),
+                         [("a", "1"), ("b", ""), ("a", None),
+                          ("c" * 300, "v" * 300)])
+        self.assertEqual(wal.sync_count, 0)
+
+    def test_replay_stops_at_torn_record(self):
+        wal = WriteAheadLog(self.file_path, WriteAheadLog.ALWAYS)
+        wal.append("a", "1")
+        wal.append("b", "2")
+        wal.close()
+        self.assertEqual(wal.sync_count, 2)
+        size = os.path.getsize(self.file_path)
+        with open(self.file_path, "r+b") as file:
+            file.truncate(size - 1)
+        self.assertEqual(list(WriteAheadLog.replay(self.file_path)),
+                         [("a", "1")])
+        with open(self.file_path, "r+b") as file:
+            file.seek(size - 2)
+            file.write(b"xx")
+        self.assertEqual(list(WriteAheadLog.replay(self.file_path)),
+                         [("a", "1")])
+
+    def test_group_commit(self):
+        wal = WriteAheadLog(self.file_path, WriteAheadLog.GROUP)
+        fsync = wal._fsync
+
+        def slow_fsync():
+            time.sleep(0.005)
+            fsync()
+        wal._fsync = slow_fsync
+        lock = threading.Lock()
+
+        def write(thread):
+            for i in range(20):
+                with lock:
+                    sequence = wal.append(str(thread), str(i))
+                wal.sync(sequence)
+                self.assertTrue(wal.synced >= sequence)
+        threads = [threading.Thread(target=write, args=(thread,))
+                   for thread in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(wal.synced, 160)
+        self.assertTrue(0 < wal.sync_count < 160)
+        wal.close()
+        self.assertEqual(len(list(WriteAheadLog.replay(self.file_path))),
+                         160)